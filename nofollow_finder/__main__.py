@@ -5,11 +5,15 @@
 nofollow_finder {version}
 
 Usage:
-  nofollow_finder -d <domains> [options]
-  nofollow_finder [-i <input_csv>] -d <domains> [-o <out_file> [-a | -f]] \
+  nofollow_finder (-d <domains> | -D <domains_file> | -J <jobs_file>) \
 [options]
+  nofollow_finder [-i <input_csv>] \
+(-d <domains> | -D <domains_file> | -J <jobs_file>) \
+[-o <out_file> [-a | -f]] [options]
   nofollow_finder (-w <engine> [-c <count>])... [-i <input_csv>] \
--d <domains> [-o <out_file> [-a | -f]] [options]
+(-d <domains> | -D <domains_file> | -J <jobs_file>) \
+[-o <out_file> [-a | -f]] [options]
+  nofollow_finder merge [-o <out_file> [-a | -f]] <shard_csv>... [options]
   nofollow_finder test
   nofollow_finder (-v | --version)
   nofollow_finder (-h | --help)
@@ -25,8 +29,29 @@ Options:
                           This option can be specified multiple times.
   -c --count=<count>      How many results to fetch from a search engine.
                           Defaults: Google: {COUNT_GOOGLE}, Bing: {COUNT_BING}
-  -d --domains=<domains>  List of domains, separated by commas. Required.
+  -d --domains=<domains>  List of domains, separated by commas. Required,
+                          unless given with -D.
+  -D --domains-file=<domains_file>
+                          File with one domain per line, for long lists.
+                          Blank lines and lines starting with # are skipped.
+  --shard=<i/N>           Only check the URLs of the input in shard <i> of <N>,
+                          e.g. 2/4, to share the input between N machines.
+                          All the URLs of a host are in the same shard. The
+                          output gets an "input row" column, for merging the
+                          outputs of the shards in input order with
+                          "nofollow_finder merge". Not with -w, -U or --db.
+  -J --jobs=<jobs_file>   Look for several sets of domains at once, every
+                          page is downloaded and parsed only once. One job
+                          per line: the output CSV file, then its domains
+                          separated by commas, or @ and a domains file.
+                          Options -a, -f, -e and -n apply to every output.
   -o --out=<out_file>     Output CSV file. Default: stdout.
+  --db=<db_file>          Write the results to this SQLite database instead
+                          of a CSV file, next to the results of the previous
+                          runs. Not with -o or -J.
+  --stale-days=<days>     Only check the URLs of the input that have not been
+                          checked for all the domains in the last <days> days,
+                          according to the database given with --db.
   -a --append             Append to existing CSV file.
   -f --force              Overwrite existing CSV file.
                           "-a" and "-f" are ignored when file does not exist.
@@ -41,8 +66,87 @@ Options:
                           [default: .nofollowfinderrc,~/.nofollowfinderrc]
   -V --verbosity=<V>      Log verbosity: 0-4 [default: 3]
                           0=silent, 1=error, 2=warning, 3=info, 4=debug
+  --async-log             Format and write log messages in a background
+                          thread, so that logging does not slow down the
+                          download threads.
   -L --nofollow           Do not follow HTTP redirects (301, 302, etc.).
   -t --timeout=<T>        Timeout for HTTP traffic: 1-{m}, 0=none [default: 60]
+  -b --backend=<backend>  HTTP client used for downloads: curl, pool.
+                          "pool" keeps connections open between requests.
+                          Default: DOWNLOADER_BACKEND setting or curl.
+  -C --concurrency=<N>    How many URLs to download at the same time:
+                          1-{max_concurrency} [default: 1]
+  -U --unordered          Write output rows as soon as they are ready
+                          instead of in input order.
+  --host-concurrency=<N>  How many URLs from the same host can be downloaded
+                          at the same time, 0=no limit [default: 2]
+  --host-rate=<R>         Max requests per second to the same host,
+                          0=no limit [default: 0]
+  --robots                Honour Crawl-delay from the robots.txt of each host.
+  --max-body-bytes=<n>    Stop downloading pages larger than this, e.g. 500k
+                          or 20M, and mark them "Too large", 0=no limit
+                          [default: 0]
+  --spill-bytes=<n>       Keep pages larger than this in a temporary file
+                          instead of in memory, 0=never [default: 0]
+  --max-attempts=<n>      How many times to try a URL that fails with a
+                          timeout, a connection error or a 429/5xx status.
+                          Retries wait in the queue, and the number of
+                          attempts is added to the output, when more than 1
+                          [default: 1]
+  --retry-backoff=<s>     Seconds to wait before the first retry, doubled for
+                          every next one, unless the server asks for more
+                          with Retry-After [default: 2]
+  --host-failures=<n>     Consecutive timeouts or connection errors after which
+                          a host is considered down and its other URLs are
+                          marked "Host down" without trying, 0=never
+                          [default: 0]
+  --host-cooldown=<s>     Seconds after which a host that is down is tried
+                          again with a single URL [default: 300]
+  --parser=<engine>       HTML parsing engine: pyquery, fast. "fast" finds the
+                          same links without PyQuery [default: pyquery]
+  --no-prefilter          Parse every page, even if none of the domains
+                          appears anywhere in it.
+  --stream                Parse pages while they are downloaded, without
+                          keeping them in memory. Memory use stays flat
+                          whatever the size of the pages.
+  --parse-workers=<n>     Parse pages in this many separate processes, so that
+                          parsing uses several CPU cores, 0=parse in the
+                          download threads. Not with --stream [default: 0]
+  --parse-threads=<n>     Parse pages in this many threads of their own, fed
+                          by the download threads through a bounded queue,
+                          so that downloads go on while pages are parsed.
+                          0=parse in the download threads. Not with --stream
+                          [default: 0]
+  --parse-memo=<n>        Remember the results of the last <n> pages parsed,
+                          by a hash of their content, and do not parse pages
+                          with the same content again. Not with --stream,
+                          0=off [default: 0]
+  --parse-memo-file=<memo_file>
+                          Also keep these results in this file, for the next
+                          runs. Needs --parse-memo.
+  --existence-only        Stop reading a page once every domain has a followed
+                          link on it. The counts are then "at least" counts.
+                          With --stream, the rest of the page is not even
+                          downloaded.
+  --dedupe                Download and parse every URL once, even if it is
+                          given several times, or found by several searches.
+                          URLs that only differ in the case of the host, a
+                          trailing slash, a #fragment or tracking parameters
+                          such as utm_source count as the same URL.
+  --html-only             Skip pages whose Content-Type is not HTML, checked
+                          before their body is downloaded, and mark them
+                          "Not HTML".
+  --journal=<journal_file>
+                          Record the input rows that are done in this file,
+                          so that an interrupted run can be resumed.
+  --resume                Skip the input rows recorded in the journal and
+                          append to the output. Needs --journal.
+  --cache=<cache_file>    Keep a cache of results in this file and only
+                          re-download pages that have changed since.
+  --cache-max-age=<days>  Drop cache entries not used for this many days
+                          [default: 30]
+  --cache-max-entries=<n>
+                          Max number of entries in the cache [default: 1000000]
   -v --version            Show program name and version.
   -h --help               Show this help text and exit.
 """
@@ -53,24 +157,41 @@ from __future__ import (
     unicode_literals,
 )
 
+import functools
 import logging
 import os
 
 import docopt
 
-from nofollow_finder.downloader import Downloader
+from nofollow_finder.async_log import AsyncHandler
+from nofollow_finder.breaker import CircuitBreaker
+from nofollow_finder.cache import ResponseCache
+from nofollow_finder.dedupe import ResultIndex
+from nofollow_finder.domains import load_domains
+from nofollow_finder.downloader import Downloader, PooledDownloader
 from nofollow_finder.input_csv import InputCSV
+from nofollow_finder.memo import ParseMemo
+from nofollow_finder.jobs import JobsOutput, all_domains, load_jobs
+from nofollow_finder.journal import Journal
 from nofollow_finder.mode_web_search.input_csv import WebSearchInputCSV
 from nofollow_finder.mode_web_search.output_csv import WebSearchOutputCSV
 from nofollow_finder.mode_web_search.processor import WebSearchProcessor
 from nofollow_finder.output_csv import OutputCSV
-from nofollow_finder.parser import Parser
+from nofollow_finder.output_sqlite import OutputSQLite, StaleInput
+from nofollow_finder.parse_pool import ParsePool
+from nofollow_finder.parser import FastParser, Parser
 from nofollow_finder.processor import Processor
+from nofollow_finder.scheduler import HostScheduler, RobotsCache
+from nofollow_finder.shards import ShardInput, merge_shards
+from nofollow_finder.workers import Feed
 from nofollow_finder.settings import settings
 
 _minutes_ = 60
 
 MAX_TIMEOUT = 5 * _minutes_
+MAX_CONCURRENCY = 200
+# links per worker grouped by host ahead of the downloads, when unordered
+HOST_LOOKAHEAD = 100
 DEFAULT_LOFG = 'nofollow_finder.log'
 __version__ = '1.5.0'
 VERSION = tuple(__version__.split('.'))
@@ -78,10 +199,14 @@ DEFAULT_COUNTS = {
     'google': 100,
     'bing': 500,
 }
+BACKENDS = ('curl', 'pool')
+DEFAULT_BACKEND = 'curl'
+PARSER_ENGINES = ('pyquery', 'fast')
 
 __doc__ = __doc__.format(
     version=__version__,
     m=MAX_TIMEOUT,
+    max_concurrency=MAX_CONCURRENCY,
     default_log=DEFAULT_LOFG,
     COUNT_GOOGLE=DEFAULT_COUNTS['google'],
     COUNT_BING=DEFAULT_COUNTS['bing'],
@@ -93,7 +218,7 @@ LOG_FORMAT = (
     '%(levelname)-8s  %(asctime)s  %(process)-5d  %(name)-45s  %(message)s')
 
 
-def _configure_log(log_file, verbosity):
+def _configure_log(log_file, verbosity, async_log=False):
     level = {
         0: logging.CRITICAL,
         1: logging.ERROR,
@@ -101,11 +226,21 @@ def _configure_log(log_file, verbosity):
         3: logging.INFO,
         4: logging.DEBUG,
     }[verbosity]
-    logging.basicConfig(filename=log_file, level=level, format=LOG_FORMAT)
+    root = logging.getLogger()
+    if not async_log or root.handlers:
+        logging.basicConfig(filename=log_file, level=level, format=LOG_FORMAT)
+        return
+    if log_file:
+        handler = logging.FileHandler(log_file)
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root.addHandler(AsyncHandler(handler))
+    root.setLevel(level)
 
 
 def _output_args(args_):
-    append = args_['--append']
+    append = args_['--append'] or args_['--resume']
     force = args_['--force']
     out_file = args_['--out']
     is_stdout = out_file is None
@@ -132,11 +267,174 @@ def validate_redirect(args_):
     return not args_['--nofollow']
 
 
-def validate_domains(args_):
+def validate_domains(args_, jobs=None):
+    if jobs:
+        return all_domains(jobs)
+    if args_['--domains-file']:
+        try:
+            domains = load_domains(args_['--domains-file'])
+        except (IOError, UnicodeDecodeError) as e:
+            raise docopt.DocoptExit('Cannot read domains file: {}'.format(e))
+        if not domains:
+            raise docopt.DocoptExit('No domains in the domains file.')
+        return domains
     domains = filter(None, args_['--domains'].split(','))
     return domains
 
 
+def validate_jobs(args_):
+    if not args_['--jobs']:
+        return None
+    if args_['--out']:
+        raise docopt.DocoptExit(
+            'Output files are given in the jobs file, not with -o.')
+    try:
+        jobs = load_jobs(args_['--jobs'])
+    except (IOError, UnicodeDecodeError, ValueError) as e:
+        raise docopt.DocoptExit('Cannot read jobs file: {}'.format(e))
+    if not jobs:
+        raise docopt.DocoptExit('No jobs in the jobs file.')
+    out_files = [job.out_file for job in jobs]
+    if len(set(out_files)) < len(out_files):
+        raise docopt.DocoptExit('Jobs have to write to different files.')
+    append = args_['--append'] or args_['--resume']
+    force = args_['--force']
+    for job in jobs:
+        exists = os.path.isfile(job.out_file)
+        if exists and not append and not force:
+            raise docopt.DocoptExit(
+                'Output file {} already exists. '
+                'Overwrite: "-f" or append: "-a"'.format(job.out_file))
+        job.header = not (exists and append)
+        if args_['--header']:
+            job.header = True
+        if args_['--noheader']:
+            job.header = False
+    return jobs
+
+
+def validate_db(args_):
+    db_file = args_['--db']
+    if db_file and (args_['--out'] or args_['--jobs']):
+        raise docopt.DocoptExit('Give either --db, -o or -J.')
+    return db_file
+
+
+def validate_stale_days(args_):
+    stale_days = args_['--stale-days']
+    if stale_days is None:
+        return None
+    if not args_['--db']:
+        raise docopt.DocoptExit('Stale days needs --db.')
+    try:
+        stale_days = float(stale_days)
+    except ValueError:
+        raise docopt.DocoptExit('Stale days has to be a number.')
+    if stale_days <= 0:
+        raise docopt.DocoptExit('Stale days has to be greater than 0.')
+    return stale_days
+
+
+def validate_shard(args_):
+    shard = args_['--shard']
+    if shard is None:
+        return None
+    try:
+        index, count = [int(part) for part in shard.split('/')]
+    except ValueError:
+        raise docopt.DocoptExit('Shard has to be given as i/N, e.g. 2/4.')
+    if not 1 <= index <= count:
+        raise docopt.DocoptExit('Shard has to be between 1/N and N/N.')
+    if args_['--web'] or args_['--db']:
+        raise docopt.DocoptExit('Shard cannot be used with -w or --db.')
+    if args_['--unordered']:
+        # merging needs the rows of every shard in input order
+        raise docopt.DocoptExit('Shard cannot be used with -U.')
+    return index - 1, count
+
+
+def validate_backend(args_):
+    backend = args_['--backend']
+    if backend is None:
+        return backend
+    backend = backend.lower()
+    if backend not in BACKENDS:
+        raise docopt.DocoptExit(
+            'Backend not one of: {}'.format(', '.join(BACKENDS)))
+    return backend
+
+
+def validate_parser_engine(args_):
+    engine = args_['--parser'].lower()
+    if engine not in PARSER_ENGINES:
+        raise docopt.DocoptExit(
+            'Parser not one of: {}'.format(', '.join(PARSER_ENGINES)))
+    return engine
+
+
+def validate_prefilter(args_):
+    return not args_['--no-prefilter']
+
+
+def validate_stream(args_):
+    return args_['--stream']
+
+
+def validate_parse_workers(args_):
+    try:
+        workers = int(args_['--parse-workers'])
+    except ValueError:
+        raise docopt.DocoptExit('Parse workers has to be a number.')
+    if workers < 0:
+        raise docopt.DocoptExit('Parse workers cannot be negative.')
+    if workers and args_['--stream']:
+        raise docopt.DocoptExit(
+            'Parse workers cannot be used with --stream.')
+    return workers
+
+
+def validate_parse_memo(args_):
+    try:
+        max_entries = int(args_['--parse-memo'])
+    except ValueError:
+        raise docopt.DocoptExit('Parse memo has to be a number.')
+    if max_entries < 0:
+        raise docopt.DocoptExit('Parse memo cannot be negative.')
+    if max_entries and args_['--stream']:
+        raise docopt.DocoptExit('Parse memo cannot be used with --stream.')
+    if args_['--parse-memo-file'] and not max_entries:
+        raise docopt.DocoptExit('Parse memo file needs --parse-memo.')
+    if not max_entries:
+        return None
+    return {
+        'max_entries': max_entries,
+        'path': args_['--parse-memo-file'],
+    }
+
+
+def validate_parse_threads(args_):
+    try:
+        threads = int(args_['--parse-threads'])
+    except ValueError:
+        raise docopt.DocoptExit('Parse threads has to be a number.')
+    if not 0 <= threads <= MAX_CONCURRENCY:
+        raise docopt.DocoptExit(
+            'Parse threads has to be between 0 and {}.'.format(
+                MAX_CONCURRENCY))
+    if threads and args_['--stream']:
+        raise docopt.DocoptExit(
+            'Parse threads cannot be used with --stream.')
+    return threads
+
+
+def validate_existence_only(args_):
+    return args_['--existence-only']
+
+
+def validate_async_log(args_):
+    return args_['--async-log']
+
+
 def validate_log_file(args_):
     return args_['--log']
 
@@ -155,6 +453,160 @@ def validate_timeout(args_):
     return timeout
 
 
+def validate_concurrency(args_):
+    concurrency = args_['--concurrency']
+    try:
+        concurrency = int(concurrency)
+    except ValueError:
+        raise docopt.DocoptExit('Concurrency has to be a number.')
+    if not 1 <= concurrency <= MAX_CONCURRENCY:
+        raise docopt.DocoptExit(
+            'Concurrency has to be between 1 and {}.'.format(MAX_CONCURRENCY))
+    return concurrency
+
+
+def validate_host_concurrency(args_):
+    host_concurrency = args_['--host-concurrency']
+    try:
+        host_concurrency = int(host_concurrency)
+    except ValueError:
+        raise docopt.DocoptExit('Host concurrency has to be a number.')
+    if host_concurrency < 0:
+        raise docopt.DocoptExit('Host concurrency has to be 0 or greater.')
+    return host_concurrency
+
+
+def validate_host_rate(args_):
+    host_rate = args_['--host-rate']
+    try:
+        host_rate = float(host_rate)
+    except ValueError:
+        raise docopt.DocoptExit('Host rate has to be a number.')
+    if host_rate < 0:
+        raise docopt.DocoptExit('Host rate has to be 0 or greater.')
+    return host_rate
+
+
+def validate_robots(args_):
+    return args_['--robots']
+
+
+def validate_max_attempts(args_):
+    max_attempts = args_['--max-attempts']
+    try:
+        max_attempts = int(max_attempts)
+    except ValueError:
+        raise docopt.DocoptExit('Max attempts has to be a number.')
+    if max_attempts < 1:
+        raise docopt.DocoptExit('Max attempts has to be 1 or greater.')
+    return max_attempts
+
+
+def validate_retry_backoff(args_):
+    retry_backoff = args_['--retry-backoff']
+    try:
+        retry_backoff = float(retry_backoff)
+    except ValueError:
+        raise docopt.DocoptExit('Retry backoff has to be a number.')
+    if retry_backoff < 0:
+        raise docopt.DocoptExit('Retry backoff has to be 0 or greater.')
+    return retry_backoff
+
+
+def validate_host_failures(args_):
+    host_failures = args_['--host-failures']
+    try:
+        host_failures = int(host_failures)
+    except ValueError:
+        raise docopt.DocoptExit('Host failures has to be a number.')
+    if host_failures < 0:
+        raise docopt.DocoptExit('Host failures has to be 0 or greater.')
+    return host_failures
+
+
+def validate_host_cooldown(args_):
+    host_cooldown = args_['--host-cooldown']
+    try:
+        host_cooldown = float(host_cooldown)
+    except ValueError:
+        raise docopt.DocoptExit('Host cooldown has to be a number.')
+    if host_cooldown < 0:
+        raise docopt.DocoptExit('Host cooldown has to be 0 or greater.')
+    return host_cooldown
+
+
+def validate_journal(args_):
+    return args_['--journal']
+
+
+def validate_resume(args_):
+    if not args_['--resume']:
+        return False
+    if not args_['--journal']:
+        raise docopt.DocoptExit('Resume needs --journal.')
+    if not (args_['--out'] or args_['--jobs'] or args_['--db']):
+        raise docopt.DocoptExit(
+            'Resume needs an output file or database, not stdout.')
+    return True
+
+
+def validate_dedupe(args_):
+    return args_['--dedupe']
+
+
+def validate_html_only(args_):
+    return args_['--html-only']
+
+
+def validate_cache(args_):
+    cache_file = args_['--cache']
+    if cache_file is None:
+        return None
+    try:
+        max_age = int(args_['--cache-max-age'])
+        max_entries = int(args_['--cache-max-entries'])
+    except ValueError:
+        raise docopt.DocoptExit(
+            'Cache max age and max entries have to be numbers.')
+    if max_age < 1 or max_entries < 1:
+        raise docopt.DocoptExit(
+            'Cache max age and max entries have to be 1 or greater.')
+    return {
+        'path': cache_file,
+        'max_age': max_age,
+        'max_entries': max_entries,
+    }
+
+
+def _parse_size(value, option):
+    multipliers = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    value = value.strip().lower()
+    multiplier = multipliers.get(value[-1:], 1)
+    if multiplier > 1:
+        value = value[:-1]
+    try:
+        size = int(value) * multiplier
+    except ValueError:
+        raise docopt.DocoptExit(
+            '{} has to be a number, optionally followed by k, M or G.'.format(
+                option))
+    if size < 0:
+        raise docopt.DocoptExit('{} has to be 0 or greater.'.format(option))
+    return size
+
+
+def validate_max_body_size(args_):
+    return _parse_size(args_['--max-body-bytes'], 'Max body bytes')
+
+
+def validate_spill_size(args_):
+    return _parse_size(args_['--spill-bytes'], 'Spill bytes')
+
+
+def validate_ordered(args_):
+    return not args_['--unordered']
+
+
 def validate_overwrite(args_):
     exists, is_stdout, append, force = _output_args(args_)
     if exists and not append and not force:
@@ -227,9 +679,44 @@ def validate_kwargs(args_):
     return {}
 
 
+def get_downloader_class(backend):
+    return {
+        'curl': Downloader,
+        'pool': PooledDownloader,
+    }[backend]
+
+
+def get_parser_class(engine):
+    return {
+        'pyquery': Parser,
+        'fast': FastParser,
+    }[engine]
+
+
+def get_feed_factory(downloader, concurrency, host_concurrency, host_rate,
+                     robots, ordered=True):
+    if concurrency < 2 and not host_rate and not robots:
+        return Feed
+    return functools.partial(
+        HostScheduler,
+        host_concurrency=host_concurrency,
+        host_rate=host_rate,
+        robots=RobotsCache(downloader) if robots else None,
+        lookahead=0 if ordered else concurrency * HOST_LOOKAHEAD,
+    )
+
+
 def main(in_file, domains, log_file, out_file, overwrite, header, verbosity,
-         redirect, timeout, settings_file, modes, **kwargs):
-    _configure_log(log_file, verbosity)
+         redirect, timeout, settings_file, modes, backend=None,
+         concurrency=1, ordered=True, host_concurrency=2, host_rate=0,
+         robots=False, cache=None, max_body_size=0, spill_size=0,
+         html_only=False, max_attempts=1, retry_backoff=2, host_failures=0,
+         host_cooldown=300, parser_engine='pyquery', prefilter=True,
+         stream=False, parse_workers=0, existence_only=False,
+         async_log=False, jobs=None, parse_memo=None, journal=None,
+         resume=False, dedupe=False, db_file=None, stale_days=None,
+         shard=None, parse_threads=0, **kwargs):
+    _configure_log(log_file, verbosity, async_log)
     log.debug('start')
     if verbosity == 4:
         log.debug("Sample debug message")
@@ -239,23 +726,107 @@ def main(in_file, domains, log_file, out_file, overwrite, header, verbosity,
         log.critical("Sample critical message")
     settings.load(settings_file)
 
-    downloader = Downloader(follow_redirects=redirect, timeout=timeout)
-    parser = Parser(domains)
+    backend = (backend or settings.DOWNLOADER_BACKEND or DEFAULT_BACKEND)
+    if backend.lower() not in BACKENDS:
+        log.error('Unknown DOWNLOADER_BACKEND setting: %s', backend)
+        return
+    backend = backend.lower()
+    downloader_kwargs = {'follow_redirects': redirect, 'timeout': timeout}
+    if max_body_size:
+        downloader_kwargs['max_body_size'] = max_body_size
+    if spill_size:
+        downloader_kwargs['spill_size'] = spill_size
+    if html_only:
+        downloader_kwargs['html_only'] = html_only
+    if host_failures:
+        downloader_kwargs['breaker'] = CircuitBreaker(
+            host_failures, host_cooldown)
+    if backend == 'pool':
+        downloader_kwargs['pool_size'] = concurrency
+    downloader = get_downloader_class(backend)(**downloader_kwargs)
+    feed_factory = get_feed_factory(
+        downloader, concurrency, host_concurrency, host_rate, robots,
+        ordered)
+    response_cache = ResponseCache(**cache) if cache else None
+    parser_kwargs = {} if prefilter else {'prefilter': False}
+    if jobs:
+        parser_kwargs['match_all'] = True
+    parser = get_parser_class(parser_engine)(domains, **parser_kwargs)
+    parse_pool = (
+        ParsePool(parser, parse_workers, timeout) if parse_workers else None)
+    if journal:
+        # rows written to the database are only safe once committed
+        journal = Journal(journal, resume=resume, deferred=bool(db_file))
+    result_index = ResultIndex() if dedupe else None
+    if parse_memo:
+        parse_memo = ParseMemo(
+            parser, existence_only=existence_only, **parse_memo)
+    output_class = WebSearchOutputCSV if modes else OutputCSV
+    if db_file:
+        output_csv = OutputSQLite(db_file, domains, in_file)
+    elif jobs:
+        output_csv = JobsOutput([
+            output_class(job.out_file, job.domains, overwrite, job.header,
+                         attempts=max_attempts > 1, rows=shard is not None)
+            for job in jobs
+        ])
+    else:
+        output_csv = output_class(
+            out_file, domains, overwrite, header, attempts=max_attempts > 1,
+            rows=shard is not None)
+    columns = (output_csv.domains, output_csv.positions) if jobs else None
     if modes:
         counts = kwargs['count']
     if modes:
         input_csv = WebSearchInputCSV(in_file, modes, counts)
-        output_csv = WebSearchOutputCSV(out_file, domains, overwrite, header)
-        processor = WebSearchProcessor(
-            input_csv, downloader, parser, output_csv)
     else:
         input_csv = InputCSV(in_file)
-        output_csv = OutputCSV(out_file, domains, overwrite, header)
-        processor = Processor(input_csv, downloader, parser, output_csv)
+    if shard:
+        input_csv = ShardInput(input_csv, *shard)
+    if stale_days:
+        input_csv = StaleInput(input_csv, output_csv, stale_days)
+    if modes:
+        processor = WebSearchProcessor(
+            input_csv, downloader, parser, output_csv,
+            concurrency=concurrency, ordered=ordered,
+            feed_factory=feed_factory, cache=response_cache,
+            max_attempts=max_attempts, retry_backoff=retry_backoff,
+            stream=stream, parse_pool=parse_pool,
+            existence_only=existence_only, parse_memo=parse_memo,
+            journal=journal, result_index=result_index,
+            parse_threads=parse_threads, columns=columns)
+    else:
+        processor = Processor(
+            input_csv, downloader, parser, output_csv,
+            concurrency=concurrency, ordered=ordered,
+            feed_factory=feed_factory, cache=response_cache,
+            max_attempts=max_attempts, retry_backoff=retry_backoff,
+            stream=stream, parse_pool=parse_pool,
+            existence_only=existence_only, parse_memo=parse_memo,
+            journal=journal, result_index=result_index,
+            parse_threads=parse_threads, columns=columns)
     processor.process()
     log.debug('done')
 
 
+def validate_shard_files(args_):
+    paths = args_['<shard_csv>']
+    for path in paths:
+        if not os.path.isfile(path):
+            raise docopt.DocoptExit('File {} does not exist.'.format(path))
+    return paths
+
+
+def merge(paths, log_file, out_file, overwrite, header, verbosity):
+    _configure_log(log_file, verbosity)
+    try:
+        merge_shards(paths, out_file, overwrite, header)
+    except (IOError, ValueError) as e:
+        log.error('cannot merge: %s', e)
+        # an exit status for scripts that merge the shards
+        raise SystemExit(1)
+
+
 def run_from_cli():
     args = docopt.docopt(__doc__, version=__doc__.strip().splitlines()[0])
     if args['test']:  # pragma no cover
@@ -264,9 +835,19 @@ def run_from_cli():
         suite = unittest.TestLoader().discover(path)
         runner = unittest.TextTestRunner()
         return runner.run(suite)
+    if args['merge']:
+        return merge(
+            validate_shard_files(args),
+            validate_log_file(args),
+            validate_output(args),
+            validate_overwrite(args),
+            validate_header(args),
+            validate_verbosity(args),
+        )
+    jobs = validate_jobs(args)
     arguments_ = docopt.Dict({
         'in_file': validate_input(args),
-        'domains': validate_domains(args),
+        'domains': validate_domains(args, jobs),
         'log_file': validate_log_file(args),
         'out_file': validate_output(args),
         'overwrite': validate_overwrite(args),
@@ -276,6 +857,35 @@ def run_from_cli():
         'header': validate_header(args),
         'settings_file': validate_settings(args),
         'modes': validate_modes(args),
+        'backend': validate_backend(args),
+        'concurrency': validate_concurrency(args),
+        'ordered': validate_ordered(args),
+        'host_concurrency': validate_host_concurrency(args),
+        'host_rate': validate_host_rate(args),
+        'robots': validate_robots(args),
+        'cache': validate_cache(args),
+        'max_body_size': validate_max_body_size(args),
+        'spill_size': validate_spill_size(args),
+        'html_only': validate_html_only(args),
+        'max_attempts': validate_max_attempts(args),
+        'retry_backoff': validate_retry_backoff(args),
+        'host_failures': validate_host_failures(args),
+        'host_cooldown': validate_host_cooldown(args),
+        'parser_engine': validate_parser_engine(args),
+        'prefilter': validate_prefilter(args),
+        'stream': validate_stream(args),
+        'parse_workers': validate_parse_workers(args),
+        'existence_only': validate_existence_only(args),
+        'async_log': validate_async_log(args),
+        'jobs': jobs,
+        'parse_memo': validate_parse_memo(args),
+        'journal': validate_journal(args),
+        'resume': validate_resume(args),
+        'dedupe': validate_dedupe(args),
+        'db_file': validate_db(args),
+        'stale_days': validate_stale_days(args),
+        'shard': validate_shard(args),
+        'parse_threads': validate_parse_threads(args),
     })
     arguments_.update(**validate_kwargs(args))
     main(**arguments_)
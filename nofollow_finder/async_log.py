@@ -0,0 +1,83 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import logging
+import os
+import sys
+import threading
+
+if sys.version_info[0] < 3:
+    import Queue as queue
+else:
+    import queue
+
+
+class AsyncHandler(logging.Handler):
+    """
+    Logging handler that hands records over to `handler` through a queue,
+    so that they are formatted and written in a background thread instead
+    of in the threads that log them.
+
+    At most `max_queued` records wait in the queue, logging blocks when it
+    is full. `close()` writes out what is still queued. In a forked
+    process, such as a parse worker, records go straight to `handler`.
+    """
+
+    def __init__(self, handler, max_queued=10000):
+        logging.Handler.__init__(self)
+        self.handler = handler
+        self.queue = queue.Queue(max_queued)
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='log writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def handle(self, record):
+        # no handler lock, the queue is thread-safe already
+        accepted = self.filter(record)
+        if accepted:
+            self.emit(record)
+        return accepted
+
+    def emit(self, record):
+        if os.getpid() != self._pid:
+            self._after_fork()
+        if self._thread is None:
+            self._handle(record)
+        else:
+            self.queue.put(record)
+
+    def close(self):
+        if self._thread is not None and os.getpid() == self._pid:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self.handler.close()
+        logging.Handler.close(self)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            try:
+                self._handle(record)
+            except Exception:  # pragma no cover
+                self.handleError(record)
+
+    def _handle(self, record):
+        # like Logger.callHandlers
+        if record.levelno >= self.handler.level:
+            self.handler.handle(record)
+
+    def _after_fork(self):
+        # the writer thread is not copied, and the lock of `handler` may
+        # have been copied while taken
+        self._pid = os.getpid()
+        self._thread = None
+        self.handler.createLock()
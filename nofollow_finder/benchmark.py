@@ -0,0 +1,130 @@
+# coding=utf-8
+"""
+Parser benchmark: pages per second of every HTML parsing engine, on a fixed
+synthetic corpus, so that runs can be compared with each other.
+Run it with `python -m nofollow_finder.benchmark`.
+
+Usage:
+  benchmark [options]
+
+Options:
+  -p --pages=<n>          Pages in the corpus [default: 200]
+  -l --links=<n>          Links on every page [default: 200]
+  -r --repeat=<n>         Runs over the corpus for every engine, the best one
+                          is reported [default: 3]
+  -e --engines=<engines>  Engines to compare, separated by commas
+                          [default: pyquery,fast]
+  -m --misses=<share>     Share of the pages that link to none of the
+                          domains, between 0 and 1 [default: 0]
+  --no-prefilter          Parse every page, even without any of the domains.
+  -h --help               Show this help text and exit.
+"""
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import random
+import time
+
+import docopt
+
+from nofollow_finder.__main__ import PARSER_ENGINES, get_parser_class
+
+
+DOMAINS = ['twitter.com', 'facebook.com', 'linkedin.com']
+HOSTS = DOMAINS + [
+    'www.twitter.com', 'm.facebook.com', 'a.b.c.twitter.com',
+    'example.com', 'twitter.com.example.org', 'en.wikipedia.org',
+]
+OTHER_HOSTS = ['example.com', 'en.wikipedia.org', 'www.python.org']
+WORDS = 'lorem ipsum dolor sit amet consectetur adipiscing elit sed do'.split()
+
+
+def make_page(rnd, links, hosts=HOSTS):
+    parts = ['<!DOCTYPE html><html><head><meta charset="utf-8">'
+             '<title>Benchmark</title></head><body>']
+    for i in range(links):
+        parts.append('<p>{}</p>'.format(' '.join(rnd.sample(WORDS, 6))))
+        if rnd.random() < 0.3:
+            href = '/page/{}'.format(i)
+        else:
+            href = '{}//{}/{}'.format(
+                rnd.choice(['http:', 'https:', '']), rnd.choice(hosts), i)
+        rel = rnd.choice(['', ' rel="nofollow"', ' rel="noopener"'])
+        parts.append('<a href="{}"{}>{}</a>'.format(
+            href, rel, rnd.choice(WORDS)))
+    parts.append('</body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+def make_corpus(pages, links, misses=0, seed=0):
+    rnd = random.Random(seed)
+    return [
+        make_page(rnd, links, OTHER_HOSTS if rnd.random() < misses else HOSTS)
+        for _ in range(pages)
+    ]
+
+
+def results(parser, page):
+    try:
+        return [
+            (domain, nofollow)
+            for _, domain, nofollow in parser.find_a_nodes(page, 'utf-8')
+        ]
+    except parser.ZeroANodes:
+        return []
+
+
+def run(engine, corpus, repeat, prefilter=True):
+    """Best time of `repeat` runs over `corpus`, and the results."""
+    parser = get_parser_class(engine)(DOMAINS, prefilter=prefilter)
+    best = None
+    found = None
+    for _ in range(repeat):
+        start = time.time()
+        found = [results(parser, page) for page in corpus]
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, found
+
+
+def main(pages, links, repeat, engines, misses=0, prefilter=True):
+    corpus = make_corpus(pages, links, misses)
+    size = sum(len(page) for page in corpus)
+    print('{} pages, {} links each, {:.1f} MB'.format(
+        pages, links, size / 1024 / 1024))
+    reference = None
+    for engine in engines:
+        elapsed, found = run(engine, corpus, repeat, prefilter)
+        if reference is None:
+            reference = found
+        same = 'same results' if found == reference else 'DIFFERENT RESULTS'
+        print('{:<10} {:>8.1f} pages/s {:>8.2f} ms/page  {}'.format(
+            engine, pages / elapsed, elapsed / pages * 1000, same))
+
+
+def run_from_cli():
+    args = docopt.docopt(__doc__)
+    engines = [engine.strip().lower() for engine in
+               args['--engines'].split(',')]
+    unknown = set(engines) - set(PARSER_ENGINES)
+    if unknown:
+        raise docopt.DocoptExit(
+            'Unknown engines: {}'.format(', '.join(sorted(unknown))))
+    try:
+        pages, links, repeat = [
+            int(args[option]) for option in ('--pages', '--links', '--repeat')
+        ]
+        misses = float(args['--misses'])
+    except ValueError:
+        raise docopt.DocoptExit(
+            'Pages, links, repeat and misses have to be numbers.')
+    main(pages, links, max(repeat, 1), engines, misses,
+         not args['--no-prefilter'])
+
+
+if __name__ == '__main__':  # pragma no cover
+    run_from_cli()
@@ -0,0 +1,74 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import logging
+import mmap
+import tempfile
+
+
+log = logging.getLogger(__name__)
+
+
+class BodyTooLarge(Exception):
+    """Response body is over the size limit"""
+
+
+class BodyBuffer(object):
+    """
+    Collects a response body chunk by chunk.
+
+    Writing more than `max_size` bytes raises BodyTooLarge, so a download
+    can be stopped as soon as it goes over the limit. Once more than
+    `spill_size` bytes are written, the body is moved to a temporary file
+    and `getvalue()` returns it memory-mapped instead of as bytes.
+    """
+    # True once a sink has raised StopIteration from `write` because it
+    # needs no more of the body, see LinkStream
+    complete = False
+
+    def __init__(self, max_size=None, spill_size=None):
+        self.max_size = max_size
+        self.spill_size = spill_size
+        self.size = 0
+        self._chunks = []
+        self._file = None
+
+    def start(self, charset):
+        """Called with the declared charset, if known before the body."""
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_size and self.size > self.max_size:
+            raise BodyTooLarge(self.size)
+        if self._file is not None:
+            self._file.write(chunk)
+            return
+        self._chunks.append(chunk)
+        if self.spill_size and self.size > self.spill_size:
+            self._spill()
+
+    def getvalue(self):
+        """The body as bytes, or as a read-only mmap if it was spilled."""
+        if self._file is None:
+            return b''.join(self._chunks)
+        self._file.flush()
+        body = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.close()  # the mmap keeps the data around
+        return body
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _spill(self):
+        log.debug('spilling body of %d bytes to disk', self.size)
+        self._file = tempfile.TemporaryFile(prefix='nofollow_finder_')
+        for chunk in self._chunks:
+            self._file.write(chunk)
+        self._chunks = []
@@ -0,0 +1,87 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import logging
+import sys
+import threading
+import time
+
+if sys.version_info[0] < 3:
+    from urlparse import urlparse
+else:
+    from urllib.parse import urlparse
+
+from nofollow_finder.stats import stats
+
+
+log = logging.getLogger(__name__)
+
+
+def _server_of(url):
+    # unlike politeness, which is per machine, being down is per port
+    return urlparse(url).netloc.lower()
+
+
+class _Circuit(object):
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+
+class CircuitBreaker(object):
+    """
+    Stops downloading from hosts (host and port) that look down.
+
+    After `threshold` consecutive connection failures or timeouts on a
+    host, its circuit opens and `allow()` turns down its URLs straight
+    away. Once `cooldown` seconds have passed, a single URL is let through
+    as a probe: if the host answers, the circuit closes again, otherwise
+    it stays open for another `cooldown`.
+    """
+
+    def __init__(self, threshold=5, cooldown=300):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def allow(self, url):
+        """False if `url` should not be downloaded because its host is down."""
+        with self._lock:
+            circuit = self._circuits.get(_server_of(url))
+            if circuit is None or circuit.opened_at is None:
+                return True
+            if not circuit.probing and (
+                    time.time() - circuit.opened_at >= self.cooldown):
+                log.info('probing %s', _server_of(url))
+                circuit.probing = True
+                return True
+        stats.inc('host down skips')
+        return False
+
+    def record(self, url, failed):
+        """Outcome of a download that `allow()` let through."""
+        host = _server_of(url)
+        with self._lock:
+            circuit = self._circuits.setdefault(host, _Circuit())
+            circuit.probing = False
+            if not failed:
+                if circuit.opened_at is not None:
+                    log.info('host %s is back up', host)
+                circuit.failures = 0
+                circuit.opened_at = None
+                return
+            circuit.failures += 1
+            if circuit.opened_at is not None or (
+                    circuit.failures >= self.threshold):
+                if circuit.opened_at is None:
+                    log.warning(
+                        'host %s looks down after %d failures, skipping its '
+                        'URLs for %ss', host, circuit.failures, self.cooldown)
+                circuit.opened_at = time.time()
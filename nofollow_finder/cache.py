@@ -0,0 +1,143 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from nofollow_finder.stats import stats
+
+
+log = logging.getLogger(__name__)
+
+_days_ = 24 * 60 * 60
+
+
+class CacheEntry(object):
+    def __init__(self, url, etag, last_modified, status_code, results):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.status_code = status_code
+        self.results = results
+
+    def covers(self, domains):
+        return all(domain in self.results for domain in domains)
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache(object):
+    """
+    On-disk cache of response validators and results, keyed by URL.
+
+    Entries are stored for responses with an ETag or Last-Modified header,
+    so that the next run can make a conditional request and reuse the
+    stored result when the server says "304 Not Modified".
+
+    Entries older than `max_age` days are dropped, as are the least
+    recently used entries over `max_entries`.
+    """
+    commit_every = 100
+
+    def __init__(self, path, max_age=30, max_entries=1000000):
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._db = None
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+
+    def open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                status_code INTEGER,
+                results TEXT,
+                used_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS responses_used_at
+                ON responses (used_at);
+        ''')
+        self.evict()
+
+    def close(self):
+        if self._db is None:
+            return
+        self.evict()
+        self._db.close()
+        self._db = None
+        log.info('cache hit rate: %.1f%% (%d of %d)',
+                 stats.rate('cache hits', 'cache lookups'),
+                 stats['cache hits'], stats['cache lookups'])
+
+    def evict(self):
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM responses WHERE used_at < ?',
+                (time.time() - self.max_age * _days_,))
+            self._db.execute(
+                'DELETE FROM responses WHERE url IN ('
+                '  SELECT url FROM responses ORDER BY used_at DESC'
+                '  LIMIT -1 OFFSET ?)',
+                (self.max_entries,))
+            self._db.commit()
+            self._uncommitted = 0
+
+    def lookup(self, url, domains):
+        """Entry for `url` with results for all `domains`, or None."""
+        stats.inc('cache lookups')
+        with self._lock:
+            row = self._db.execute(
+                'SELECT etag, last_modified, status_code, results '
+                'FROM responses WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(url, row[0], row[1], row[2], json.loads(row[3]))
+        if not entry.covers(domains):
+            return None
+        return entry
+
+    def hit(self, entry):
+        """Mark `entry` as reused."""
+        stats.inc('cache hits')
+        with self._lock:
+            self._db.execute(
+                'UPDATE responses SET used_at = ? WHERE url = ?',
+                (time.time(), entry.url))
+            self._maybe_commit()
+
+    def store(self, url, response, results):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (url, etag, last_modified, response.status_code,
+                 json.dumps(results), time.time()))
+            self._maybe_commit()
+
+    def _maybe_commit(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self._db.commit()
+            self._uncommitted = 0
@@ -26,11 +26,28 @@ class Timeout(Exception):
 
 
 class Command(object):
-    def __init__(self, cmd):
+    chunk_size = 64 * 1024
+
+    def __init__(self, cmd, err_sink=None):
+        """
+        `err_sink`, if given, receives stderr of the command chunk by chunk
+        through its `write` method, instead of stderr being collected in
+        memory. If `write` raises, the command is terminated and the
+        exception is raised from `run`, except for StopIteration, which
+        means that the sink needs no more: `run` then returns what the
+        command has output so far. `write` is called from the thread that
+        calls `run`.
+        """
         self.cmd = cmd
+        self.err_sink = err_sink
         self.process = None
+        self.error = None
+        self.timed_out = False
 
     def run(self, timeout):
+        if self.err_sink is not None:
+            return self._run_streaming(timeout)
+
         def target(pipeline):
             log.debug('Thread started')
             log.debug('cmd: %s', self.cmd)
@@ -59,6 +76,65 @@ class Command(object):
             results = (1, '', '')
         return results  # (returncode, out, err)
 
+    def _run_streaming(self, timeout):
+        # No thread for the command itself: the sink may hold objects that
+        # must not change threads, such as an lxml parser. A timer kills
+        # the command instead.
+        log.debug('cmd: %s', self.cmd)
+        self.process = subprocess.Popen(
+            self.cmd,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        log.debug('child pid: %d', self.process.pid)
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, self._time_out)
+            timer.start()
+        try:
+            out = self._stream_err()
+        finally:
+            if timer is not None:
+                timer.cancel()
+                timer.join()
+        if self.timed_out:
+            raise Timeout()
+        if self.error is not None:
+            raise self.error
+        return [self.process.returncode, out, b'']
+
+    def _time_out(self):
+        log.debug('Terminating process')
+        self.timed_out = True
+        try:
+            self.process.terminate()
+        except OSError:  # it has just finished
+            pass
+
+    def _stream_err(self):
+        out = []
+        reader = threading.Thread(
+            target=lambda: out.append(self.process.stdout.read()))
+        reader.start()
+        try:
+            while True:
+                chunk = self.process.stderr.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.err_sink.write(chunk)
+        except StopIteration:
+            log.debug('Terminating process, sink is complete')
+            self.process.terminate()
+        except Exception as e:
+            log.debug('Terminating process, error from sink: %r', e)
+            self.error = e
+            self.process.terminate()
+        self.process.stderr.close()
+        reader.join()
+        self.process.wait()
+        return out[0] if out else b''
+
 
-def run(cmd, timeout=None):
-    return Command(cmd).run(timeout=timeout)
+def run(cmd, timeout=None, err_sink=None):
+    return Command(cmd, err_sink).run(timeout=timeout)
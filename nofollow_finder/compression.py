@@ -0,0 +1,87 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional: pip install nofollow_finder[brotli]
+    brotli = None
+
+
+ACCEPT_ENCODING = 'gzip, deflate, br' if brotli else 'gzip, deflate'
+
+
+class DecodeError(Exception):
+    """Response body cannot be decompressed"""
+
+
+class _ZlibDecoder(object):
+    def __init__(self, wbits):
+        self._obj = zlib.decompressobj(wbits)
+
+    def decompress(self, data):
+        try:
+            return self._obj.decompress(data)
+        except zlib.error as e:
+            raise DecodeError(e)
+
+    def flush(self):
+        return self._obj.flush()
+
+
+class _DeflateDecoder(_ZlibDecoder):
+    """
+    "deflate" should be zlib-wrapped, but some servers send raw deflate
+    data, so try that when the first chunk does not decode.
+    """
+
+    def __init__(self):
+        super(_DeflateDecoder, self).__init__(zlib.MAX_WBITS)
+        self._first = True
+
+    def decompress(self, data):
+        if not self._first:
+            return super(_DeflateDecoder, self).decompress(data)
+        self._first = False
+        try:
+            return super(_DeflateDecoder, self).decompress(data)
+        except DecodeError:
+            self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            return super(_DeflateDecoder, self).decompress(data)
+
+
+class _BrotliDecoder(object):
+    def __init__(self):
+        self._obj = brotli.Decompressor()
+
+    def decompress(self, data):
+        try:
+            return self._obj.process(data)
+        except brotli.error as e:
+            raise DecodeError(e)
+
+    def flush(self):
+        return b''
+
+
+def make_decoder(content_encoding):
+    """
+    Streaming decoder for a Content-Encoding header value, with
+    `decompress(chunk)` and `flush()` methods. None for identity.
+    """
+    encoding = (content_encoding or '').strip().lower()
+    if encoding in ('', 'identity'):
+        return None
+    if encoding in ('gzip', 'x-gzip'):
+        return _ZlibDecoder(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return _DeflateDecoder()
+    if encoding == 'br' and brotli is not None:
+        return _BrotliDecoder()
+    raise DecodeError('unsupported Content-Encoding: {}'.format(encoding))
@@ -0,0 +1,106 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import logging
+import re
+import sys
+import threading
+
+if sys.version_info[0] < 3:
+    from urlparse import urlsplit, urlunsplit
+else:
+    from urllib.parse import urlsplit, urlunsplit
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# query parameters that only track where a visitor comes from
+TRACKING_PARAMS = re.compile(
+    r'^(utm_[a-z]+|gclid|dclid|fbclid|msclkid|mc_cid|mc_eid|_ga|yclid)$',
+    re.I)
+
+
+def canonical_url(url):
+    """
+    URL with the parts that do not change the page dropped or normalised:
+    case of the scheme and host, default port, trailing slash of the path,
+    #fragment and tracking parameters. Other parameters keep their order.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    if parts.username or parts.password:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').rstrip('.')
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = '{}:{}'.format(netloc, port)
+    path = parts.path.rstrip('/') or '/'
+    # parameters are filtered as they are, not decoded and encoded again
+    query = '&'.join(
+        param for param in parts.query.split('&')
+        if param and not TRACKING_PARAMS.match(param.split('=', 1)[0]))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+class ResultIndex(object):
+    """
+    Results of the URLs processed in this run, by canonical URL, so that
+    a URL given several times is downloaded and parsed once.
+
+    Statuses and counts are kept sparse, only for the domains found, as
+    there can be one entry for every URL of the input.
+    """
+    # returned by claim() while another thread is processing the URL
+    PENDING = object()
+
+    def __init__(self):
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        """
+        Result stored for `key`, PENDING, or None if the caller has to
+        process it, and then call store() or release().
+        """
+        with self._lock:
+            if key in self._results:
+                return self._results[key] or self.PENDING
+            self._results[key] = None
+            return None
+
+    def release(self, key):
+        with self._lock:
+            self._results.pop(key, None)
+
+    def store(self, key, url_data, default_status):
+        statuses, counts = url_data.statuses, url_data.counts
+        if statuses and statuses[0] != default_status and not any(counts):
+            # a failure, same status for every domain
+            found = statuses[0]
+        else:
+            found = [
+                (i, status, counts[i]) for i, status in enumerate(statuses)
+                if status != default_status
+            ]
+        result = (url_data['http_response'], found)
+        with self._lock:
+            self._results[key] = result
+
+    @staticmethod
+    def restore(result, url_data):
+        url_data['http_response'], found = result
+        if not isinstance(found, list):
+            url_data.set_failure(found)
+            return
+        for i, status, count in found:
+            url_data.statuses[i] = status
+            url_data.counts[i] = count
@@ -0,0 +1,144 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import io
+import logging
+import re
+
+
+log = logging.getLogger(__name__)
+
+SCHEMES = ('//', 'http://', 'https://')
+# numeric character references, decoded by HTML parsers in links too
+_char_ref_re = re.compile(br'&#(?:x([0-9a-f]+)|([0-9]+));?')
+
+
+def load_domains(path):
+    """Domains from a file, one per line. Blank lines and # comments are
+    skipped."""
+    domains = []
+    with io.open(path, encoding='utf-8') as fh:
+        for line in fh:
+            domain = line.split('#', 1)[0].strip()
+            if domain:
+                domains.append(domain)
+    log.debug('%d domains loaded from %s', len(domains), path)
+    return domains
+
+
+def decode_char_refs(text):
+    """
+    `text` (lowercase bytes) with its numeric character references
+    decoded, as lowercase UTF-8.
+    """
+    def replace(match):
+        hex_digits, digits = match.groups()
+        try:
+            char = unichr(int(hex_digits, 16) if hex_digits else int(digits))
+        except (ValueError, OverflowError):
+            return match.group(0)
+        return char.lower().encode('utf-8')
+
+    return _char_ref_re.sub(replace, text)
+
+
+class DomainMatcher(object):
+    """
+    Finds which of `domains` a link points to.
+
+    A link matches a domain when it is an absolute http(s) or
+    protocol-relative URL whose host is the domain itself, or a subdomain
+    of it at most `max_subdomains` labels deep. When several domains
+    match, the one that comes first in `domains` wins.
+
+    The host is cut out of the link once and its possible parent domains
+    are looked up in a dict, so the cost does not grow with the number of
+    domains.
+    """
+    max_subdomains = 2
+    max_label_length = 63
+    # possible host names in raw HTML, see mentioned_in(); "&" and ";"
+    # end them too, for hosts next to a character reference
+    _dotted_re = re.compile(br'[^\s"\'<>/.&;]+(?:\.[^\s"\'<>/.&;]+)+')
+
+    def __init__(self, domains):
+        self.domains = domains
+        self._index = {}
+        for i, domain in enumerate(domains):
+            self._index.setdefault(domain.lower(), i)
+        self._bytes = frozenset(
+            domain.lower().encode('utf-8') for domain in domains)
+        # names without a dot cannot be told apart from any other word
+        self._dotless = any(b'.' not in domain for domain in self._bytes)
+
+    def match(self, href):
+        """The domain `href` links to, or None."""
+        host = self.host_of(href.lower())
+        if host is None:
+            return None
+        return self.match_host(host)
+
+    def match_all(self, href):
+        """All the domains `href` links to, in the order of `domains`."""
+        host = self.host_of(href.lower())
+        if host is None:
+            return []
+        return [self.domains[i] for i in sorted(self._indexes(host))]
+
+    def match_host(self, host):
+        best = None
+        for index in self._indexes(host):
+            if best is None or index < best:
+                best = index
+        return None if best is None else self.domains[best]
+
+    def _indexes(self, host):
+        # positions of the host itself and of its parent domains
+        labels = host.split('.')
+        for depth in range(min(self.max_subdomains, len(labels) - 1) + 1):
+            if depth and not (
+                    0 < len(labels[depth - 1]) <= self.max_label_length):
+                break
+            index = self._index.get('.'.join(labels[depth:]))
+            if index is not None:
+                yield index
+
+    @staticmethod
+    def host_of(href):
+        """
+        Host part of an absolute http(s) or protocol-relative `href`, or
+        None for any other link.
+        """
+        for scheme in SCHEMES:
+            if href.startswith(scheme):
+                rest = href[len(scheme):]
+                break
+        else:
+            return None
+        host, slash, path = rest.partition('/')
+        # like "$" in a regex, allow a single newline at the very end
+        if not slash:
+            return host[:-1] if host.endswith('\n') else host
+        if '\n' in (path[:-1] if path.endswith('\n') else path):
+            return None
+        return host
+
+    def mentioned_in(self, text):
+        """
+        False if no domain appears as a host name anywhere in `text`
+        (lowercase bytes), so that no link in it can match. Looks at every
+        dotted name in the text, whatever the number of domains.
+        """
+        if self._dotless:
+            return True
+        for name in self._dotted_re.findall(text):
+            labels = name.split(b'.')
+            for depth in range(len(labels) - 1):
+                if b'.'.join(labels[depth:]) in self._bytes:
+                    return True
+        return False
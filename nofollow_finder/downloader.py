@@ -6,61 +6,498 @@ from __future__ import (
     unicode_literals,
 )
 
+import cgi
+import email.utils
 import logging
+import pipes
+import re
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import HTTPError as Urllib3Error
+from requests.structures import CaseInsensitiveDict
 
 from nofollow_finder import command
+from nofollow_finder.body import BodyBuffer, BodyTooLarge
+from nofollow_finder.compression import (
+    ACCEPT_ENCODING,
+    DecodeError,
+    make_decoder,
+)
+from nofollow_finder.stats import stats
 
 
 log = logging.getLogger(__name__)
 
+HTTP_OK = 200
+HTTP_NOT_MODIFIED = 304
+CURL_FILESIZE_EXCEEDED = 63
+# status codes and curl exit codes worth trying again later
+TRANSIENT_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+TRANSIENT_CURL_ERRORS = {
+    6: 'could not resolve host',
+    7: 'could not connect',
+    28: 'timed out',
+    35: 'SSL connect error',
+    52: 'empty reply',
+    55: 'send error',
+    56: 'connection reset',
+}
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header value, or None."""
+    value = (value or '').strip()
+    if value.isdigit():
+        return int(value)
+    date = email.utils.parsedate_tz(value)
+    if date is None:
+        return None
+    return max(email.utils.mktime_tz(date) - time.time(), 0)
+
+
+class Response(object):
+    """
+    Status code, body and headers of a downloaded URL.
+
+    The body is bytes, or a read-only mmap for large bodies that were
+    spilled to disk, which is released by `close()`.
+
+    `wire_size` is the number of body bytes transferred, before
+    decompression, `size` is the number of bytes after it.
+    """
+
+    def __init__(self, status_code, body, headers=None, wire_size=0,
+                 size=0):
+        self.status_code = status_code
+        self.body = body
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.wire_size = wire_size
+        self.size = size
+
+    @property
+    def not_modified(self):
+        return self.status_code == HTTP_NOT_MODIFIED
+
+    @property
+    def content_type(self):
+        content_type, params = cgi.parse_header(
+            self.headers.get('Content-Type', ''))
+        return content_type.lower()
+
+    @property
+    def is_html(self):
+        """False only if the Content-Type is known and it is not HTML."""
+        return not self.content_type or (
+            self.content_type in HTML_CONTENT_TYPES)
+
+    @property
+    def charset(self):
+        """Charset declared in the Content-Type header, or None."""
+        content_type, params = cgi.parse_header(
+            self.headers.get('Content-Type', ''))
+        return params.get('charset') or None
+
+    def close(self):
+        if hasattr(self.body, 'close'):
+            self.body.close()
+
 
 class Downloader(object):
 
     class GetException(Exception):
         """GET request failed"""
 
-    def __init__(self, follow_redirects=True, timeout=None):
+    class TooLarge(GetException):
+        """Response body is larger than max_body_size"""
+
+    class TransientError(GetException):
+        """Download failed in a way that may not happen again later"""
+
+        def __init__(self, reason='', retry_after=None, status_code=0):
+            super(Downloader.TransientError, self).__init__(reason)
+            self.reason = reason
+            self.retry_after = retry_after
+            # 0 when the host could not be reached at all
+            self.status_code = status_code
+
+    class HostDown(GetException):
+        """Not downloaded, the host failed too many times in a row"""
+
+    class NotHtml(GetException):
+        """Response is not an HTML page"""
+
+        def __init__(self, status_code=0, content_type=''):
+            super(Downloader.NotHtml, self).__init__(content_type)
+            self.status_code = status_code
+            self.content_type = content_type
+
+    _status_line_re = re.compile(br'^HTTP/[0-9.]+ +([0-9]{3})', re.M)
+
+    def __init__(self, follow_redirects=True, timeout=None,
+                 max_body_size=None, spill_size=None, html_only=False,
+                 breaker=None):
         log.debug('follow_redirects: %d', follow_redirects)
         self.follow_redirects = follow_redirects
         self.timeout = timeout
+        self.max_body_size = max_body_size
+        self.spill_size = spill_size
+        self.html_only = html_only
+        self.breaker = breaker
 
     def get(self, url):
+        response = self.fetch(url)
+        return response.status_code, response.body
+
+    def fetch(self, url, headers=None, sink=None):
+        """
+        Download `url` sending extra request `headers`, returns a Response.
+
+        Only status 200 is accepted, and 304 when `headers` make the
+        request conditional. Failures that are worth retrying later
+        (timeouts, connection errors, 429, 503, ...) raise TransientError.
+        With `html_only`, responses that are not HTML raise NotHtml, if
+        possible before their body is downloaded. URLs of hosts that the
+        `breaker` considers down raise HostDown.
+
+        The body is written to `sink` (see BodyBuffer) when given, as it
+        arrives, and Response.body is whatever `sink.getvalue()` returns.
+        """
         log.debug('get: %s', url)
-        out, err = self._raw_get(url)
-        body, status_code = self._split(out)
-        self._validate_status(status_code, url)
-        log.debug('received %s', url)
-        return status_code, body
-
-    def _raw_get(self, url):
-        cmd = 'curl -w"%{{http_code}}"{follow} {url}'.format(
-            follow=' -L' if self.follow_redirects else '',
-            url=url,
+        if self.breaker is not None and not self.breaker.allow(url):
+            log.debug('host down, skipping %s', url)
+            raise self.HostDown()
+        try:
+            response = self._fetch(url, headers or {}, sink)
+        except self.TransientError as e:
+            self._record(url, failed=not e.status_code)
+            raise
+        except Exception:
+            self._record(url, failed=False)
+            raise
+        self._record(url, failed=False)
+        stats.inc('bytes on wire', response.wire_size)
+        stats.inc('bytes decoded', response.size)
+        self._validate_status(response, url, headers)
+        self._validate_content_type(response, url)
+        log.debug('received %s, %d bytes on wire, %d decoded',
+                  url, response.wire_size, response.size)
+        return response
+
+    def get_any(self, url):
+        """
+        Like `get`, but responses with any HTTP status, and any content
+        type even with `html_only`, are returned.
+        """
+        log.debug('get_any: %s', url)
+        response = self._fetch(url, {}, check_html=False)
+        return response.status_code, response.body
+
+    def _record(self, url, failed):
+        if self.breaker is not None:
+            self.breaker.record(url, failed)
+
+    def _make_buffer(self):
+        return BodyBuffer(self.max_body_size, self.spill_size)
+
+    def _fetch(self, url, headers, sink=None, check_html=True):
+        if self.html_only and check_html and not headers:
+            self._preflight(url)
+        buffer_ = sink if sink is not None else self._make_buffer()
+        try:
+            out = self._raw_get(url, headers, buffer_)
+            if buffer_.complete:
+                head, status_code, wire_size = self._split_cut(
+                    out, buffer_.size)
+            else:
+                head, status_code, wire_size = self._split(out)
+        except Exception:
+            buffer_.close()
+            raise
+        return Response(
+            status_code,
+            buffer_.getvalue(),
+            self._parse_headers(head),
+            wire_size=wire_size,
+            size=buffer_.size,
         )
-        log.debug('command: %s', cmd)
+
+    def _raw_get(self, url, headers, buffer_):
+        # The body goes to stderr, which is streamed into `buffer_`, while
+        # stdout gets the response headers (once for every redirect) and
+        # the status code and size written out at the end.
+        options = ['-o /dev/stderr', '-D -', '--compressed']
+        if self.max_body_size:
+            # stops early when the size is known upfront
+            options.append('--max-filesize {:d}'.format(self.max_body_size))
+        cmd = self._curl_cmd(url, headers, options)
         try:
-            returncode, out, err = command.run(cmd, timeout=self.timeout)
+            returncode, out, err = command.run(
+                cmd, timeout=self.timeout, err_sink=buffer_)
         except command.Timeout:
             log.error('curl timed out for %s', url)
-            raise self.GetException()
+            raise self.TransientError('timed out')
+        except BodyTooLarge:
+            returncode = CURL_FILESIZE_EXCEEDED
+        if buffer_.complete:
+            log.debug('rest of the body not needed for %s', url)
+            stats.inc('downloads stopped early')
+            return out
+        if returncode == CURL_FILESIZE_EXCEEDED:
+            log.error('body larger than %d bytes for %s',
+                      self.max_body_size, url)
+            raise self.TooLarge()
+        if returncode in TRANSIENT_CURL_ERRORS:
+            reason = TRANSIENT_CURL_ERRORS[returncode]
+            log.error('curl failed (%s) for %s', reason, url)
+            raise self.TransientError(reason)
         if returncode:
             log.error('curl returned error code %d for %s', returncode, url)
             raise self.GetException()
-        return out, err
+        return out
+
+    def _preflight(self, url):
+        """
+        Make a HEAD request and raise NotHtml if the Content-Type says so.
+        Any other outcome is left to the actual GET request.
+        """
+        cmd = self._curl_cmd(url, {}, ['-I'])
+        try:
+            returncode, out, err = command.run(cmd, timeout=self.timeout)
+            head, status_code, wire_size = self._split(out)
+        except (command.Timeout, self.GetException):
+            return
+        response = Response(status_code, b'', self._parse_headers(head))
+        if status_code == HTTP_OK and not returncode:
+            self._validate_content_type(response, url)
+
+    def _curl_cmd(self, url, headers, options):
+        options = ['-s'] + options + [
+            '-w"\\n%{http_code} %{size_download}"',
+        ]
+        if self.follow_redirects:
+            options.append('-L')
+        for name, value in headers.items():
+            options.append(
+                '-H {}'.format(pipes.quote('{}: {}'.format(name, value))))
+        cmd = 'curl {} {}'.format(' '.join(options), pipes.quote(url))
+        log.debug('command: %s', cmd)
+        return cmd
 
     @classmethod
     def _split(cls, out):
-        out = out.decode('utf-8')
-        status_code = out[-3:]
-        body = out[:-3]
+        # curl appends "\n<status code> <bytes downloaded>" to the headers
+        head, _, write_out = out.rpartition(b'\n')
         try:
-            status_code = int(status_code)
+            status_code, wire_size = map(int, write_out.split(b' '))
         except (ValueError, TypeError):
             log.info('cannot parse status code, end: %s', out[-80:])
             raise cls.GetException()
-        return body, status_code
+        return head, status_code, wire_size
 
-    def _validate_status(self, status_code, url):
-        if status_code != 200:
+    @classmethod
+    def _split_cut(cls, out, size):
+        # curl was stopped before it wrote out the status code and size,
+        # take the status from the last response headers instead
+        status_lines = cls._status_line_re.findall(out)
+        if not status_lines:
+            log.info('cannot parse status code, end: %s', out[-80:])
+            raise cls.GetException()
+        return out, int(status_lines[-1]), size
+
+    @staticmethod
+    def _parse_headers(head):
+        headers = CaseInsensitiveDict()
+        blocks = [
+            block for block in
+            head.decode('latin-1').replace('\r\n', '\n').split('\n\n')
+            if block.startswith('HTTP/')
+        ]
+        if blocks:
+            for line in blocks[-1].split('\n')[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip()] = value.strip()
+        return headers
+
+    def _validate_status(self, response, url, headers=None):
+        status_code = response.status_code
+        if status_code == HTTP_NOT_MODIFIED and headers:
+            return
+        if status_code in TRANSIENT_STATUS_CODES:
             log.error('HTTP status %d for url %s', status_code, url)
+            raise self.TransientError(
+                'HTTP {:d}'.format(status_code),
+                parse_retry_after(response.headers.get('Retry-After')),
+                status_code)
+        if status_code != HTTP_OK:
+            log.error('HTTP status %d for url %s', status_code, url)
+            raise self.GetException()
+
+    def _validate_content_type(self, response, url):
+        if self.html_only and not response.is_html:
+            log.warning('not HTML (%s), skipping %s',
+                        response.content_type, url)
+            raise self.NotHtml(response.status_code, response.content_type)
+
+
+class PooledDownloader(Downloader):
+    """
+    Downloads in-process, reusing keep-alive connections from a pool.
+
+    Connections (and their TLS sessions) are kept open between requests,
+    so consecutive URLs on the same host skip both the process spawn and
+    the handshake that the curl backend pays for every URL.
+
+    `pool_size` is the number of connections kept per host, it should be
+    at least the number of concurrent downloads.
+    """
+    pool_hosts = 100
+    pool_size = 10
+    chunk_size = 64 * 1024
+
+    def __init__(self, follow_redirects=True, timeout=None,
+                 max_body_size=None, spill_size=None, html_only=False,
+                 breaker=None, pool_size=None):
+        super(PooledDownloader, self).__init__(
+            follow_redirects, timeout, max_body_size, spill_size, html_only,
+            breaker)
+        if pool_size is not None:
+            self.pool_size = max(pool_size, self.pool_size)
+        self.session = self._make_session()
+
+    def _make_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_hosts,
+            pool_maxsize=self.pool_size,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _fetch(self, url, headers, sink=None, check_html=True):
+        headers = dict(headers, **{'Accept-Encoding': ACCEPT_ENCODING})
+        # the requests timeout is for every socket operation, like curl's
+        # the deadline is for the whole download
+        deadline = time.time() + self.timeout if self.timeout else None
+        response = self._raw_get(url, headers)
+        # headers are in, the body has not been read yet
+        head = Response(response.status_code, b'', response.headers)
+        if check_html and response.status_code == HTTP_OK:
+            try:
+                self._validate_content_type(head, url)
+            except self.NotHtml:
+                response.close()
+                raise
+        buffer_ = sink if sink is not None else self._make_buffer()
+        buffer_.start(head.charset)
+        try:
+            wire_size = self._read(response, buffer_, deadline)
+        except self.TransientError:
+            buffer_.close()
+            raise
+        except BodyTooLarge:
+            buffer_.close()
+            log.error('body larger than %d bytes for %s',
+                      self.max_body_size, url)
+            raise self.TooLarge()
+        except DecodeError as e:
+            buffer_.close()
+            log.error('cannot decompress response for %s: %s', url, e)
+            raise self.GetException()
+        except (requests.RequestException, Urllib3Error) as e:
+            buffer_.close()
+            log.error('request failed for %s: %s', url, e)
+            raise self.TransientError('connection error')
+        finally:
+            response.close()
+        return Response(
+            response.status_code,
+            buffer_.getvalue(),
+            response.headers,
+            wire_size=wire_size,
+            size=buffer_.size,
+        )
+
+    def _read(self, response, buffer_, deadline=None):
+        """
+        Read the body into `buffer_` as it arrives, decompressing chunk by
+        chunk. Returns the number of bytes read from the wire.
+
+        Raises TransientError when the body is still coming at `deadline`,
+        the connection is then shut down so that a read waiting for a
+        server that sends its body slowly returns.
+        """
+        decoder = make_decoder(response.headers.get('Content-Encoding'))
+        wire_size = 0
+        expired = threading.Event()
+        timer = None
+        if deadline is not None:
+            timer = threading.Timer(
+                max(deadline - time.time(), 0), self._expire,
+                [response, expired])
+            timer.daemon = True
+            timer.start()
+        try:
+            for chunk in response.raw.stream(
+                    self.chunk_size, decode_content=False):
+                if expired.is_set():
+                    break
+                wire_size += len(chunk)
+                buffer_.write(decoder.decompress(chunk) if decoder else chunk)
+            if decoder and not expired.is_set():
+                buffer_.write(decoder.flush())
+        except StopIteration:
+            log.debug('rest of the body not needed for %s', response.url)
+            stats.inc('downloads stopped early')
+        except Exception:
+            # whatever the shut down connection made the read fail with
+            if not expired.is_set():
+                raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if expired.is_set():
+            log.error('request timed out for %s', response.url)
+            raise self.TransientError('timed out')
+        return wire_size
+
+    @staticmethod
+    def _expire(response, expired):
+        expired.set()
+        connection = getattr(response.raw, '_connection', None)
+        sock = getattr(connection, 'sock', None)
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def _raw_get(self, url, headers):
+        try:
+            response = self.session.get(
+                url,
+                headers=headers,
+                allow_redirects=self.follow_redirects,
+                timeout=self.timeout or None,
+                stream=True,
+            )
+        except requests.Timeout:
+            log.error('request timed out for %s', url)
+            raise self.TransientError('timed out')
+        except requests.exceptions.SSLError as e:
+            log.error('request failed for %s: %s', url, e)
+            raise self.GetException()
+        except requests.ConnectionError as e:
+            log.error('connection failed for %s: %s', url, e)
+            raise self.TransientError('connection error')
+        except requests.RequestException as e:
+            log.error('request failed for %s: %s', url, e)
             raise self.GetException()
+        return response
@@ -0,0 +1,173 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import io
+import logging
+
+from nofollow_finder.domains import DomainMatcher, load_domains
+from nofollow_finder.processor import UrlData
+
+
+log = logging.getLogger(__name__)
+
+
+class Job(object):
+    """
+    Domains to look for, and the CSV file their results go to, with a
+    header row or not (None: only when the file is overwritten).
+    """
+
+    def __init__(self, out_file, domains, header=None):
+        self.out_file = out_file
+        self.domains = domains
+        self.header = header
+
+
+def load_jobs(path):
+    """
+    Jobs from a file, one per line: the output CSV file, then the domains,
+    separated by commas, or "@" and the path of a domains file (see
+    load_domains). Blank lines and # comments are skipped.
+
+    Raises ValueError for lines that are not jobs.
+    """
+    jobs = []
+    with io.open(path, encoding='utf-8') as fh:
+        for line_number, line in enumerate(fh, start=1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split(None, 1)
+            if len(parts) != 2:
+                raise ValueError(
+                    'line {}: expected an output file and domains'.format(
+                        line_number))
+            out_file, domains = parts
+            if domains.startswith('@'):
+                domains = load_domains(domains[1:].strip())
+            else:
+                domains = [
+                    domain.strip() for domain in domains.split(',')
+                    if domain.strip()
+                ]
+            if not domains:
+                raise ValueError('line {}: no domains'.format(line_number))
+            jobs.append(Job(out_file, domains))
+    log.debug('%d jobs loaded from %s', len(jobs), path)
+    return jobs
+
+
+def all_domains(jobs):
+    """Domains of all the jobs, each one once, in the order of the jobs."""
+    seen = set()
+    domains = []
+    for job in jobs:
+        for domain in job.domains:
+            if domain not in seen:
+                seen.add(domain)
+                domains.append(domain)
+    return domains
+
+
+def _labels(domains):
+    """
+    Names of the results of `domains` in a run of their own, e.g. for
+    caching. A domain has its own name, unless a link to it can also be to
+    a domain that comes before it (its parent or subdomain), which wins the
+    link: its results then depend on these domains, named after it,
+    separated by spaces.
+    """
+    matcher = DomainMatcher(domains)
+    first = {}
+    related = {}
+    for i, domain in enumerate(domains):
+        first.setdefault(domain, i)
+        related.setdefault(domain, set())
+    for domain in first:
+        for parent in matcher.match_all('//{}/'.format(domain)):
+            if parent != domain:
+                related[domain].add(parent)
+                related[parent].add(domain)
+    return [
+        ' '.join([domain] + sorted(
+            (other for other in related[domain] if first[other] < i),
+            key=first.get))
+        for i, domain in enumerate(domains)
+    ]
+
+
+class JobColumns(dict):
+    """
+    Positions of the results of all the jobs in the rows of a run: the
+    columns of every job, one per domain, one job after the other.
+
+    Maps what the parser finds a link for with `match_all`, the domains it
+    links to separated by spaces, to the column of the first of them in
+    every job, like the parser does in a run of the job on its own.
+    """
+
+    def __init__(self, jobs):
+        super(JobColumns, self).__init__()
+        self.labels = []
+        self._jobs = []
+        for job in jobs:
+            self._jobs.append(
+                (len(self.labels), UrlData.make_positions(job.domains)))
+            self.labels.extend(_labels(job.domains))
+
+    def __missing__(self, key):
+        found = set(key.split(' '))
+        columns = []
+        for offset, positions in self._jobs:
+            matches = [
+                positions[domain] for domain in found if domain in positions]
+            if matches:
+                columns.extend(offset + i for i in min(matches))
+        self[key] = columns
+        return columns
+
+
+class JobsOutput(object):
+    """
+    Output that writes the results for the domains of all the jobs, found
+    with a single download and parse of every page, to the output of each
+    job, with the statuses and counts of its own domains only, as if it had
+    been run on its own.
+
+    Rows have the columns of all the jobs (see JobColumns), `domains` names
+    them and `positions` places the links found by the parser in them.
+    """
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.positions = JobColumns(outputs)
+        self.domains = self.positions.labels
+        self._selections = []
+        offset = 0
+        for output in outputs:
+            indexes = range(offset, offset + len(output.domains))
+            self._selections.append(
+                (indexes, UrlData.make_positions(output.domains)))
+            offset += len(output.domains)
+
+    def open(self):
+        for output in self.outputs:
+            output.open()
+
+    def close(self):
+        for output in self.outputs:
+            output.close()
+
+    def sync(self):
+        for output in self.outputs:
+            output.sync()
+
+    def write(self, url_data):
+        for output, (indexes, positions) in zip(
+                self.outputs, self._selections):
+            output.write(url_data.select(output.domains, indexes, positions))
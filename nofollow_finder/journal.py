@@ -0,0 +1,139 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import array
+import io
+import logging
+import os
+import time
+import zlib
+
+
+log = logging.getLogger(__name__)
+
+
+def _checksum(url):
+    return zlib.crc32(url.encode('utf-8')) & 0xffffffff
+
+
+class Journal(object):
+    """
+    Append-only record of the input rows whose results have been written,
+    one line per row: its number among the links of the input, a tab and
+    its URL.
+
+    With `resume`, the rows already in the file are skipped by `pending()`
+    and new ones are appended, otherwise the file is started over. Rows
+    are looked up by number, in a bitmap, and only count as done if their
+    URL is the same, so millions of them take a few MB.
+
+    Lines are flushed as they are written, and synced to disk by
+    `checkpoint()` at most every `sync_interval` seconds. With `deferred`,
+    for outputs whose rows are only safe once synced (OutputSQLite only
+    commits every so many rows), lines are kept in memory and only
+    written by `sync()`, after the output has been synced.
+    """
+    sync_interval = 5
+
+    def __init__(self, path, resume=False, deferred=False):
+        self.path = path
+        self.resume = resume
+        self.deferred = deferred
+        self._held = []
+        self._done = bytearray()
+        self._checksums = array.array(str('I'))
+        self._fh = None
+        self._synced_at = 0
+
+    def open(self):
+        if self.resume:
+            self.load()
+        self._fh = io.open(self.path, 'a' if self.resume else 'w',
+                           encoding='utf-8')
+        self._synced_at = time.time()
+
+    def close(self):
+        if self._fh is None:
+            return
+        self.sync()
+        self._fh.close()
+        self._fh = None
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            log.warning('no journal at %s, starting from the beginning',
+                        self.path)
+            return
+        loaded = 0
+        done, checksums, crc32 = self._done, self._checksums, zlib.crc32
+        # read as bytes and inlined, there can be millions of lines
+        with open(self.path, 'rb') as fh:
+            for line in fh:
+                # the last line may have been cut short by a crash
+                if not line.endswith(b'\n'):
+                    break
+                row, _, url = line[:-1].partition(b'\t')
+                try:
+                    row = int(row)
+                    if row < 0:
+                        raise ValueError(row)
+                except ValueError:
+                    log.warning('skipping invalid journal line: %r', line)
+                    continue
+                if row >= len(checksums):
+                    self._grow(row)
+                done[row >> 3] |= 1 << (row & 7)
+                checksums[row] = crc32(url) & 0xffffffff
+                loaded += 1
+        log.info('%d done rows loaded from %s', loaded, self.path)
+
+    def is_done(self, row, url):
+        return (
+            row < len(self._checksums) and
+            self._done[row >> 3] & (1 << (row & 7)) and
+            self._checksums[row] == _checksum(url))
+
+    def pending(self, links):
+        """
+        Numbers the links, as the `row` item of each unless they have one
+        already, and yields the ones that are not done.
+        """
+        skipped = 0
+        for position, link in enumerate(links):
+            row = link.setdefault('row', position)
+            if self.is_done(row, link['url']):
+                skipped += 1
+                continue
+            yield link
+        if skipped:
+            log.info('%d rows skipped, done in a previous run', skipped)
+
+    def record(self, row, url):
+        line = '{}\t{}\n'.format(row, url)
+        if self.deferred:
+            self._held.append(line)
+            return
+        self._fh.write(line)
+        self._fh.flush()
+
+    def checkpoint_due(self):
+        return time.time() - self._synced_at >= self.sync_interval
+
+    def sync(self):
+        if self._held:
+            self._fh.write(''.join(self._held))
+            del self._held[:]
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._synced_at = time.time()
+
+    def _grow(self, row):
+        # in steps, rows are mostly loaded in increasing order
+        size = max(row + 1, 2 * len(self._checksums), 1024)
+        self._checksums.extend([0] * (size - len(self._checksums)))
+        self._done.extend(b'\0' * ((size + 7 >> 3) - len(self._done)))
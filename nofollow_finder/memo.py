@@ -0,0 +1,130 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import collections
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from nofollow_finder.stats import stats
+
+
+log = logging.getLogger(__name__)
+
+
+class ParseMemo(object):
+    """
+    Results of parsed pages, keyed by a hash of their content, so that
+    pages with the same body (mirrors, URLs that only differ in tracking
+    parameters, error page templates) are only parsed once.
+
+    Results are `(domain, count, nofollow)` for every domain linked from
+    the page, like ParsePool.parse returns them. The last `max_entries`
+    used are kept in memory and, with a `path`, also in an SQLite file for
+    the next runs, up to `max_stored` of them.
+
+    Keys depend on the domains of `parser`, so results are never reused
+    for other domains, or with `existence_only` for complete ones.
+    """
+    commit_every = 100
+    max_stored = 1000000
+
+    def __init__(self, parser, max_entries=10000, path=None,
+                 existence_only=False):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._uncommitted = 0
+        self._salt = json.dumps([
+            sorted(set(parser.domains)),
+            parser.match_all,
+            existence_only,
+        ]).encode('utf-8')
+
+    def open(self):
+        if not self.path:
+            return
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS parses (
+                key TEXT PRIMARY KEY,
+                links TEXT,
+                used_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS parses_used_at ON parses (used_at);
+        ''')
+
+    def close(self):
+        log.info('parse memo hit rate: %.1f%% (%d of %d)',
+                 stats.rate('parse memo hits', 'parse memo lookups'),
+                 stats['parse memo hits'], stats['parse memo lookups'])
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM parses WHERE key IN ('
+                '  SELECT key FROM parses ORDER BY used_at DESC'
+                '  LIMIT -1 OFFSET ?)',
+                (self.max_stored,))
+            self._db.commit()
+        self._db.close()
+        self._db = None
+
+    def key(self, html):
+        """Key of a page body, bytes or an mmap."""
+        digest = hashlib.sha1(self._salt)
+        digest.update(html)
+        return digest.hexdigest()
+
+    def lookup(self, key):
+        """Results stored for `key`, or None."""
+        stats.inc('parse memo lookups')
+        with self._lock:
+            links = self._entries.pop(key, None)
+            if links is None and self._db is not None:
+                row = self._db.execute(
+                    'SELECT links FROM parses WHERE key = ?',
+                    (key,)).fetchone()
+                if row is not None:
+                    links = [tuple(link) for link in json.loads(row[0])]
+                    self._touch(key)
+            if links is None:
+                return None
+            self._remember(key, links)
+        stats.inc('parse memo hits')
+        return links
+
+    def store(self, key, links):
+        with self._lock:
+            self._remember(key, links)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO parses VALUES (?, ?, ?)',
+                    (key, json.dumps(links), time.time()))
+                self._maybe_commit()
+
+    def _remember(self, key, links):
+        self._entries[key] = links
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _touch(self, key):
+        self._db.execute(
+            'UPDATE parses SET used_at = ? WHERE key = ?', (time.time(), key))
+        self._maybe_commit()
+
+    def _maybe_commit(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self._db.commit()
+            self._uncommitted = 0
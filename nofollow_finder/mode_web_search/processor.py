@@ -19,6 +19,7 @@ class WebSearchProcessor(Processor):
     def make_url_data(self, link):
         return UrlData(
             domains=self.domains,
+            positions=self.positions,
             url=link['url'],
             query=link['query'],
             engine=link['engine'],
@@ -7,42 +7,38 @@ from __future__ import (
 )
 
 import csv
-import collections
+import os
 import sys
 
 
 class OutputCSV(object):
     FIXED_HEADER = ('URL', 'HTTP response code',)
     FIXED_COLS = 'url http_response'
+    # last column with `rows`, for merging the outputs of shards
+    ROW_HEADER = 'input row'
 
-    def __init__(self, out_file, domains, overwrite=False, header=None):
+    def __init__(self, out_file, domains, overwrite=False, header=None,
+                 attempts=False, rows=False):
         self.domains = domains
+        self.attempts = attempts
+        self.rows = rows
         self.out_file = out_file
         self.writer = None
         self.fh = None
         self.mode = 'w' if overwrite else 'a'
         self.header = header if header is not None else overwrite
-        self._csv_row = None
-
-    @property
-    def csv_row(self):
-        if self._csv_row is None:
-            domain_cols = ' '.join([
-                'domain_{i} domain_{i}_count'.format(i=i)
-                for i, _ in enumerate(self.domains)
-            ])
-            if domain_cols:
-                domain_cols = ' {}'.format(domain_cols)
-            self._csv_row = collections.namedtuple(
-                'csv_row', '{}{}'.format(self.FIXED_COLS, domain_cols))
-        return self._csv_row
+        self.fixed_columns = self.FIXED_COLS.split()
 
     def header_row(self):
         header = list(self.FIXED_HEADER)
         for domain in self.domains:
             header.append(domain)
             header.append('{} count'.format(domain))
-        return self.csv_row(*header)
+        if self.attempts:
+            header.append('attempts')
+        if self.rows:
+            header.append(self.ROW_HEADER)
+        return [unicode(column).encode('utf-8') for column in header]
 
     def open(self):
         if self.out_file:
@@ -57,8 +53,36 @@ class OutputCSV(object):
         if self.out_file:
             self.fh.close()
 
-    def write(self, data):
-        row = self.csv_row(**data)
-        row = map(lambda u: u.encode('utf-8'), map(unicode, row))
+    def sync(self):
+        """Makes sure the rows written so far are on disk."""
+        if self.out_file:
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+
+    def row(self, url_data):
+        """Values of the columns for a UrlData, in column order."""
+        fixed = [url_data[column] for column in self.fixed_columns]
+        cells = [None] * (2 * len(url_data.statuses))
+        cells[::2] = url_data.statuses
+        cells[1::2] = url_data.counts
+        row = fixed + cells
+        if self.attempts:
+            row.append(url_data['attempts'])
+        if self.rows:
+            row.append(url_data['row'])
+        return row
+
+    def write(self, url_data):
+        row = self.row(url_data)
+        # statuses are ASCII and counts are numbers, which csv writes as
+        # they are, only the other columns need encoding
+        for i in self._text_columns(len(row)):
+            row[i] = unicode(row[i]).encode('utf-8')
         self.writer.writerow(row)
         self.fh.flush()
+
+    def _text_columns(self, length):
+        columns = range(len(self.fixed_columns))
+        if self.attempts:
+            columns.append(length - 2 if self.rows else length - 1)
+        return columns
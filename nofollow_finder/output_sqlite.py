@@ -0,0 +1,170 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from nofollow_finder.processor import STATUS_FAIL, STATUS_HOST_DOWN
+
+
+log = logging.getLogger(__name__)
+
+_days_ = 24 * 60 * 60
+
+# statuses of checks that did not get an answer, and should be retried
+RETRY_STATUSES = (STATUS_FAIL, STATUS_HOST_DOWN)
+
+
+class OutputSQLite(object):
+    """
+    Writes the results to an SQLite database, to keep the results of all
+    runs and query them, instead of a CSV file.
+
+    Every run adds a row to `runs`, every URL a row to `checks`, and every
+    domain of every URL a row to `results`. Rows are inserted in
+    transactions of `commit_every` URLs.
+    """
+    commit_every = 500
+
+    def __init__(self, out_file, domains, in_file=None):
+        self.out_file = out_file
+        self.domains = domains
+        self.in_file = in_file
+        self.run_id = None
+        self._db = None
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+
+    def open(self):
+        self._db = sqlite3.connect(self.out_file, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY,
+                started_at REAL,
+                finished_at REAL,
+                input TEXT,
+                domains TEXT
+            );
+            CREATE TABLE IF NOT EXISTS checks (
+                id INTEGER PRIMARY KEY,
+                run_id INTEGER REFERENCES runs (id),
+                url TEXT,
+                query TEXT,
+                engine TEXT,
+                http_response INTEGER,
+                attempts INTEGER,
+                failed INTEGER,
+                checked_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS checks_url
+                ON checks (url, checked_at);
+            CREATE TABLE IF NOT EXISTS results (
+                check_id INTEGER REFERENCES checks (id),
+                domain TEXT,
+                status TEXT,
+                count INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS results_check_id
+                ON results (check_id);
+            CREATE INDEX IF NOT EXISTS results_domain
+                ON results (domain, status);
+        ''')
+        with self._lock:
+            self.run_id = self._db.execute(
+                'INSERT INTO runs (started_at, input, domains) '
+                'VALUES (?, ?, ?)',
+                (time.time(), self.in_file, json.dumps(self.domains))
+            ).lastrowid
+            self._db.commit()
+
+    def close(self):
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                'UPDATE runs SET finished_at = ? WHERE id = ?',
+                (time.time(), self.run_id))
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def sync(self):
+        with self._lock:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def write(self, url_data):
+        statuses = url_data.statuses
+        with self._lock:
+            check_id = self._db.execute(
+                'INSERT INTO checks (run_id, url, query, engine, '
+                'http_response, attempts, failed, checked_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.run_id, url_data['url'], url_data.get('query'),
+                 url_data.get('engine'), url_data['http_response'],
+                 url_data.get('attempts'),
+                 bool(statuses) and statuses[0] in RETRY_STATUSES,
+                 time.time())
+            ).lastrowid
+            self._db.executemany(
+                'INSERT INTO results VALUES (?, ?, ?, ?)',
+                [
+                    (check_id, domain, status, count)
+                    for domain, status, count in zip(
+                        url_data.domains, statuses, url_data.counts)
+                ])
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self._db.commit()
+                self._uncommitted = 0
+
+    def last_checked(self, url):
+        """
+        When `url` was last checked with an answer for all the domains, by
+        an earlier run, as a timestamp, or None: the oldest of the last
+        checks of every domain.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT results.domain, MAX(checks.checked_at) '
+                'FROM checks JOIN results ON results.check_id = checks.id '
+                'WHERE checks.url = ? AND NOT checks.failed '
+                'AND checks.run_id != ? '
+                'GROUP BY results.domain', (url, self.run_id)).fetchall()
+        checked = dict(rows)
+        if not all(domain in checked for domain in self.domains):
+            return None
+        return min(checked[domain] for domain in self.domains)
+
+
+class StaleInput(object):
+    """
+    Input that only has the links of `input_csv` that have not been
+    checked for all the domains of `output`, an open OutputSQLite, in the
+    last `max_age` days by earlier runs.
+    """
+
+    def __init__(self, input_csv, output, max_age):
+        self.input_csv = input_csv
+        self.output = output
+        self.max_age = max_age
+
+    def links(self):
+        checked_since = time.time() - self.max_age * _days_
+        skipped = 0
+        for link in self.input_csv.links():
+            last_checked = self.output.last_checked(link['url'])
+            if last_checked is not None and last_checked >= checked_since:
+                skipped += 1
+                continue
+            yield link
+        log.info('%d URLs skipped, checked in the last %g days',
+                 skipped, self.max_age)
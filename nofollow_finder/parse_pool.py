@@ -0,0 +1,121 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import logging
+import multiprocessing
+import signal
+
+import lxml.html
+
+from nofollow_finder.stats import stats
+
+
+log = logging.getLogger(__name__)
+
+# the Parser of a worker process, see _init_worker()
+_parser = None
+
+
+def _init_worker(parser_class, domains, prefilter, match_all):
+    global _parser
+    # Ctrl+C is handled by the main process, which stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _parser = parser_class(domains, prefilter=prefilter, match_all=match_all)
+
+
+def _parse_page(url, html, charset, stop_when_followed):
+    """
+    Runs in a worker process. Returns `(domain, count, nofollow)` for every
+    domain linked from `html`, `nofollow` being True when all the links to
+    the domain are nofollow, or None if the page has no A nodes at all.
+    The stats collected while parsing are returned with it.
+    """
+    stats.reset()
+    found = {}
+    order = []
+    unfollowed = set(_parser.domains)
+    log_links = log.isEnabledFor(logging.INFO)
+    try:
+        for a_node, domain, nofollow in _parser.find_a_nodes(html, charset):
+            if log_links:
+                log.info('%s - %s', url, lxml.html.tostring(a_node))
+            if domain not in found:
+                order.append(domain)
+                found[domain] = [0, True]
+            found[domain][0] += 1
+            found[domain][1] = found[domain][1] and nofollow
+            if not nofollow:
+                unfollowed.discard(domain)
+                if stop_when_followed and not unfollowed:
+                    break
+    except _parser.ZeroANodes:
+        links = None
+    else:
+        links = [(domain,) + tuple(found[domain]) for domain in order]
+    return links, stats.items()
+
+
+class ParsePool(object):
+    """
+    Parses pages in `processes` worker processes, so that parsing is not
+    serialised by the GIL while the threads of the main process download.
+
+    Every worker builds its own copy of `parser` once, and only the
+    per-domain results travel back, not the documents.
+
+    A page that is not parsed within `timeout` seconds, or
+    `max_parse_time` without one, raises TimedOut: a worker that dies
+    (out of memory, a crash in lxml) takes its page with it, and the
+    pool would otherwise wait for it forever.
+    """
+    max_parse_time = 300
+
+    class TimedOut(Exception):
+        """No result from the worker parsing the page"""
+
+    def __init__(self, parser, processes, timeout=None):
+        self.parser = parser
+        self.processes = processes
+        self.timeout = timeout or self.max_parse_time
+        self._pool = None
+
+    def open(self):
+        log.debug('starting %d parse workers', self.processes)
+        self._pool = multiprocessing.Pool(
+            self.processes, _init_worker,
+            (type(self.parser), self.parser.domains, self.parser.prefilter,
+             self.parser.match_all))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def parse(self, url, html, charset=None, stop_when_followed=False):
+        """
+        `(domain, count, nofollow)` for every domain linked from `html`,
+        like Parser.find_a_nodes, but aggregated. With `stop_when_followed`
+        the page is only parsed until every domain has a followed link.
+        """
+        if not isinstance(html, bytes):  # an mmap cannot be pickled
+            html = html[:]
+        # a timeout also keeps Ctrl+C working on Python 2
+        try:
+            links, counters = self._pool.apply_async(
+                _parse_page, (url, html, charset, stop_when_followed)
+            ).get(timeout=self.timeout)
+        except multiprocessing.TimeoutError:
+            log.error('no result from the parse workers after %ss for %s',
+                      self.timeout, url)
+            raise self.TimedOut()
+        for name, value in counters:
+            stats.inc(name, value)
+        if links is None:
+            raise self.parser.ZeroANodes()
+        return links
@@ -7,90 +7,122 @@ from __future__ import (
 )
 
 import logging
-import re
 
+import lxml.etree
+import lxml.html
 from lxml.etree import (
     ParserError,
+    XPath,
 )
 from pyquery import (
     PyQuery,
 )
 
+from nofollow_finder.domains import DomainMatcher, decode_char_refs
+from nofollow_finder.stats import stats
+
 log = logging.getLogger(__name__)
 
+# encodings in which the domain names are not plain ASCII bytes
+WIDE_CHARSETS = ('utf-16', 'utf-32', 'ucs-2', 'ucs-4', 'utf16', 'utf32')
+BOMS = (b'\xff\xfe', b'\xfe\xff')
+
 
 class Parser(object):
     a_selector = 'a[href]'
-    pattern_template = (
-        '^'  # start of string
-        '(?:'  # open a non-capturing group
-        'https?:'  # "http:" or "https:"
-        ')?'  # close the non-capturing group and make it optional 
-        '//'  # literally two slashes, required
-        '('  # open a capturing group
-        '{domains}'  # generated pattern, see self.domains_pattern() below
-        ')'  # close the capturing group
-        '(?:'  # open a non-capturing group
-        '/?|/.*'  # first thing after domain can be end-of-string or / 
-        ')'  # close the non-capturing group
-        '$'
-    )
-    subdomain_pattern = (
-        '(?:'  # open non-capture group "OUTER"
-        '(?:'  # open another non-capture group "LABELS"
-        '[^./]{1,63}'  # single label with up to 63 chars
-        '\.'  # a dot
-        ')'  # close non-capture group "LABELS"
-        '{0,2}'  # group "LABELS" can repeat 0 to 2 times
-        ')'  # close non-capture group "OUTER"
-        '?'  # make the whole "OUTER" group optional
-    )
+    # above this many domains, the prefilter looks for host names instead
+    max_substring_searches = 16
+    # bodies that are not bytes are prefiltered in chunks of this size
+    prefilter_chunk_size = 1024 * 1024
 
     class ZeroANodes(Exception):
         """No A tags found"""
 
-    def __init__(self, domains):
+    def __init__(self, domains, prefilter=True, match_all=False):
         self.domains = domains
-        self._re = re.compile(self.full_pattern)
-
-    @property
-    def domains_pattern(self):
-        domains_patterns = [
-            '(?:{}({}))'.format(
-                self.subdomain_pattern,
-                re.escape(domain.lower()),
-            )
-            for domain in self.domains
-        ]
-        pattern = '|'.join(domains_patterns)
-        log.debug('domains pattern: %s', pattern)
-        return pattern
-
-    @property
-    def full_pattern(self):
-        pattern = self.pattern_template.format(
-            domains=self.domains_pattern,
-        )
-        log.debug('full pattern: %s', pattern)
-        return pattern
-
-    def find_a_nodes(self, html):
+        self.prefilter = prefilter
+        # a link to several of the domains (a domain and its subdomain) is
+        # found for all of them at once, not only for the first one: for
+        # their names separated by spaces, see JobColumns
+        self.match_all = match_all
+        self.matcher = DomainMatcher(domains)
+        self._domain_bytes = [
+            domain.lower().encode('utf-8') for domain in domains]
+
+    def find_a_nodes(self, html, charset=None):
+        """
+        Find A nodes linking to one of the domains in `html` (bytes, or a
+        file-like object such as an mmap).
+
+        `charset` is the one declared by the server, if any. Otherwise
+        lxml looks for it in the document itself.
+        """
         log.debug('finding a nodes')
-        for a_node in self._a_nodes(html):
-            domain = self._matches_domain(a_node)
-            if domain:
+        if self.prefilter and not self.may_link(html, charset):
+            return
+        debug = log.isEnabledFor(logging.DEBUG)
+        for a_node in self._a_nodes(html, charset):
+            for domain in self._matches_domain(a_node):
+                if debug:
+                    log.debug('match: %s', a_node.attrib['href'])
                 yield a_node, domain, self._is_nofollow(a_node)
         log.debug('no more a nodes')
 
+    def may_link(self, html, charset=None):
+        """
+        False when none of the domains appears anywhere in `html`, so it
+        cannot link to them and does not need to be parsed. A search over
+        the raw bytes, much cheaper than parsing.
+        """
+        charset = (charset or '').lower().replace('_', '-')
+        if charset.startswith(WIDE_CHARSETS):
+            return True
+        head = html[:1024]
+        if head.startswith(BOMS) or b'\x00' in head:
+            return True
+        if self._mentions_domain(html):
+            return True
+        stats.inc('pages skipped by prefilter')
+        log.debug('none of the domains found in the page, not parsing it')
+        return False
+
+    def _mentions_domain(self, html):
+        if isinstance(html, bytes):
+            return self._mentioned_in(html.lower())
+        # a body spilled to an mmap is searched in chunks, not copied to
+        # memory in one piece; chunks overlap so that no domain is cut,
+        # with room for a few character references
+        overlap = 10 * max([1] + map(len, self._domain_bytes)) - 1
+        step = self.prefilter_chunk_size
+        for start in range(0, len(html), step):
+            chunk = html[max(start - overlap, 0):start + step]
+            if self._mentioned_in(chunk.lower()):
+                return True
+        return False
+
+    def _mentioned_in(self, text):
+        if self._search(text):
+            return True
+        # the parser decodes character references in links, a host can
+        # be spelled with them
+        return b'&#' in text and self._search(decode_char_refs(text))
+
+    def _search(self, text):
+        # lower() and substring search run in C, unlike re.IGNORECASE
+        if len(self._domain_bytes) <= self.max_substring_searches:
+            return any(domain in text for domain in self._domain_bytes)
+        return self.matcher.mentioned_in(text)
+
     def _matches_domain(self, a_node):
-        href = a_node.attrib['href'].lower()
-        match = self._re.match(href)
-        if match:
-            domain = filter(None, match.groups())[1]
-            log.debug('match: %s', href)
-        else:
-            domain = None
-        return domain
+        return self._match_href(a_node.attrib['href'])
+
+    def _match_href(self, href):
+        """The domains `href` links to, as a tuple, see `match_all`."""
+        if self.match_all:
+            domains = self.matcher.match_all(href)
+            return (' '.join(domains),) if domains else ()
+        domain = self.matcher.match(href)
+        return (domain,) if domain else ()
 
     @staticmethod
     def _is_nofollow(a_node):
@@ -101,17 +133,77 @@ class Parser(object):
         ]).lower().strip() == 'nofollow'
         return match
 
-    def _a_nodes(self, html):
+    html_parser_class = lxml.html.HTMLParser
+
+    def _html_parser(self, charset):
+        try:
+            return self.html_parser_class(encoding=charset)
+        except LookupError:
+            log.debug('unknown charset: %s', charset)
+            return self.html_parser_class()
+
+    def _document(self, html, charset):
+        parser = self._html_parser(charset)
+        if not hasattr(html, 'read'):
+            return lxml.html.document_fromstring(html, parser=parser)
+        html.seek(0)
+        root = lxml.html.parse(html, parser=parser).getroot()
+        if root is None:
+            raise ParserError('Document is empty')
+        return root
+
+    def _a_nodes(self, html, charset=None):
         try:
+            root = self._document(html, charset)
             # "d" like "$" (dollar sign, jQuery!!)
-            d = PyQuery(html.encode('utf-8'))
+            d = PyQuery(root)
         except ParserError:
             log.error('Cannot parse HTML')
             raise StopIteration()
         found_one = False
+        # checked once, not for every A node
+        debug = log.isEnabledFor(logging.DEBUG)
         for a in d(self.a_selector):
             found_one = True
-            log.debug('Found a node with href: %s', a.attrib.get('href'))
+            if debug:
+                log.debug('Found a node with href: %s', a.attrib.get('href'))
             yield a
         if not found_one:
             raise self.ZeroANodes()
+
+
+class FastParser(Parser):
+    """
+    Same results as Parser, without PyQuery.
+
+    A precompiled XPath finds the A nodes, and only their `href` and `rel`
+    attributes are looked at. The plain lxml.etree HTML parser skips the
+    per-element class lookup of lxml.html, and like it, lowercases
+    attribute names, so there is a single `rel` to check.
+    """
+    a_xpath = XPath('//a[@href]')
+    html_parser_class = lxml.etree.HTMLParser
+
+    def find_a_nodes(self, html, charset=None):
+        if self.prefilter and not self.may_link(html, charset):
+            return
+        try:
+            root = self._document(html, charset)
+        except ParserError:
+            log.error('Cannot parse HTML')
+            return
+        found_one = False
+        debug = log.isEnabledFor(logging.DEBUG)
+        for a_node, href, rel in self._links(root):
+            found_one = True
+            for domain in self._match_href(href):
+                if debug:
+                    log.debug('match: %s', href)
+                yield a_node, domain, (rel or '').lower().strip() == 'nofollow'
+        if not found_one:
+            raise self.ZeroANodes()
+
+    def _links(self, root):
+        """`(a_node, href, rel)` for every A node with a `href`."""
+        for a_node in self.a_xpath(root):
+            yield a_node, a_node.get('href'), a_node.get('rel')
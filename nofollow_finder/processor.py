@@ -6,11 +6,16 @@ from __future__ import (
     unicode_literals,
 )
 
+import collections
 import logging
-import re
 
 import lxml
 
+from nofollow_finder.dedupe import ResultIndex, canonical_url
+from nofollow_finder.stats import stats
+from nofollow_finder.stream import LinkStream
+from nofollow_finder.workers import Feed, Retry, StagedPool, WorkerPool
+
 log = logging.getLogger(__name__)
 
 
@@ -18,123 +23,399 @@ STATUS_NOT_FOUND = 'not found'
 STATUS_NOFOLLOW = 'nofollow'
 STATUS_FOLLOW = 'follow'
 STATUS_FAIL = 'Fail'
+STATUS_TOO_LARGE = 'Too large'
+STATUS_NOT_HTML = 'Not HTML'
+STATUS_HOST_DOWN = 'Host down'
 
 
-class UrlData(dict):
-    pattern = re.compile('^domain_([0-9]+)(?:_count)?$')
+class UrlData(object):
+    """
+    Result for one URL: a few fields, such as `url` and `http_response`,
+    which are read and set like dict items, and the status and link count
+    of every domain.
 
-    def __init__(self, domains, **kwargs):
-        self.domains = domains
-        self._data_keys = kwargs.keys()
-        for domain in domains:
-            self[domain] = STATUS_NOT_FOUND
-            self[self._count_key(domain)] = 0
-        super(UrlData, self).__init__(**kwargs)
+    Statuses and counts are kept in two lists in the order of `domains`,
+    which writers read as they are. `positions` maps every domain to its
+    positions in these lists, it can be shared by all the rows of a run
+    (see make_positions).
+    """
+    __slots__ = ('domains', 'positions', 'fields', 'statuses', 'counts')
 
-    def set_failure(self):
-        for domain in self.domains:
-            self[domain] = STATUS_FAIL
+    def __init__(self, domains, positions=None, **fields):
+        self.domains = domains
+        self.positions = (
+            positions if positions is not None
+            else self.make_positions(domains))
+        self.fields = fields
+        self.statuses = [STATUS_NOT_FOUND] * len(domains)
+        self.counts = [0] * len(domains)
 
     @staticmethod
-    def _count_key(domain):
-        return '{}_count'.format(domain)
+    def make_positions(domains):
+        positions = {}
+        for i, domain in enumerate(domains):
+            positions.setdefault(domain, []).append(i)
+        return positions
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+    def __setitem__(self, name, value):
+        self.fields[name] = value
+
+    def get(self, name, default=None):
+        return self.fields.get(name, default)
+
+    def status(self, domain):
+        return self.statuses[self.positions[domain][0]]
+
+    def count(self, domain):
+        return self.counts[self.positions[domain][0]]
+
+    def set_failure(self, status=STATUS_FAIL):
+        self.statuses = [status] * len(self.domains)
 
-    def inc_count(self, domain):
-        self[self._count_key(domain)] += 1
+    def inc_count(self, domain, count=1):
+        for i in self.positions[domain]:
+            self.counts[i] += count
 
     def update_status(self, domain, is_nofollow):
-        nofollow_statuses = [is_nofollow]
-        if self[domain] != STATUS_NOT_FOUND:
-            nofollow_statuses.append(self[domain] == STATUS_NOFOLLOW)
-        if all(nofollow_statuses):
-            self[domain] = STATUS_NOFOLLOW
-        else:
-            self[domain] = STATUS_FOLLOW
+        for i in self.positions[domain]:
+            status = self.statuses[i]
+            if is_nofollow and status in (STATUS_NOT_FOUND, STATUS_NOFOLLOW):
+                self.statuses[i] = STATUS_NOFOLLOW
+            else:
+                self.statuses[i] = STATUS_FOLLOW
+
+    def all_followed(self):
+        """True when every domain has a followed link."""
+        return all(status == STATUS_FOLLOW for status in self.statuses)
 
-    def add(self, domain, is_nofollow):
-        self.inc_count(domain)
+    def add(self, domain, is_nofollow, count=1):
+        """`count` links to `domain`, all of them nofollow or not."""
+        self.inc_count(domain, count)
         self.update_status(domain, is_nofollow)
 
-    def __getitem__(self, item):
-        match = self.pattern.match(item)
-        if not match:
-            return super(UrlData, self).__getitem__(item)
-        index = int(match.group(1))
-        try:
-            domain = self.domains[index]
-        except IndexError:
-            return super(UrlData, self).__getitem__(item)
-        else:
-            key = item.replace('domain_{}'.format(index), domain)
-            return super(UrlData, self).__getitem__(key)
-
-    @property
-    def data(self):
-        value = {
-            key: self[key]
-            for key in self._data_keys
+    def select(self, domains, indexes, positions=None):
+        """
+        UrlData for some of the domains, the ones at `indexes`, sharing the
+        fields of this one.
+        """
+        selected = UrlData(domains, positions)
+        selected.fields = self.fields
+        selected.statuses = [self.statuses[i] for i in indexes]
+        selected.counts = [self.counts[i] for i in indexes]
+        return selected
+
+    def results(self):
+        """Status and count for every domain, e.g. for caching."""
+        return {
+            domain: [self.statuses[i], self.counts[i]]
+            for i, domain in enumerate(self.domains)
         }
+
+    def restore(self, results):
         for i, domain in enumerate(self.domains):
-            value['domain_{}'.format(i)] = self[domain]
-            value['domain_{}_count'.format(i)] = self[self._count_key(domain)]
-        return value
+            self.statuses[i], self.counts[i] = results[domain]
 
 
 class Processor(object):
-    def __init__(self, input_csv, downloader, parser, output_csv):
+    # how many links (per worker) can be read ahead of the output
+    window_per_worker = 4
+    # longest wait before a retry, whatever the server asks for
+    max_retry_delay = 300
+    # how many more links can be read ahead while a retry waits, so that
+    # the others go on even though their rows wait for the retried one
+    retry_window = 10000
+    # wait before trying a duplicate URL again while it is being processed
+    duplicate_delay = 0.5
+
+    def __init__(self, input_csv, downloader, parser, output_csv,
+                 concurrency=1, ordered=True, feed_factory=Feed, cache=None,
+                 max_attempts=1, retry_backoff=2, stream=False,
+                 parse_pool=None, existence_only=False, parse_memo=None,
+                 journal=None, result_index=None, parse_threads=0,
+                 columns=None):
         self.input_csv = input_csv
         self.downloader = downloader
         self.parser = parser
         self.output_csv = output_csv
-        self.domains = parser.domains
+        # the domains naming the results in rows and their positions, by
+        # default those of the parser, see JobsOutput
+        if columns is None:
+            self.domains = parser.domains
+            self.positions = UrlData.make_positions(self.domains)
+        else:
+            self.domains, self.positions = columns
+        self.concurrency = concurrency
+        self.ordered = ordered
+        self.feed_factory = feed_factory
+        self.cache = cache
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.stream = stream
+        self.parse_pool = parse_pool
+        self.existence_only = existence_only
+        self.parse_memo = parse_memo
+        self.journal = journal
+        self.result_index = result_index
+        self.parse_threads = parse_threads
         self._domain_args_ = None
 
     def process(self):
         log.debug('processing')
         links = self.input_csv.links()
+        if self.journal:
+            self.journal.open()
+            links = self.journal.pending(links)
         self.output_csv.open()
+        if self.cache:
+            self.cache.open()
+        if self.parse_pool:
+            self.parse_pool.open()
+        if self.parse_memo:
+            self.parse_memo.open()
+        pool = self.make_pool()
         try:
-            for link in links:
-                url_data = self._process_link(link)
+            for url_data in pool.map(self.make_feed(links)):
                 self.output_csv.write(url_data)
+                if self.journal:
+                    self.journal.record(url_data['row'], url_data['url'])
+                    if self.journal.checkpoint_due():
+                        self.checkpoint()
         except KeyboardInterrupt:
             log.warning('interrupt received, stopping')
             return
         finally:
+            if self.journal:
+                self.checkpoint()
+                self.journal.close()
             self.output_csv.close()
+            if self.cache:
+                self.cache.close()
+            if self.parse_pool:
+                self.parse_pool.close()
+            if self.parse_memo:
+                self.parse_memo.close()
+            stats.report()
+
+    def checkpoint(self):
+        """
+        Syncs the output, then the journal, so that no row is in the
+        journal without being in the output.
+        """
+        self.output_csv.sync()
+        self.journal.sync()
+
+    def make_pool(self):
+        """
+        Pool that downloads and parses the pages in the download threads,
+        or with `parse_threads`, parses them in threads of their own.
+        """
+        if not self.parse_threads:
+            return WorkerPool(
+                self._process_link, self.concurrency, self.ordered)
+        return StagedPool([
+            (self._start, self.concurrency),
+            (self._finish, self.parse_threads),
+        ], self.ordered)
+
+    def make_feed(self, links):
+        workers = self.concurrency + self.parse_threads
+        return self.feed_factory(
+            links, window=workers * self.window_per_worker,
+            retry_window=self.retry_window)
 
     def make_url_data(self, link):
         return UrlData(
             domains=self.domains,
+            positions=self.positions,
             url=link['url'],
             http_response=0,
         )
 
     def _process_link(self, link):
+        return self._finish(self._start(link))
+
+    def _start(self, link):
+        """
+        First stage of processing a link, up to the download of its page.
+        Returns what _finish() needs to parse it: `(url_data, response,
+        sink, key)`, `response` being None if there is nothing to parse,
+        and `key` the canonical URL to store the result under, if any.
+        """
+        key = None
+        if self.result_index is not None:
+            key = canonical_url(link['url'])
+            result = self.result_index.claim(key)
+            if result is ResultIndex.PENDING:
+                # being done by another worker, come back for the result
+                raise Retry(self.duplicate_delay)
+            if result is not None:
+                return self._reuse(link, result), None, None, None
+        link['attempts'] = link.get('attempts', 0) + 1
+        try:
+            url_data, response, sink = self._download(link)
+        except Exception:
+            if key is not None:
+                self.result_index.release(key)
+            raise
+        if self.max_attempts > 1:
+            url_data['attempts'] = link['attempts']
+        if 'row' in link:
+            url_data['row'] = link['row']
+        return url_data, response, sink, key
+
+    def _finish(self, started):
+        """Second stage of processing a link: parsing its page."""
+        url_data, response, sink, key = started
+        if response is not None:
+            url = url_data['url']
+            try:
+                self._parse(url, response, url_data, sink)
+            finally:
+                response.close()
+            # counts of a page that was not read to the end are not exact,
+            # and a page that could not be parsed is not worth keeping
+            if (self.cache and not self.existence_only and
+                    STATUS_FAIL not in url_data.statuses):
+                self.cache.store(url, response, url_data.results())
+        if key is not None:
+            self.result_index.store(key, url_data, STATUS_NOT_FOUND)
+        return url_data
+
+    def _reuse(self, link, result):
+        """UrlData of a duplicate link, with the result of the first one."""
+        log.debug('duplicate url %s, reusing its result', link['url'])
+        stats.inc('duplicate urls')
+        url_data = self.make_url_data(link)
+        ResultIndex.restore(result, url_data)
+        if self.max_attempts > 1:
+            url_data['attempts'] = 0
+        if 'row' in link:
+            url_data['row'] = link['row']
+        return url_data
+
+    def retry_delay(self, attempts, retry_after=None):
+        """Exponential backoff, or longer if the server asked for it."""
+        delay = self.retry_backoff * 2 ** (attempts - 1)
+        return min(max(delay, retry_after or 0), self.max_retry_delay)
+
+    def _download(self, link):
+        """
+        `(url_data, response, sink)` for `link`, `response` being None
+        when the result is known without parsing: a failure, or a cached
+        result.
+        """
         url = link['url']
         log.debug('url %s', url)
         url_data = self.make_url_data(link)
+        cached = self.cache.lookup(url, self.domains) if self.cache else None
+        response = None
+        failure = STATUS_FAIL
         html = ''
+        sink = self.make_sink()
         # noinspection PyBroadException
         try:
-            status_code, html = self.downloader.get(url)
+            response = self.downloader.fetch(
+                url, cached.conditional_headers() if cached else None, sink)
+        except self.downloader.TooLarge:
+            failure = STATUS_TOO_LARGE
+        except self.downloader.NotHtml as e:
+            failure = STATUS_NOT_HTML
+            url_data['http_response'] = e.status_code
+        except self.downloader.HostDown:
+            failure = STATUS_HOST_DOWN
+        except self.downloader.TransientError as e:
+            if link['attempts'] < self.max_attempts:
+                delay = self.retry_delay(link['attempts'], e.retry_after)
+                log.info('will retry %s in %.1fs (%s)', url, delay, e.reason)
+                stats.inc('retries')
+                raise Retry(delay)
+            log.debug('Caught TransientError for url %s', url)
         except self.downloader.GetException:
             log.debug('Caught GetException for url %s', url)
         except Exception:
             log.error('unexpected error while downloading url %s', url)
         else:
-            url_data['http_response'] = status_code
+            if response.not_modified:
+                log.debug('not modified, using cached result for %s', url)
+                self.cache.hit(cached)
+                url_data['http_response'] = cached.status_code
+                url_data.restore(cached.results)
+                return url_data, None, sink
+            url_data['http_response'] = response.status_code
+            # a LinkStream has parsed the body already, without keeping it
+            html = response.body if sink is None else sink.size
         if not html:
-            url_data.set_failure()
-        else:
-            try:
-                a_nodes = self.parser.find_a_nodes(html)
-                for a_node, domain, has_nofollow in a_nodes:
+            url_data.set_failure(failure)
+            return url_data, None, sink
+        return url_data, response, sink
+
+    def make_sink(self):
+        """LinkStream the body is parsed into while downloading, if any."""
+        if not self.stream:
+            return None
+        return LinkStream(self.parser, self.downloader.max_body_size,
+                          stop_when_followed=self.existence_only,
+                          keep_nodes=log.isEnabledFor(logging.INFO))
+
+    def _parse(self, url, response, url_data, sink=None):
+        # a streamed body is parsed already, and not kept to be hashed
+        key = None
+        if self.parse_memo and sink is None:
+            key = self.parse_memo.key(response.body)
+            links = self.parse_memo.lookup(key)
+            if links is not None:
+                log.debug('same content as a page parsed before: %s', url)
+                self.add_links(url_data, links)
+                return
+        try:
+            if sink is not None:
+                a_nodes = sink.find_a_nodes()
+            elif self.parse_pool:
+                try:
+                    links = self.parse_pool.parse(
+                        url, response.body, response.charset,
+                        stop_when_followed=self.existence_only)
+                except self.parse_pool.TimedOut:
+                    url_data.set_failure()
+                    return
+                self.add_links(url_data, links)
+                if key:
+                    self.parse_memo.store(key, links)
+                return
+            else:
+                a_nodes = self.parser.find_a_nodes(
+                    response.body, response.charset)
+            # serialising every A node is expensive, only do it if logged
+            log_links = log.isEnabledFor(logging.INFO)
+            # domain: [count, all nofollow], for the memo
+            found = collections.OrderedDict() if key else None
+            for a_node, domain, has_nofollow in a_nodes:
+                if log_links:
                     self.log_a(url, a_node)
-                    url_data.add(domain, has_nofollow)
-            except self.parser.ZeroANodes:
-                log.error('No A nodes found on %s', url)
-        return url_data.data
+                url_data.add(domain, has_nofollow)
+                if found is not None:
+                    counts = found.setdefault(domain, [0, True])
+                    counts[0] += 1
+                    counts[1] = counts[1] and has_nofollow
+                if self.existence_only and url_data.all_followed():
+                    log.debug('all domains followed, done with %s', url)
+                    break
+            if key:
+                self.parse_memo.store(key, [
+                    (domain, count, has_nofollow)
+                    for domain, (count, has_nofollow) in found.items()
+                ])
+        except self.parser.ZeroANodes:
+            log.error('No A nodes found on %s', url)
+
+    @staticmethod
+    def add_links(url_data, links):
+        """Adds `(domain, count, nofollow)` results to `url_data`."""
+        for domain, count, has_nofollow in links:
+            url_data.add(domain, has_nofollow, count)
 
     @staticmethod
     def log_a(url, a_node):
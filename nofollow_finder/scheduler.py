@@ -0,0 +1,257 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import collections
+import heapq
+import logging
+import sys
+import threading
+import time
+
+if sys.version_info[0] < 3:
+    from urlparse import urlparse
+else:
+    from urllib.parse import urlparse
+
+from nofollow_finder.workers import Feed
+
+
+log = logging.getLogger(__name__)
+
+
+def host_of(url):
+    return urlparse(url).hostname or ''
+
+
+class RobotsCache(object):
+    """Crawl-delay from robots.txt, fetched once per host for the run."""
+    max_crawl_delay = 60
+
+    def __init__(self, downloader):
+        self.downloader = downloader
+        self._delays = {}
+        self._lock = threading.Lock()
+
+    def crawl_delay(self, url):
+        parts = urlparse(url)
+        key = (parts.scheme, parts.netloc)
+        with self._lock:
+            if key in self._delays:
+                return self._delays[key]
+        robots_url = '{}://{}/robots.txt'.format(*key)
+        try:
+            status_code, body = self.downloader.get_any(robots_url)
+        except self.downloader.GetException:
+            status_code, body = 0, ''
+        delay = 0
+        if status_code == 200:
+            delay = self.parse_crawl_delay(body.decode('utf-8', 'replace'))
+        if delay > self.max_crawl_delay:
+            log.warning('Crawl-delay of %ss for %s capped to %ss',
+                        delay, parts.netloc, self.max_crawl_delay)
+            delay = self.max_crawl_delay
+        log.debug('crawl delay for %s: %s', parts.netloc, delay)
+        with self._lock:
+            self._delays[key] = delay
+        return delay
+
+    @staticmethod
+    def parse_crawl_delay(robots_txt):
+        """Crawl-delay for the `*` user agent, 0 when not specified."""
+        delay = 0
+        applies = False
+        in_agents = False
+        for line in robots_txt.splitlines():
+            line = line.split('#', 1)[0].strip()
+            if ':' not in line:
+                continue
+            key, value = [part.strip() for part in line.split(':', 1)]
+            key = key.lower()
+            if key == 'user-agent':
+                if not in_agents:
+                    applies = False
+                in_agents = True
+                applies = applies or value == '*'
+                continue
+            in_agents = False
+            if applies and key == 'crawl-delay':
+                try:
+                    delay = float(value)
+                except ValueError:
+                    log.debug('invalid Crawl-delay: %s', value)
+        return delay
+
+
+class _Host(object):
+    # `ready` is None until robots.txt is checked, False while it is being
+    # checked and True afterwards
+    def __init__(self, delay, ready=True):
+        self.active = 0
+        self.delay = delay
+        self.next_time = 0
+        self.ready = ready
+
+
+class HostScheduler(Feed):
+    """
+    Feed that hands out links so that no host is hammered.
+
+    Links are read ahead (up to `window`) and grouped by host. With
+    `lookahead`, for unordered output only, up to that many links wait
+    grouped by host and only the links handed out and not yet released
+    count against `window`, so that input sorted by host can still be
+    interleaved. A link is only handed out when its host has fewer than
+    `host_concurrency` downloads running and at least 1/`host_rate`
+    seconds (or the host's robots.txt Crawl-delay, if `robots` is given)
+    have passed since the previous one. Among the hosts that are ready,
+    the one with the oldest pending link goes first, so hosts are
+    interleaved while the output order is disturbed as little as
+    possible.
+
+    Hosts that can be picked are kept in a heap by their oldest pending
+    link, and the ones waiting for their delay in a heap by the time it
+    is over, so that there can be many thousands of hosts. Entries are
+    not removed when a host changes, they are checked when they come up.
+    """
+
+    def __init__(self, items, window, host_concurrency=0, host_rate=0,
+                 robots=None, lookahead=0, retry_window=0):
+        super(HostScheduler, self).__init__(items, window, retry_window)
+        self.host_concurrency = host_concurrency
+        self.delay = 1 / host_rate if host_rate else 0
+        self.robots = robots
+        self.lookahead = lookahead
+        self._pending = {}
+        self._queued = 0  # links in _pending
+        self._hosts = {}
+        self._ready = []  # heap of (index of the oldest link, host)
+        self._timers = []  # heap of (next time, host)
+
+    def get(self):
+        with self._cond:
+            while True:
+                now = time.time()
+                self._refill(now)
+                host = self._pick(now) if self._has_slot() else None
+                if host is not None:
+                    break
+                if self._exhausted and not (self._pending or self._retries):
+                    raise StopIteration()
+                self._cond.wait(self._wait_time(now))
+            index, link = self._pending[host].popleft()
+            if not self._pending[host]:
+                del self._pending[host]
+            self._queued -= 1
+            if self.lookahead:
+                self._taken += 1
+            state = self._hosts[host]
+            state.active += 1
+            state.next_time = now + state.delay
+            check_robots = self.robots is not None and state.ready is None
+            if check_robots:
+                state.ready = False
+            self._schedule(host, now)
+        if check_robots:
+            self._check_robots(host, link['url'])
+        return index, link
+
+    def done(self, item):
+        host = host_of(item['url'])
+        with self._cond:
+            self._hosts[host].active -= 1
+            self._schedule(host, time.time())
+            self._cond.notify_all()
+
+    def _refill(self, now):
+        while True:
+            item = self._pop_retry(now)
+            if item is not None and self.lookahead:
+                # taken again when it is handed out
+                self._taken -= 1
+            elif item is None:
+                item = self._read_ahead()
+            if item is None:
+                return
+            self._add(now, *item)
+
+    def _read_ahead(self):
+        if not self.lookahead:
+            return self._next_item()
+        if self._queued >= self.lookahead:
+            return None
+        return self._read_item()
+
+    def _has_slot(self):
+        return not self.lookahead or self._taken < self._slots()
+
+    def _add(self, now, index, link):
+        host = host_of(link['url'])
+        if host not in self._hosts:
+            ready = None if self.robots is not None else True
+            self._hosts[host] = _Host(self.delay, ready)
+        links = self._pending.setdefault(host, collections.deque())
+        links.append((index, link))
+        self._queued += 1
+        if len(links) == 1:
+            self._schedule(host, now)
+
+    def _schedule(self, host, now):
+        """
+        Puts `host` in the heap it belongs to, if it has pending links.
+        Hosts that are busy, or checking robots.txt, are put back by
+        done() or _check_robots().
+        """
+        links = self._pending.get(host)
+        if not links:
+            return
+        state = self._hosts[host]
+        if state.ready is False or self._busy(state):
+            return
+        if state.next_time > now:
+            heapq.heappush(self._timers, (state.next_time, host))
+        else:
+            heapq.heappush(self._ready, (links[0][0], host))
+
+    def _busy(self, state):
+        return bool(self.host_concurrency) and (
+            state.active >= self.host_concurrency)
+
+    def _pick(self, now):
+        while self._timers and self._timers[0][0] <= now:
+            self._schedule(heapq.heappop(self._timers)[1], now)
+        while self._ready:
+            index, host = heapq.heappop(self._ready)
+            links = self._pending.get(host)
+            # entries of hosts that changed since are skipped
+            if not links or links[0][0] != index:
+                continue
+            state = self._hosts[host]
+            if state.ready is False or self._busy(state):
+                continue
+            if state.next_time > now:
+                heapq.heappush(self._timers, (state.next_time, host))
+                continue
+            return host
+        return None
+
+    def _wait_time(self, now):
+        waits = [self._timers[0][0] - now] if self._timers else []
+        if self._retries:
+            waits.append(self._retries[0][0] - now)
+        # a timeout also keeps Ctrl+C working on Python 2
+        return max(min(waits + [1]), 0)
+
+    def _check_robots(self, host, url):
+        crawl_delay = self.robots.crawl_delay(url)
+        with self._cond:
+            state = self._hosts[host]
+            state.delay = max(state.delay, crawl_delay)
+            state.next_time = time.time() + state.delay
+            state.ready = True
+            self._schedule(host, time.time())
+            self._cond.notify_all()
@@ -0,0 +1,112 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import csv
+import heapq
+import logging
+import sys
+import zlib
+
+from nofollow_finder.output_csv import OutputCSV
+from nofollow_finder.scheduler import host_of
+
+
+log = logging.getLogger(__name__)
+
+
+def shard_of(url, count):
+    """
+    Shard of `url`, from 0 to `count` - 1, the same for all the URLs of a
+    host and on every machine.
+    """
+    host = host_of(url).rstrip('.')
+    return (zlib.crc32(host.encode('utf-8')) & 0xffffffff) % count
+
+
+class ShardInput(object):
+    """
+    Input that only has the links of `input_csv` in shard `index` of
+    `count`. Links are numbered in the whole input, as their `row` item,
+    so that the outputs of the shards can be merged in input order.
+    """
+
+    def __init__(self, input_csv, index, count):
+        self.input_csv = input_csv
+        self.index = index
+        self.count = count
+
+    def links(self):
+        kept = 0
+        for row, link in enumerate(self.input_csv.links()):
+            if shard_of(link['url'], self.count) != self.index:
+                continue
+            link['row'] = row
+            kept += 1
+            yield link
+        log.info('%d URLs in shard %d of %d',
+                 kept, self.index + 1, self.count)
+
+
+def _shard_rows(path, reader):
+    # (input row, rest of the row) of every row, checking that the rows
+    # are in input order
+    previous = -1
+    for line_number, row in enumerate(reader, start=2):
+        number = int(row[-1])
+        if number <= previous:
+            raise ValueError(
+                '{} line {}: rows are not in input order, was it written '
+                'with -U?'.format(path, line_number))
+        previous = number
+        yield number, row[:-1]
+
+
+def merge_shards(paths, out_file=None, overwrite=True, header=True):
+    """
+    Merges the CSV outputs of shards, written with an `input row` column,
+    into one, in input order and without that column. Rows are read and
+    written one at a time.
+
+    Raises ValueError if the files are not shard outputs, or are not in
+    input order.
+    """
+    files = [open(path, 'rb') for path in paths]
+    out = (open(out_file, 'wb' if overwrite else 'ab') if out_file
+           else sys.stdout)
+    try:
+        readers = []
+        header_row = None
+        for path, fh in zip(paths, files):
+            reader = csv.reader(fh)
+            first = next(reader, None)
+            if first is None:
+                continue
+            if first[-1] != OutputCSV.ROW_HEADER:
+                raise ValueError(
+                    '{} has no "{}" column, it has to be written with '
+                    '--shard and a header row'.format(
+                        path, OutputCSV.ROW_HEADER))
+            if header_row is None:
+                header_row = first
+            elif first != header_row:
+                raise ValueError('{} has other columns than {}'.format(
+                    path, paths[0]))
+            readers.append(_shard_rows(path, reader))
+        writer = csv.writer(out)
+        if header and header_row:
+            writer.writerow(header_row[:-1])
+        written = 0
+        for _, row in heapq.merge(*readers):
+            writer.writerow(row)
+            written += 1
+        log.info('%d rows merged from %d files', written, len(paths))
+    finally:
+        for fh in files:
+            fh.close()
+        if out_file:
+            out.close()
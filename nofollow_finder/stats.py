@@ -0,0 +1,51 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import collections
+import logging
+import threading
+
+
+log = logging.getLogger(__name__)
+
+
+class Stats(object):
+    """Counters collected during a run and logged at the end of it."""
+
+    def __init__(self):
+        self._counters = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def __getitem__(self, name):
+        return self._counters.get(name, 0)
+
+    def rate(self, part, whole):
+        """Percentage of counter `part` in counter `whole`."""
+        if not self[whole]:
+            return 0
+        return 100 * self[part] / self[whole]
+
+    def items(self):
+        """`(name, value)` of every counter."""
+        with self._lock:
+            return list(self._counters.items())
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+    def report(self):
+        for name, value in self._counters.items():
+            log.info('stats: %s: %s', name, value)
+
+
+stats = Stats()
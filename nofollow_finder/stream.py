@@ -0,0 +1,116 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import copy
+import logging
+
+import lxml.etree
+
+from nofollow_finder.body import BodyTooLarge
+
+
+log = logging.getLogger(__name__)
+
+
+class LinkStream(object):
+    """
+    Finds the links to the domains of `parser` while the body is being
+    downloaded, without keeping the body or the document tree.
+
+    It is used by the downloader in place of a BodyBuffer: chunks written
+    to it are fed to an lxml pull parser, A nodes are picked up as soon as
+    they are complete, and every element is dropped from the tree once it
+    has been seen. Memory use depends on the nesting of the page, not on
+    its size.
+
+    With `stop_when_followed`, the download is stopped (see BodyBuffer)
+    as soon as every domain has a followed link. Without `keep_nodes`, the
+    links found have None instead of a copy of their A node.
+    """
+
+    def __init__(self, parser, max_size=None, stop_when_followed=False,
+                 keep_nodes=True):
+        self.parser = parser
+        self.max_size = max_size
+        self.stop_when_followed = stop_when_followed
+        self.keep_nodes = keep_nodes
+        self.charset = None
+        self.size = 0
+        self.a_nodes = 0
+        self.links = []
+        self.complete = False
+        self._pull_parser = None
+        self._unfollowed = set(parser.domains)
+
+    def start(self, charset):
+        """Charset declared by the server, when known before the body."""
+        self.charset = charset
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_size and self.size > self.max_size:
+            raise BodyTooLarge(self.size)
+        if self._pull_parser is None:
+            self._pull_parser = self._make_pull_parser()
+        self._pull_parser.feed(chunk)
+        self._read_events()
+        if self.stop_when_followed and not self._unfollowed:
+            self.complete = True
+            raise StopIteration()
+
+    def getvalue(self):
+        """Ends the document. The body itself is not kept."""
+        if self._pull_parser is not None:
+            try:
+                self._pull_parser.close()
+            except lxml.etree.XMLSyntaxError:
+                log.debug('HTML ended abruptly')
+            self._read_events()
+            self._pull_parser = None
+        return b''
+
+    def close(self):
+        self._pull_parser = None
+
+    def find_a_nodes(self):
+        """Same as Parser.find_a_nodes, for the body streamed so far."""
+        if not self.a_nodes and self.size:
+            raise self.parser.ZeroANodes()
+        return iter(self.links)
+
+    def _make_pull_parser(self):
+        try:
+            return lxml.etree.HTMLPullParser(
+                events=('end',), encoding=self.charset)
+        except LookupError:
+            log.debug('unknown charset: %s', self.charset)
+            return lxml.etree.HTMLPullParser(events=('end',))
+
+    def _read_events(self):
+        for event, element in self._pull_parser.read_events():
+            if element.tag == 'a':
+                self._a_node(element)
+            # the element is complete, drop what is no longer needed
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    def _a_node(self, element):
+        href = element.get('href')
+        if href is None:
+            return
+        self.a_nodes += 1
+        domains = self.parser._match_href(href)
+        if domains:
+            nofollow = self.parser._is_nofollow(element)
+            if not nofollow:
+                self._unfollowed.difference_update(domains)
+            # a copy, for logging, as the original is about to be cleared
+            node = copy.deepcopy(element) if self.keep_nodes else None
+            for domain in domains:
+                self.links.append((node, domain, nofollow))
@@ -0,0 +1,56 @@
+#  coding=utf-8
+import logging
+import threading
+import unittest
+
+from mock import mock
+
+from nofollow_finder.async_log import AsyncHandler
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+        self.threads.add(threading.current_thread())
+
+
+class AsyncHandlerTests(unittest.TestCase):
+    def setUp(self):
+        self.target = RecordingHandler()
+        self.handler = AsyncHandler(self.target)
+        self.log = logging.getLogger('nofollow_finder.tests.async')
+        self.log.propagate = False
+        self.log.setLevel(logging.INFO)
+        self.log.addHandler(self.handler)
+
+    def tearDown(self):
+        self.log.removeHandler(self.handler)
+        self.handler.close()
+
+    def test_written_in_background(self):
+        for i in range(100):
+            self.log.info('message %d', i)
+        self.handler.close()
+        self.assertEqual(
+            ['message {}'.format(i) for i in range(100)],
+            self.target.messages)
+        self.assertNotIn(threading.current_thread(), self.target.threads)
+
+    def test_level(self):
+        self.target.setLevel(logging.WARNING)
+        self.log.info('skipped')
+        self.log.warning('written')
+        self.handler.close()
+        self.assertEqual(['written'], self.target.messages)
+
+    @mock.patch('os.getpid')
+    def test_forked(self, p_getpid):
+        p_getpid.return_value = -1
+        self.log.info('direct')
+        self.assertEqual(['direct'], self.target.messages)
+        self.assertEqual({threading.current_thread()}, self.target.threads)
@@ -0,0 +1,30 @@
+#  coding=utf-8
+import mmap
+import unittest
+
+from nofollow_finder import body
+
+
+class BodyBufferTests(unittest.TestCase):
+
+    def test_in_memory(self):
+        buffer_ = body.BodyBuffer(max_size=10, spill_size=10)
+        buffer_.write(b'12345')
+        buffer_.write(b'67890')
+        self.assertEqual(b'1234567890', buffer_.getvalue())
+        self.assertEqual(10, buffer_.size)
+
+    def test_too_large(self):
+        buffer_ = body.BodyBuffer(max_size=8)
+        buffer_.write(b'12345')
+        with self.assertRaises(body.BodyTooLarge):
+            buffer_.write(b'67890')
+
+    def test_spill(self):
+        buffer_ = body.BodyBuffer(spill_size=4)
+        buffer_.write(b'12345')
+        buffer_.write(b'67890')
+        value = buffer_.getvalue()
+        self.assertIsInstance(value, mmap.mmap)
+        self.assertEqual(b'1234567890', value[:])
+        value.close()
@@ -0,0 +1,69 @@
+#  coding=utf-8
+import unittest
+
+from mock import mock
+
+from nofollow_finder import downloader
+from nofollow_finder.breaker import CircuitBreaker
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(threshold=2, cooldown=60)
+
+    def test_opens_after_threshold(self):
+        for _ in range(2):
+            self.assertTrue(self.breaker.allow('http://a.com/1'))
+            self.breaker.record('http://a.com/1', failed=True)
+        self.assertFalse(self.breaker.allow('http://a.com/2'))
+        self.assertTrue(self.breaker.allow('http://b.com/1'))
+
+    def test_success_resets(self):
+        self.breaker.record('http://a.com/1', failed=True)
+        self.breaker.record('http://a.com/2', failed=False)
+        self.breaker.record('http://a.com/3', failed=True)
+        self.assertTrue(self.breaker.allow('http://a.com/4'))
+
+    @mock.patch('nofollow_finder.breaker.time')
+    def test_half_open(self, p_time):
+        p_time.time.return_value = 1000
+        self.breaker.record('http://a.com/1', failed=True)
+        self.breaker.record('http://a.com/2', failed=True)
+        p_time.time.return_value = 1061
+        self.assertTrue(self.breaker.allow('http://a.com/3'))
+        # only one probe at a time
+        self.assertFalse(self.breaker.allow('http://a.com/4'))
+        self.breaker.record('http://a.com/3', failed=True)
+        self.assertFalse(self.breaker.allow('http://a.com/4'))
+        p_time.time.return_value = 1122
+        self.assertTrue(self.breaker.allow('http://a.com/4'))
+        self.breaker.record('http://a.com/4', failed=False)
+        self.assertTrue(self.breaker.allow('http://a.com/5'))
+        self.assertTrue(self.breaker.allow('http://a.com/6'))
+
+
+class DownloaderBreakerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(threshold=2, cooldown=60)
+        self.d = downloader.Downloader(breaker=self.breaker)
+
+    @mock.patch('nofollow_finder.downloader.command')
+    def test_host_down(self, p_command):
+        p_command.run.return_value = (28, b'', b'')
+        for _ in range(2):
+            with self.assertRaises(self.d.TransientError):
+                self.d.fetch('http://a.com/')
+        with self.assertRaises(self.d.HostDown):
+            self.d.fetch('http://a.com/other')
+        self.assertEqual(2, p_command.run.call_count)
+
+    @mock.patch('nofollow_finder.downloader.command')
+    def test_status_is_not_a_failure(self, p_command):
+        p_command.run.return_value = (
+            0, b'HTTP/1.1 503 Unavailable\r\n\r\n\n503 0', b'')
+        for _ in range(3):
+            with self.assertRaises(self.d.TransientError):
+                self.d.fetch('http://a.com/')
+        self.assertEqual(3, p_command.run.call_count)
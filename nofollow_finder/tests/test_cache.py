@@ -0,0 +1,62 @@
+#  coding=utf-8
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import mock
+
+from nofollow_finder import cache
+from nofollow_finder.downloader import Response
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = cache.ResponseCache(
+            os.path.join(self.tmp_dir, 'cache.db'), max_entries=2)
+        self.cache.open()
+        self.results = {'twitter.com': ['follow', 2]}
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_store_lookup(self):
+        response = Response(200, '', {'ETag': '"a"'})
+        self.cache.store('http://x.com/', response, self.results)
+        entry = self.cache.lookup('http://x.com/', ['twitter.com'])
+        self.assertEqual(self.results, entry.results)
+        self.assertEqual(200, entry.status_code)
+        self.assertEqual(
+            {'If-None-Match': '"a"'}, entry.conditional_headers())
+
+    def test_no_validators(self):
+        self.cache.store('http://x.com/', Response(200, ''), self.results)
+        self.assertIsNone(self.cache.lookup('http://x.com/', ['twitter.com']))
+
+    def test_other_domains(self):
+        response = Response(200, '', {'Last-Modified': 'yesterday'})
+        self.cache.store('http://x.com/', response, self.results)
+        self.assertIsNone(self.cache.lookup(
+            'http://x.com/', ['twitter.com', 'facebook.com']))
+
+    def test_evict_max_entries(self):
+        response = Response(200, '', {'ETag': '"a"'})
+        for i in range(3):
+            self.cache.store('http://x.com/{}'.format(i), response,
+                             self.results)
+            time.sleep(0.01)
+        self.cache.evict()
+        self.assertIsNone(self.cache.lookup('http://x.com/0', []))
+        self.assertIsNotNone(self.cache.lookup('http://x.com/2', []))
+
+    @mock.patch('nofollow_finder.cache.time')
+    def test_evict_max_age(self, p_time):
+        p_time.time.return_value = 0
+        response = Response(200, '', {'ETag': '"a"'})
+        self.cache.store('http://x.com/', response, self.results)
+        p_time.time.return_value = 31 * 24 * 60 * 60
+        self.cache.evict()
+        self.assertIsNone(self.cache.lookup('http://x.com/', []))
@@ -5,6 +5,7 @@ from docopt import DocoptExit
 from mock import mock
 
 from nofollow_finder import __main__ as main
+from nofollow_finder.jobs import Job
 
 
 class CLITests(unittest.TestCase):
@@ -20,6 +21,35 @@ class CLITests(unittest.TestCase):
             'verbosity': 3,
             'modes': [],
             'settings_file': u'.nofollowfinderrc,~/.nofollowfinderrc',
+            'backend': None,
+            'concurrency': 1,
+            'ordered': True,
+            'host_concurrency': 2,
+            'host_rate': 0,
+            'robots': False,
+            'cache': None,
+            'max_body_size': 0,
+            'spill_size': 0,
+            'html_only': False,
+            'max_attempts': 1,
+            'retry_backoff': 2,
+            'host_failures': 0,
+            'host_cooldown': 300,
+            'parser_engine': 'pyquery',
+            'prefilter': True,
+            'stream': False,
+            'parse_workers': 0,
+            'existence_only': False,
+            'async_log': False,
+            'jobs': None,
+            'parse_memo': None,
+            'journal': None,
+            'resume': False,
+            'dedupe': False,
+            'db_file': None,
+            'stale_days': None,
+            'shard': None,
+            'parse_threads': 0,
         }
 
     @mock.patch('nofollow_finder.__main__.main')
@@ -41,6 +71,67 @@ class CLITests(unittest.TestCase):
         main.run_from_cli()
         p_main.assert_called_once_with(**expected)
 
+    @mock.patch('nofollow_finder.__main__.load_domains')
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_domains_file(self, p_sys, p_main, p_load_domains):
+        p_sys.argv = ['script.py', '-D', 'domains.txt']
+        p_load_domains.return_value = ['example.com', 'example.net']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com', 'example.net']
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+        p_load_domains.assert_called_once_with('domains.txt')
+
+    @mock.patch('os.path.isfile')
+    @mock.patch('nofollow_finder.__main__.load_jobs')
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_jobs(self, p_sys, p_main, p_load_jobs, p_isfile):
+        p_sys.argv = ['script.py', '-J', 'jobs.txt', '-a']
+        p_isfile.side_effect = lambda path: path == 'b.csv'
+        loaded = [
+            Job('a.csv', ['example.com', 'example.net']),
+            Job('b.csv', ['example.org', 'example.com']),
+        ]
+        p_load_jobs.return_value = loaded
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com', 'example.net', 'example.org']
+        expected['jobs'] = loaded
+        expected['overwrite'] = False
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+        self.assertEqual([True, False], [job.header for job in loaded])
+        p_load_jobs.assert_called_once_with('jobs.txt')
+
+    @mock.patch('os.path.isfile')
+    @mock.patch('nofollow_finder.__main__.load_jobs')
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_jobs_output_exists(self, p_sys, p_main, p_load_jobs, p_isfile):
+        p_sys.argv = ['script.py', '-J', 'jobs.txt']
+        p_isfile.return_value = True
+        p_load_jobs.return_value = [Job('a.csv', ['example.com'])]
+        with self.assertRaisesRegexp(DocoptExit, 'a.csv already exists'):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_jobs_with_output(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-J', 'jobs.txt', '-o', 'out.csv']
+        with self.assertRaisesRegexp(DocoptExit, 'not with -o'):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_domains_file_missing(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-D', '/no/such/domains.txt']
+        with self.assertRaisesRegexp(DocoptExit, 'Cannot read domains file'):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
     @mock.patch('nofollow_finder.__main__.main')
     @mock.patch('docopt.sys')
     def test_verbosity_and_input(self, p_sys, p_main):
@@ -266,6 +357,34 @@ class CLITests(unittest.TestCase):
             main.run_from_cli()
         p_main.assert_not_called()
 
+    @mock.patch('nofollow_finder.__main__.os.path.isfile')
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_resume(self, p_sys, p_main, p_isfile):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com', '--out', 'out.csv',
+            '--journal', 'out.journal', '--resume',
+        ]
+        p_isfile.return_value = True
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['out_file'] = 'out.csv'
+        expected['header'] = False
+        expected['overwrite'] = False
+        expected['journal'] = 'out.journal'
+        expected['resume'] = True
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_resume_without_journal(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com', '--out', 'out.csv', '--resume']
+        with self.assertRaisesRegexp(DocoptExit, 'needs --journal'):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
     @mock.patch('nofollow_finder.__main__.main')
     @mock.patch('docopt.sys')
     def test_yesheader_noheader_omg_what(self, p_sys, p_main):
@@ -279,6 +398,386 @@ class CLITests(unittest.TestCase):
         p_main.assert_not_called()
 
 
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_backend(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com',
+            '--backend', 'POOL',
+        ]
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['backend'] = 'pool'
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_backend_invalid(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com',
+            '--backend', 'wget',
+        ]
+        msg = 'Backend not one of: curl, pool'
+        with self.assertRaisesRegexp(DocoptExit, msg):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_concurrency_unordered(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com',
+            '-C', '20', '--unordered',
+        ]
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['concurrency'] = 20
+        expected['ordered'] = False
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_concurrency_0(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com',
+            '--concurrency', '0',
+        ]
+        msg = 'Concurrency has to be between 1 and 200.'
+        with self.assertRaisesRegexp(DocoptExit, msg):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_politeness(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com',
+            '--host-concurrency', '4', '--host-rate', '0.5', '--robots',
+        ]
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['host_concurrency'] = 4
+        expected['host_rate'] = 0.5
+        expected['robots'] = True
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_host_rate_negative(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com',
+            '--host-rate', '-1',
+        ]
+        msg = 'Host rate has to be 0 or greater.'
+        with self.assertRaisesRegexp(DocoptExit, msg):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_cache(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com',
+            '--cache', 'cache.db', '--cache-max-age', '7',
+        ]
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['cache'] = {
+            'path': 'cache.db',
+            'max_age': 7,
+            'max_entries': 1000000,
+        }
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_body_sizes(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com',
+            '--max-body-bytes', '20M', '--spill-bytes', '512k',
+        ]
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['max_body_size'] = 20 * 1024 * 1024
+        expected['spill_size'] = 512 * 1024
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_html_only(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--html-only']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['html_only'] = True
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_retries(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com',
+            '--max-attempts', '3', '--retry-backoff', '0.5',
+        ]
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['max_attempts'] = 3
+        expected['retry_backoff'] = 0.5
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_max_attempts_invalid(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--max-attempts', '0']
+        with self.assertRaisesRegexp(DocoptExit, 'Max attempts has to be 1'):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_host_failures(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com',
+            '--host-failures', '3', '--host-cooldown', '60',
+        ]
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['host_failures'] = 3
+        expected['host_cooldown'] = 60
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_parser_engine(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--parser', 'FAST']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['parser_engine'] = 'fast'
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_parser_engine_invalid(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--parser', 'regex']
+        with self.assertRaisesRegexp(DocoptExit, 'Parser not one of'):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_no_prefilter(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--no-prefilter']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['prefilter'] = False
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_stream(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--stream']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['stream'] = True
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_parse_workers(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--parse-workers=4']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['parse_workers'] = 4
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_parse_workers_with_stream(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com', '--parse-workers=4', '--stream']
+        with self.assertRaises(DocoptExit):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_parse_memo(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com', '--parse-memo=500',
+            '--parse-memo-file=memo.db']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['parse_memo'] = {'max_entries': 500, 'path': 'memo.db'}
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_parse_memo_file_only(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com', '--parse-memo-file=memo.db']
+        with self.assertRaisesRegexp(DocoptExit, 'needs --parse-memo'):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_dedupe(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--dedupe']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['dedupe'] = True
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_db(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com', '--db', 'results.db',
+            '--stale-days', '30']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['db_file'] = 'results.db'
+        expected['stale_days'] = 30
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_db_with_output(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com', '--db', 'results.db',
+            '-o', 'out.csv']
+        with self.assertRaises(DocoptExit):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_stale_days_without_db(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--stale-days', '30']
+        with self.assertRaisesRegexp(DocoptExit, 'needs --db'):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_shard(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--shard', '2/4']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['shard'] = (1, 4)
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_shard_invalid(self, p_sys, p_main):
+        for shard in ('0/4', '5/4', '2', 'a/b'):
+            p_sys.argv = ['script.py', '-d', 'example.com', '--shard', shard]
+            with self.assertRaises(DocoptExit):
+                main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_shard_unordered(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com', '--shard', '2/4', '-U']
+        with self.assertRaises(DocoptExit):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('os.path.isfile')
+    @mock.patch('nofollow_finder.__main__.merge_shards')
+    @mock.patch('nofollow_finder.__main__._configure_log')
+    @mock.patch('docopt.sys')
+    def test_merge(self, p_sys, p_log, p_merge_shards, p_isfile):
+        p_sys.argv = ['script.py', 'merge', 'a.csv', 'b.csv', '-o', 'out.csv']
+        p_isfile.side_effect = lambda path: path != 'out.csv'
+        main.run_from_cli()
+        p_merge_shards.assert_called_once_with(
+            ['a.csv', 'b.csv'], 'out.csv', True, True)
+
+    @mock.patch('os.path.isfile')
+    @mock.patch('nofollow_finder.__main__.merge_shards')
+    @mock.patch('nofollow_finder.__main__.log')
+    @mock.patch('nofollow_finder.__main__._configure_log')
+    @mock.patch('docopt.sys')
+    def test_merge_error(self, p_sys, p_configure_log, p_log, p_merge_shards,
+                         p_isfile):
+        p_sys.argv = ['script.py', 'merge', 'a.csv', 'b.csv', '-o', 'out.csv']
+        p_isfile.side_effect = lambda path: path != 'out.csv'
+        p_merge_shards.side_effect = ValueError('a.csv has no column')
+        with self.assertRaises(SystemExit) as cm:
+            main.run_from_cli()
+        self.assertEqual(1, cm.exception.code)
+        p_log.error.assert_called_once()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_parse_threads(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--parse-threads=2']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['parse_threads'] = 2
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_parse_threads_with_stream(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com', '--parse-threads=2', '--stream']
+        with self.assertRaises(DocoptExit):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_existence_only(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--existence-only']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['existence_only'] = True
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_async_log(self, p_sys, p_main):
+        p_sys.argv = ['script.py', '-d', 'example.com', '--async-log']
+        expected = self.defaults.copy()
+        expected['domains'] = ['example.com']
+        expected['async_log'] = True
+        main.run_from_cli()
+        p_main.assert_called_once_with(**expected)
+
+    @mock.patch('nofollow_finder.__main__.main')
+    @mock.patch('docopt.sys')
+    def test_body_size_invalid(self, p_sys, p_main):
+        p_sys.argv = [
+            'script.py', '-d', 'example.com',
+            '--max-body-bytes', 'lots',
+        ]
+        msg = 'Max body bytes has to be a number'
+        with self.assertRaisesRegexp(DocoptExit, msg):
+            main.run_from_cli()
+        p_main.assert_not_called()
+
+
 class TestMain(unittest.TestCase):
 
     @mock.patch('nofollow_finder.__main__.InputCSV')
@@ -297,7 +796,8 @@ class TestMain(unittest.TestCase):
         )
         p_input.assert_called_once_with('in_file.csv')
         p_output.assert_called_once_with(
-            'out_file.csv', ['example.com'], True, False)
+            'out_file.csv', ['example.com'], True, False, attempts=False,
+            rows=False)
         p_downloader.assert_called_once_with(follow_redirects=True, timeout=2)
         p_parser.assert_called_once_with(['example.com'])
         p_processor.assert_called_once_with(
@@ -305,6 +805,20 @@ class TestMain(unittest.TestCase):
             p_downloader.return_value,
             p_parser.return_value,
             p_output.return_value,
+            concurrency=1,
+            ordered=True,
+            feed_factory=main.Feed,
+            cache=None,
+            max_attempts=1,
+            retry_backoff=2,
+            stream=False,
+            parse_pool=None,
+            existence_only=False,
+            parse_memo=None,
+            journal=None,
+            result_index=None,
+            parse_threads=0,
+            columns=None,
         )
         p_processor.return_value.process.assert_called_once_with()
         p_log.debug.assert_called()
@@ -326,7 +840,8 @@ class TestMain(unittest.TestCase):
         )
         p_input.assert_called_once_with('in_file.csv')
         p_output.assert_called_once_with(
-            'out_file.csv', ['example.com'], True, False)
+            'out_file.csv', ['example.com'], True, False, attempts=False,
+            rows=False)
         p_downloader.assert_called_once_with(follow_redirects=True, timeout=2)
         p_parser.assert_called_once_with(['example.com'])
         p_processor.assert_called_once_with(
@@ -334,8 +849,40 @@ class TestMain(unittest.TestCase):
             p_downloader.return_value,
             p_parser.return_value,
             p_output.return_value,
+            concurrency=1,
+            ordered=True,
+            feed_factory=main.Feed,
+            cache=None,
+            max_attempts=1,
+            retry_backoff=2,
+            stream=False,
+            parse_pool=None,
+            existence_only=False,
+            parse_memo=None,
+            journal=None,
+            result_index=None,
+            parse_threads=0,
+            columns=None,
         )
         p_processor.return_value.process.assert_called_once_with()
         p_log.debug.assert_called()
         p_log.error.assert_called_once_with('Sample error message')
         p_log.critical.assert_called_once_with('Sample critical message')
+
+    @mock.patch('nofollow_finder.__main__.InputCSV')
+    @mock.patch('nofollow_finder.__main__.OutputCSV')
+    @mock.patch('nofollow_finder.__main__.PooledDownloader')
+    @mock.patch('nofollow_finder.__main__.Parser')
+    @mock.patch('nofollow_finder.__main__.Processor')
+    @mock.patch('nofollow_finder.__main__.log')
+    def test_main_pool_backend(
+            self, p_log, p_processor, p_parser, p_downloader, p_output,
+            p_input):
+        main.main(
+            'in_file.csv', ['example.com'], 'log_file.log', 'out_file.csv',
+            overwrite=True, header=False, verbosity=3, redirect=False,
+            timeout=2, settings_file=False, modes=[], backend='pool',
+        )
+        p_downloader.assert_called_once_with(
+            follow_redirects=False, timeout=2, pool_size=1)
+        p_processor.return_value.process.assert_called_once_with()
@@ -0,0 +1,68 @@
+#  coding=utf-8
+import unittest
+
+from nofollow_finder.dedupe import ResultIndex, canonical_url
+from nofollow_finder.processor import UrlData
+
+
+class CanonicalUrlTests(unittest.TestCase):
+    def test_same(self):
+        for url in [
+            'http://www.x.com/a',
+            'HTTP://WWW.X.COM/a',
+            'http://www.x.com:80/a',
+            'http://www.x.com/a/',
+            'http://www.x.com/a#top',
+            'http://www.x.com/a?utm_source=x&utm_medium=y',
+            'http://www.x.com/a?gclid=1',
+        ]:
+            self.assertEqual('http://www.x.com/a', canonical_url(url), url)
+
+    def test_different(self):
+        for url in [
+            'http://www.x.com/A',
+            'https://www.x.com/a',
+            'http://www.x.com:8080/a',
+            'http://www.x.com/a?page=2',
+        ]:
+            self.assertNotEqual('http://www.x.com/a', canonical_url(url), url)
+
+    def test_query(self):
+        self.assertEqual(
+            'http://x.com/?b=2&a=%C3%A9',
+            canonical_url('http://x.com?utm_campaign=z&b=2&a=%C3%A9'))
+
+    def test_root(self):
+        self.assertEqual('http://x.com/', canonical_url('http://x.com'))
+
+
+class ResultIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = ResultIndex()
+        self.domains = ['twitter.com', 'facebook.com']
+
+    def test_claim(self):
+        self.assertIsNone(self.index.claim('a'))
+        self.assertIs(ResultIndex.PENDING, self.index.claim('a'))
+        self.index.release('a')
+        self.assertIsNone(self.index.claim('a'))
+
+    def test_store_restore(self):
+        self.index.claim('a')
+        url_data = UrlData(self.domains, http_response=200)
+        url_data.add('facebook.com', True, 3)
+        self.index.store('a', url_data, 'not found')
+        restored = UrlData(self.domains, http_response=0)
+        ResultIndex.restore(self.index.claim('a'), restored)
+        self.assertEqual(200, restored['http_response'])
+        self.assertEqual(['not found', 'nofollow'], restored.statuses)
+        self.assertEqual([0, 3], restored.counts)
+
+    def test_failure(self):
+        self.index.claim('a')
+        url_data = UrlData(self.domains, http_response=0)
+        url_data.set_failure('Too large')
+        self.index.store('a', url_data, 'not found')
+        restored = UrlData(self.domains, http_response=0)
+        ResultIndex.restore(self.index.claim('a'), restored)
+        self.assertEqual(['Too large', 'Too large'], restored.statuses)
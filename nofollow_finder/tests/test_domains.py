@@ -0,0 +1,91 @@
+#  coding=utf-8
+import os
+import tempfile
+import unittest
+
+from nofollow_finder.domains import (
+    DomainMatcher,
+    decode_char_refs,
+    load_domains,
+)
+
+
+class DomainMatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = DomainMatcher(
+            ['twitter.com', 'a.twitter.com', 'Bbc.co.uk'])
+
+    def test_subdomains(self):
+        self.assertEqual('twitter.com', self.matcher.match('//twitter.com'))
+        self.assertEqual(
+            'twitter.com', self.matcher.match('https://x.y.twitter.com/a'))
+        self.assertIsNone(self.matcher.match('http://w.x.y.twitter.com/'))
+        self.assertIsNone(self.matcher.match('http://xtwitter.com/'))
+
+    def test_earliest_domain_wins(self):
+        self.assertEqual(
+            'twitter.com', self.matcher.match('http://a.twitter.com'))
+        # too deep for twitter.com, not for a.twitter.com
+        self.assertEqual(
+            'a.twitter.com', self.matcher.match('http://x.y.a.twitter.com'))
+
+    def test_case(self):
+        self.assertEqual(
+            'Bbc.co.uk', self.matcher.match('HTTP://WWW.BBC.CO.UK'))
+
+    def test_not_absolute(self):
+        for href in ('/twitter.com', 'ftp://twitter.com', 'twitter.com',
+                     'mailto:x@twitter.com', 'http://twitter.com:80/',
+                     'http://twitter.com?x', 'http://x..twitter.com'):
+            self.assertIsNone(self.matcher.match(href), href)
+
+    def test_long_label(self):
+        self.assertIsNone(self.matcher.match('//{}.twitter.com'.format(
+            'x' * 64)))
+        self.assertEqual('twitter.com', self.matcher.match(
+            '//{}.twitter.com'.format('x' * 63)))
+
+    def test_many_domains(self):
+        domains = ['d{}.com'.format(i) for i in range(100000)]
+        matcher = DomainMatcher(domains)
+        self.assertEqual('d99999.com', matcher.match('//www.d99999.com/'))
+        self.assertIsNone(matcher.match('//www.d100000.com/'))
+
+    def test_mentioned_in(self):
+        mentioned_in = self.matcher.mentioned_in
+        self.assertTrue(mentioned_in(b'<a href="//x.twitter.com">'))
+        self.assertTrue(mentioned_in(b'see bbc.co.uk.'))
+        self.assertFalse(mentioned_in(b'<a href="//xtwitter.com">'))
+        self.assertFalse(mentioned_in(b'twitter com'))
+        self.assertTrue(mentioned_in(b'<a href="//&period;twitter.com">'))
+        self.assertTrue(mentioned_in(b'<a href="//x&#x2e;twitter.com">'))
+
+    def test_decode_char_refs(self):
+        text = b'//a&#46twitter&#x2e;com&#47;?&#381;&#xzz;&amp;'
+        self.assertEqual(
+            b'//a.twitter.com/?\xc5\xbe&#xzz;&amp;', decode_char_refs(text))
+
+
+class MatchAllTests(unittest.TestCase):
+    def test_match_all(self):
+        matcher = DomainMatcher(['www.twitter.com', 'x.com', 'twitter.com'])
+        self.assertEqual(['www.twitter.com', 'twitter.com'],
+                         matcher.match_all('https://WWW.twitter.com/x'))
+        self.assertEqual('www.twitter.com',
+                         matcher.match('https://www.twitter.com/x'))
+        self.assertEqual(['twitter.com'], matcher.match_all('//twitter.com'))
+        self.assertEqual([], matcher.match_all('/twitter.com'))
+
+
+class LoadDomainsTests(unittest.TestCase):
+
+    def test_load(self):
+        fd, path = tempfile.mkstemp()
+        os.write(fd, b'# social\ntwitter.com\n\n  facebook.com  # fb\n')
+        os.close(fd)
+        try:
+            self.assertEqual(
+                ['twitter.com', 'facebook.com'], load_domains(path))
+        finally:
+            os.remove(path)
@@ -1,8 +1,17 @@
 #  coding=utf-8
+import gzip
+import io
+import threading
+import time
 import unittest
+import zlib
+
 from mock import mock
 
-from nofollow_finder import downloader
+from nofollow_finder import command, downloader
+from nofollow_finder.body import BodyBuffer, BodyTooLarge
+from nofollow_finder.parser import Parser
+from nofollow_finder.stream import LinkStream
 
 
 class DownloaderTests(unittest.TestCase):
@@ -24,3 +33,372 @@ class DownloaderTests(unittest.TestCase):
             d.get('http://facebook.com')
         p_log.error.assert_called_once_with(
             'HTTP status %d for url %s', 302, 'http://facebook.com')
+
+
+class CurlHeadersTests(unittest.TestCase):
+
+    def test_parse_headers_after_redirect(self):
+        head = (
+            b'HTTP/1.1 301 Moved Permanently\r\n'
+            b'Location: https://example.com/\r\n'
+            b'ETag: "old"\r\n\r\n'
+            b'HTTP/1.1 200 OK\r\n'
+            b'Content-Type: text/html\r\n'
+            b'ETag: "new"\r\n\r\n'
+        )
+        headers = downloader.Downloader._parse_headers(head)
+        self.assertEqual('"new"', headers['etag'])
+        self.assertEqual('text/html', headers['Content-Type'])
+        self.assertNotIn('Location', headers)
+
+    def test_parse_headers_empty(self):
+        self.assertEqual({}, dict(downloader.Downloader._parse_headers(b'')))
+
+    @mock.patch('nofollow_finder.downloader.command')
+    def test_request_headers(self, p_command):
+        p_command.run.return_value = (0, b'\n304 0', b'')
+        d = downloader.Downloader(timeout=7)
+        response = d.fetch('http://example.com', {'If-None-Match': '"a b"'})
+        self.assertTrue(response.not_modified)
+        cmd = p_command.run.call_args[0][0]
+        self.assertIn("-H 'If-None-Match: \"a b\"'", cmd)
+
+    @mock.patch('nofollow_finder.downloader.command')
+    def test_url_quoted(self, p_command):
+        p_command.run.return_value = (0, b'\n404 0', b'')
+        d = downloader.Downloader(timeout=7)
+        with self.assertRaises(d.GetException):
+            d.fetch('http://example.com/?a=1&b=2;touch x')
+        cmd = p_command.run.call_args[0][0]
+        self.assertTrue(
+            cmd.endswith(" 'http://example.com/?a=1&b=2;touch x'"), cmd)
+
+
+    @mock.patch('nofollow_finder.downloader.command')
+    def test_split_size(self, p_command):
+        def run(cmd, timeout, err_sink):
+            err_sink.write(b'<html>\xc5\xbe</html>\n')
+            return (
+                0,
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/html; charset="UTF-8"\r\n\r\n'
+                b'\n200 12',
+                b'',
+            )
+
+        p_command.run.side_effect = run
+        d = downloader.Downloader(timeout=7)
+        response = d.fetch('http://example.com')
+        self.assertEqual(b'<html>\xc5\xbe</html>\n', response.body)
+        self.assertEqual('UTF-8', response.charset)
+        self.assertEqual(12, response.wire_size)
+        self.assertEqual(16, response.size)
+        self.assertIn('--compressed', p_command.run.call_args[0][0])
+
+
+def mock_response(status_code, chunks=(), headers=None):
+    response = mock.Mock(status_code=status_code, headers=headers or {})
+    response.raw.stream.return_value = chunks
+    return response
+
+
+class PooledDownloaderTests(unittest.TestCase):
+    def setUp(self):
+        self.d = downloader.PooledDownloader(timeout=7)
+        self.d.session = mock.Mock()
+
+    def test_get(self):
+        self.d.session.get.return_value = mock_response(
+            200, [b'<html><body>', b'</body></html>'])
+        code, body = self.d.get('http://example.com')
+        self.assertEqual(200, code)
+        self.assertEqual(b'<html><body></body></html>', body)
+        self.d.session.get.assert_called_once_with(
+            'http://example.com',
+            headers={'Accept-Encoding': downloader.ACCEPT_ENCODING},
+            allow_redirects=True, timeout=7, stream=True)
+
+    def test_gzip(self):
+        html = b'<html><body>' + b'<a href="x">x</a>' * 100 + b'</body></html>'
+        out = io.BytesIO()
+        with gzip.GzipFile(fileobj=out, mode='wb') as fh:
+            fh.write(html)
+        compressed = out.getvalue()
+        chunks = [compressed[i:i + 10] for i in range(0, len(compressed), 10)]
+        self.d.session.get.return_value = mock_response(
+            200, chunks, {'Content-Encoding': 'gzip'})
+        response = self.d.fetch('http://example.com')
+        self.assertEqual(html, response.body)
+        self.assertEqual(len(compressed), response.wire_size)
+        self.assertEqual(len(html), response.size)
+
+    def test_deflate_raw(self):
+        html = b'<html><body></body></html>'
+        obj = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = obj.compress(html) + obj.flush()
+        self.d.session.get.return_value = mock_response(
+            200, [compressed], {'Content-Encoding': 'deflate'})
+        response = self.d.fetch('http://example.com')
+        self.assertEqual(html, response.body)
+
+    def test_sink_complete(self):
+        chunks = [b'<html><body>', b'<a href="//twitter.com/">t</a>', b'x']
+        response = mock_response(200, chunks)
+        self.d.session.get.return_value = response
+        sink = LinkStream(Parser(['twitter.com']), stop_when_followed=True)
+        self.d.fetch('http://example.com', sink=sink)
+        self.assertTrue(sink.complete)
+        self.assertEqual(sum(map(len, chunks[:2])), sink.size)
+        self.assertEqual(1, len(sink.links))
+        response.close.assert_called_once_with()
+
+    def test_broken_gzip(self):
+        self.d.session.get.return_value = mock_response(
+            200, [b'not gzip'], {'Content-Encoding': 'gzip'})
+        with self.assertRaises(self.d.GetException):
+            self.d.fetch('http://example.com')
+
+    def test_not_modified(self):
+        self.d.session.get.return_value = mock_response(
+            304, headers={'ETag': '"x"'})
+        response = self.d.fetch(
+            'http://example.com', headers={'If-None-Match': '"x"'})
+        self.assertTrue(response.not_modified)
+        self.assertEqual('"x"', response.headers['etag'])
+
+    def test_not_modified_unconditional(self):
+        self.d.session.get.return_value = mock_response(304)
+        with self.assertRaises(self.d.GetException):
+            self.d.fetch('http://example.com')
+
+    @mock.patch('nofollow_finder.downloader.log')
+    def test_status(self, p_log):
+        self.d.session.get.return_value = mock_response(302)
+        with self.assertRaises(self.d.GetException):
+            self.d.get('http://facebook.com')
+        p_log.error.assert_called_once_with(
+            'HTTP status %d for url %s', 302, 'http://facebook.com')
+
+    def test_timeout(self):
+        self.d.session.get.side_effect = downloader.requests.Timeout()
+        with self.assertRaises(self.d.TransientError):
+            self.d.get('http://example.com')
+
+    def test_connection_error(self):
+        self.d.session.get.side_effect = downloader.requests.ConnectionError()
+        with self.assertRaises(self.d.TransientError):
+            self.d.get('http://example.com')
+
+    def test_ssl_error(self):
+        self.d.session.get.side_effect = (
+            downloader.requests.exceptions.SSLError())
+        with self.assertRaises(self.d.GetException) as cm:
+            self.d.get('http://example.com')
+        self.assertNotIsInstance(cm.exception, self.d.TransientError)
+
+    def test_reset_while_reading(self):
+        response = mock_response(200)
+        response.raw.stream.side_effect = downloader.Urllib3Error('reset')
+        self.d.session.get.return_value = response
+        with self.assertRaises(self.d.TransientError):
+            self.d.fetch('http://example.com')
+
+    def test_total_timeout(self):
+        self.d.timeout = 0.05
+
+        def slow_chunks():
+            # a server that sends its body a few bytes at a time
+            for _ in range(100):
+                time.sleep(0.01)
+                yield b'<p>'
+
+        response = mock_response(200, slow_chunks())
+        self.d.session.get.return_value = response
+        start = time.time()
+        with self.assertRaises(self.d.TransientError):
+            self.d.fetch('http://example.com')
+        self.assertLess(time.time() - start, 0.5)
+        response.raw._connection.sock.shutdown.assert_called_once_with(
+            downloader.socket.SHUT_RDWR)
+
+    def test_retry_after(self):
+        self.d.session.get.return_value = mock_response(
+            429, headers={'Retry-After': '120'})
+        with self.assertRaises(self.d.TransientError) as cm:
+            self.d.fetch('http://example.com')
+        self.assertEqual(120, cm.exception.retry_after)
+
+    def test_too_large(self):
+        self.d.max_body_size = 15
+        self.d.session.get.return_value = mock_response(
+            200, [b'<html><body>', b'</body></html>'])
+        with self.assertRaises(self.d.TooLarge):
+            self.d.fetch('http://example.com')
+
+    def test_not_html(self):
+        self.d.html_only = True
+        response = mock_response(
+            200, [b'%PDF'], {'Content-Type': 'application/pdf'})
+        self.d.session.get.return_value = response
+        with self.assertRaises(self.d.NotHtml) as cm:
+            self.d.fetch('http://example.com/x.pdf')
+        self.assertEqual('application/pdf', cm.exception.content_type)
+        self.assertEqual(200, cm.exception.status_code)
+        response.raw.stream.assert_not_called()
+        response.close.assert_called_once_with()
+
+    def test_html_only(self):
+        self.d.html_only = True
+        self.d.session.get.return_value = mock_response(
+            200, [b'<html></html>'],
+            {'Content-Type': 'application/xhtml+xml; charset=utf-8'})
+        response = self.d.fetch('http://example.com')
+        self.assertEqual(b'<html></html>', response.body)
+
+    def test_get_any_html_only(self):
+        self.d.html_only = True
+        self.d.session.get.return_value = mock_response(
+            200, [b'Crawl-delay: 3'], {'Content-Type': 'text/plain'})
+        self.assertEqual(
+            (200, b'Crawl-delay: 3'),
+            self.d.get_any('http://example.com/robots.txt'))
+
+
+class CurlPreflightTests(unittest.TestCase):
+    def setUp(self):
+        self.d = downloader.Downloader(html_only=True, timeout=7)
+
+    @mock.patch('nofollow_finder.downloader.Downloader._raw_get')
+    @mock.patch('nofollow_finder.command.run')
+    def test_not_html(self, p_run, p_raw_get):
+        p_run.return_value = (
+            0, b'HTTP/1.1 200 OK\r\nContent-Type: image/png\r\n\r\n\n200 0',
+            b'')
+        with self.assertRaises(self.d.NotHtml):
+            self.d.fetch('http://example.com/x.png')
+        self.assertIn(' -I ', p_run.call_args[0][0])
+        p_raw_get.assert_not_called()
+
+    @mock.patch('nofollow_finder.downloader.Downloader._raw_get')
+    @mock.patch('nofollow_finder.command.run')
+    def test_head_not_allowed(self, p_run, p_raw_get):
+        p_run.return_value = (
+            0, b'HTTP/1.1 405 Method Not Allowed\r\n\r\n\n405 0', b'')
+        p_raw_get.return_value = (
+            b'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n\n200 0')
+        response = self.d.fetch('http://example.com')
+        self.assertEqual(200, response.status_code)
+
+    @mock.patch('nofollow_finder.downloader.Downloader._raw_get')
+    @mock.patch('nofollow_finder.command.run')
+    def test_conditional_skips_preflight(self, p_run, p_raw_get):
+        p_raw_get.return_value = b'HTTP/1.1 304 Not Modified\r\n\r\n\n304 0'
+        response = self.d.fetch(
+            'http://example.com', headers={'If-None-Match': '"x"'})
+        self.assertTrue(response.not_modified)
+        p_run.assert_not_called()
+
+    @mock.patch('nofollow_finder.downloader.Downloader._raw_get')
+    @mock.patch('nofollow_finder.command.run')
+    def test_get_any_skips_preflight(self, p_run, p_raw_get):
+        p_raw_get.return_value = (
+            b'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\n\n200 0')
+        status_code, _ = self.d.get_any('http://example.com/robots.txt')
+        self.assertEqual(200, status_code)
+        p_run.assert_not_called()
+
+
+class TransientErrorTests(unittest.TestCase):
+
+    def test_parse_retry_after(self):
+        self.assertEqual(30, downloader.parse_retry_after(' 30 '))
+        self.assertIsNone(downloader.parse_retry_after(None))
+        self.assertIsNone(downloader.parse_retry_after('soon'))
+        self.assertEqual(0, downloader.parse_retry_after(
+            'Wed, 21 Oct 2015 07:28:00 GMT'))
+
+    @mock.patch('nofollow_finder.downloader.command')
+    def test_curl_connection_reset(self, p_command):
+        p_command.run.return_value = (56, b'', b'')
+        d = downloader.Downloader(timeout=7)
+        with self.assertRaises(d.TransientError) as cm:
+            d.fetch('http://example.com')
+        self.assertEqual('connection reset', cm.exception.reason)
+
+    @mock.patch('nofollow_finder.downloader.command')
+    def test_curl_other_error(self, p_command):
+        p_command.run.return_value = (3, b'', b'')
+        d = downloader.Downloader(timeout=7)
+        with self.assertRaises(d.GetException) as cm:
+            d.fetch('http://example.com')
+        self.assertNotIsInstance(cm.exception, d.TransientError)
+
+    @mock.patch('nofollow_finder.downloader.command')
+    def test_curl_service_unavailable(self, p_command):
+        p_command.run.return_value = (
+            0, b'HTTP/1.1 503 Unavailable\r\nRetry-After: 5\r\n\r\n\n503 0',
+            b'')
+        d = downloader.Downloader(timeout=7)
+        with self.assertRaises(d.TransientError) as cm:
+            d.fetch('http://example.com')
+        self.assertEqual(5, cm.exception.retry_after)
+
+
+class CurlLimitsTests(unittest.TestCase):
+    """These run a real (local) command instead of curl."""
+
+    @mock.patch('nofollow_finder.downloader.Downloader._raw_get')
+    def test_command_streams_err(self, p_raw_get):
+        def raw_get(url, headers, buffer_):
+            return command.run(
+                'printf "0123456789" >&2; printf "\\n200 10"',
+                timeout=5, err_sink=buffer_)[1]
+
+        p_raw_get.side_effect = raw_get
+        d = downloader.Downloader(spill_size=4)
+        response = d.fetch('http://example.com')
+        self.assertEqual(b'0123456789', response.body[:])
+        self.assertEqual(10, response.size)
+        response.close()
+
+    def test_command_sink_error(self):
+        buffer_ = BodyBuffer(max_size=100)
+        with self.assertRaises(BodyTooLarge):
+            command.run('yes >&2', timeout=5, err_sink=buffer_)
+
+    def test_command_sink_timeout(self):
+        buffer_ = BodyBuffer()
+        with self.assertRaises(command.Timeout):
+            command.run('printf "x" >&2; exec sleep 5', timeout=0.2,
+                        err_sink=buffer_)
+        self.assertEqual(b'x', buffer_.getvalue())
+
+    def test_command_sink_thread(self):
+        threads = []
+        sink = mock.Mock()
+        sink.write.side_effect = lambda chunk: threads.append(
+            threading.current_thread())
+        command.run('printf "x" >&2', timeout=5, err_sink=sink)
+        self.assertEqual([threading.current_thread()], threads)
+
+    def test_command_sink_complete(self):
+        sink = mock.Mock()
+        sink.write.side_effect = StopIteration()
+        returncode, out, err = command.run(
+            'printf "head"; exec yes >&2', timeout=5, err_sink=sink)
+        self.assertEqual(b'head', out)
+
+    @mock.patch('nofollow_finder.downloader.Downloader._curl_cmd')
+    def test_curl_stopped_by_sink(self, p_curl_cmd):
+        # like curl, headers to stdout and a never ending body to stderr
+        p_curl_cmd.return_value = (
+            'printf "HTTP/1.1 301 Moved\\r\\n\\r\\n'
+            'HTTP/1.1 200 OK\\r\\nContent-Type: text/html\\r\\n\\r\\n";'
+            'exec yes \'<a href="//twitter.com/">t</a>\' >&2')
+        sink = LinkStream(Parser(['twitter.com']), stop_when_followed=True)
+        response = downloader.Downloader(timeout=5).fetch(
+            'http://example.com', sink=sink)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/html', response.headers['Content-Type'])
+        self.assertTrue(sink.complete)
+        self.assertEqual(sink.size, response.size)
@@ -0,0 +1,113 @@
+#  coding=utf-8
+import os
+import tempfile
+import unittest
+
+from mock import mock
+
+from nofollow_finder import jobs
+from nofollow_finder.output_csv import OutputCSV
+from nofollow_finder.parser import Parser
+from nofollow_finder.processor import UrlData
+
+
+def write_file(content):
+    fd, path = tempfile.mkstemp()
+    os.write(fd, content)
+    os.close(fd)
+    return path
+
+
+class LoadJobsTests(unittest.TestCase):
+    def setUp(self):
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+
+    def load(self, content):
+        self.paths.append(write_file(content))
+        return jobs.load_jobs(self.paths[-1])
+
+    def test_load(self):
+        self.paths.append(write_file(b'linkedin.com\n'))
+        loaded = self.load(
+            b'# clients\n'
+            b'a.csv  twitter.com, facebook.com\n'
+            b'\n'
+            b'b.csv @' + self.paths[0].encode('utf-8') + b'  # from a file\n')
+        self.assertEqual(['a.csv', 'b.csv'], [j.out_file for j in loaded])
+        self.assertEqual(['twitter.com', 'facebook.com'], loaded[0].domains)
+        self.assertEqual(['linkedin.com'], loaded[1].domains)
+
+    def test_no_domains(self):
+        with self.assertRaisesRegexp(ValueError, 'line 1'):
+            self.load(b'a.csv\n')
+        with self.assertRaisesRegexp(ValueError, 'line 2: no domains'):
+            self.load(b'a.csv x.com\nb.csv ,\n')
+
+    def test_all_domains(self):
+        self.assertEqual(
+            ['twitter.com', 'facebook.com', 'linkedin.com'],
+            jobs.all_domains([
+                jobs.Job('a.csv', ['twitter.com', 'facebook.com']),
+                jobs.Job('b.csv', ['linkedin.com', 'twitter.com']),
+            ]))
+
+    def test_labels(self):
+        self.assertEqual(
+            ['twitter.com', 'x.com', 'www.twitter.com twitter.com'],
+            jobs._labels(['twitter.com', 'x.com', 'www.twitter.com']))
+        self.assertEqual(
+            ['www.twitter.com', 'twitter.com www.twitter.com'],
+            jobs._labels(['www.twitter.com', 'twitter.com']))
+
+
+class JobsOutputTests(unittest.TestCase):
+    def test_write(self):
+        outputs = [
+            OutputCSV('a.csv', ['twitter.com', 'facebook.com']),
+            OutputCSV('b.csv', ['linkedin.com', 'twitter.com']),
+        ]
+        for output in outputs:
+            output.write = mock.Mock()
+        output = jobs.JobsOutput(outputs)
+        self.assertEqual(
+            ['twitter.com', 'facebook.com', 'linkedin.com', 'twitter.com'],
+            output.domains)
+        url_data = UrlData(output.domains, output.positions,
+                           url='u', http_response=200)
+        url_data.add('twitter.com', False, 2)
+        url_data.add('linkedin.com', True)
+        output.write(url_data)
+        a = outputs[0].write.call_args[0][0]
+        b = outputs[1].write.call_args[0][0]
+        self.assertEqual(['u', 200, 'follow', 2, 'not found', 0],
+                         outputs[0].row(a))
+        self.assertEqual(['u', 200, 'nofollow', 1, 'follow', 2],
+                         outputs[1].row(b))
+        self.assertEqual('follow', b.status('twitter.com'))
+
+    def test_write_nested(self):
+        outputs = [
+            OutputCSV('a.csv', ['foo.org', 'sub.foo.org']),
+            OutputCSV('b.csv', ['sub.foo.org', 'foo.org']),
+            OutputCSV('c.csv', ['sub.foo.org']),
+        ]
+        for output in outputs:
+            output.write = mock.Mock()
+        output = jobs.JobsOutput(outputs)
+        url_data = UrlData(output.domains, output.positions,
+                           url='u', http_response=200)
+        parser = Parser(jobs.all_domains(outputs), match_all=True)
+        for href in ['//sub.foo.org/', '//www.foo.org/']:
+            for domain in parser._match_href(href):
+                url_data.add(domain, False)
+        output.write(url_data)
+        rows = [o.row(o.write.call_args[0][0]) for o in outputs]
+        self.assertEqual([
+            ['u', 200, 'follow', 2, 'not found', 0],
+            ['u', 200, 'follow', 1, 'follow', 1],
+            ['u', 200, 'follow', 1],
+        ], rows)
@@ -0,0 +1,106 @@
+#  coding=utf-8
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import mock
+
+from nofollow_finder.journal import Journal
+from nofollow_finder.processor import Processor
+
+
+def links(*urls):
+    return [{'url': url} for url in urls]
+
+
+class JournalTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'out.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_journal(self, *rows):
+        journal = Journal(self.path)
+        journal.open()
+        for row, url in rows:
+            journal.record(row, url)
+        journal.close()
+
+    def pending(self, *urls):
+        journal = Journal(self.path, resume=True)
+        journal.open()
+        try:
+            return [link['url'] for link in journal.pending(links(*urls))]
+        finally:
+            journal.close()
+
+    def test_resume(self):
+        self.write_journal((0, 'http://a/'), (2, 'http://c/'), (20, 'http://u/'))
+        self.assertEqual(
+            ['http://b/', 'http://d/'],
+            self.pending('http://a/', 'http://b/', 'http://c/', 'http://d/'))
+
+    def test_other_url(self):
+        self.write_journal((0, 'http://a/'))
+        self.assertEqual(['http://x/'], self.pending('http://x/'))
+
+    def test_appends(self):
+        self.write_journal((0, 'http://a/'))
+        journal = Journal(self.path, resume=True)
+        journal.open()
+        list(journal.pending(links('http://a/', 'http://b/')))
+        journal.record(1, 'http://b/')
+        journal.close()
+        self.assertEqual([], self.pending('http://a/', 'http://b/'))
+
+    def test_start_over(self):
+        self.write_journal((0, 'http://a/'))
+        self.write_journal()
+        self.assertEqual(['http://a/'], self.pending('http://a/'))
+
+    def test_cut_short(self):
+        with io.open(self.path, 'w', encoding='utf-8') as fh:
+            fh.write(u'0\thttp://a/\nbad line\n1\thttp://b/')
+        self.assertEqual(['http://b/'], self.pending('http://a/', 'http://b/'))
+
+    def test_missing(self):
+        self.assertEqual(['http://a/'], self.pending('http://a/'))
+
+
+class ProcessWithJournalTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'out.journal')
+        self.parser = mock.Mock(domains=['twitter.com'])
+        self.input_csv = mock.Mock()
+        self.output_csv = mock.Mock()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def process(self, resume=False):
+        processor = Processor(
+            self.input_csv, mock.Mock(), self.parser, self.output_csv,
+            journal=Journal(self.path, resume))
+        processor._download = lambda link: (
+            processor.make_url_data(link), None, None)
+        processor.process()
+
+    def written(self):
+        return [
+            call[0][0]['url'] for call in self.output_csv.write.call_args_list]
+
+    def test_resume(self):
+        self.input_csv.links.return_value = links('http://a/', 'http://b/')
+        self.process()
+        self.assertEqual(['http://a/', 'http://b/'], self.written())
+        self.output_csv.sync.assert_called()
+        self.output_csv.reset_mock()
+        self.input_csv.links.return_value = links(
+            'http://a/', 'http://b/', 'http://c/')
+        self.process(resume=True)
+        self.assertEqual(['http://c/'], self.written())
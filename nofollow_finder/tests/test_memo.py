@@ -0,0 +1,59 @@
+#  coding=utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import mock
+
+from nofollow_finder.memo import ParseMemo
+from nofollow_finder.stats import stats
+
+
+class ParseMemoTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'memo.db')
+        self.parser = mock.Mock(domains=['twitter.com'], match_all=False)
+        self.links = [('twitter.com', 2, False)]
+        stats.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_store_lookup(self):
+        memo = ParseMemo(self.parser)
+        key = memo.key(b'<html></html>')
+        self.assertIsNone(memo.lookup(key))
+        memo.store(key, self.links)
+        self.assertEqual(self.links, memo.lookup(memo.key(b'<html></html>')))
+        self.assertIsNone(memo.lookup(memo.key(b'<html> </html>')))
+        self.assertEqual(1, stats['parse memo hits'])
+        self.assertEqual(3, stats['parse memo lookups'])
+
+    def test_other_domains(self):
+        key = ParseMemo(self.parser).key(b'<html></html>')
+        self.parser.domains = ['facebook.com']
+        self.assertNotEqual(key, ParseMemo(self.parser).key(b'<html></html>'))
+        self.assertNotEqual(key, ParseMemo(
+            self.parser, existence_only=True).key(b'<html></html>'))
+
+    def test_max_entries(self):
+        memo = ParseMemo(self.parser, max_entries=2)
+        for key in ('a', 'b', 'c'):
+            memo.store(key, self.links)
+            memo.lookup('a')
+        self.assertIsNone(memo.lookup('b'))
+        self.assertIsNotNone(memo.lookup('a'))
+        self.assertIsNotNone(memo.lookup('c'))
+
+    def test_persistent(self):
+        memo = ParseMemo(self.parser, path=self.path)
+        memo.open()
+        key = memo.key(b'<html></html>')
+        memo.store(key, self.links)
+        memo.close()
+        memo = ParseMemo(self.parser, path=self.path)
+        memo.open()
+        self.assertEqual(self.links, memo.lookup(key))
+        memo.close()
@@ -0,0 +1,137 @@
+#  coding=utf-8
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from mock import mock
+
+from nofollow_finder.journal import Journal
+from nofollow_finder.output_sqlite import OutputSQLite, StaleInput
+from nofollow_finder.processor import UrlData
+
+
+class OutputSQLiteTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'results.db')
+        self.domains = ['twitter.com', 'facebook.com']
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_once(self, *urls_data):
+        output = OutputSQLite(self.path, self.domains, 'input.csv')
+        output.open()
+        for url_data in urls_data:
+            output.write(url_data)
+        output.close()
+        return output
+
+    def url_data(self, url, failure=None):
+        url_data = UrlData(self.domains, url=url, http_response=200)
+        if failure:
+            url_data.set_failure(failure)
+        else:
+            url_data.add('twitter.com', False, 2)
+        return url_data
+
+    def test_write(self):
+        self.run_once(self.url_data('http://a/'))
+        output = self.run_once(self.url_data('http://a/'))
+        self.assertEqual(2, output.run_id)
+        db = sqlite3.connect(self.path)
+        self.assertEqual([
+            ('twitter.com', 'follow', 2),
+            ('facebook.com', 'not found', 0),
+        ], db.execute(
+            'SELECT domain, status, count FROM results '
+            'JOIN checks ON checks.id = check_id '
+            'WHERE run_id = 2 ORDER BY results.rowid').fetchall())
+        self.assertEqual(2, db.execute(
+            'SELECT COUNT(*) FROM runs WHERE finished_at IS NOT NULL'
+        ).fetchone()[0])
+        db.close()
+
+    def crash(self, rows, checkpoint_after=None):
+        """
+        Writes `rows` rows to the output and a deferred journal in another
+        process, which dies without closing them.
+        """
+        journal_path = os.path.join(self.tmp_dir, 'out.journal')
+        pid = os.fork()
+        if not pid:
+            try:
+                output = OutputSQLite(self.path, self.domains)
+                journal = Journal(journal_path, deferred=True)
+                output.open()
+                journal.open()
+                for row in range(rows):
+                    url = 'http://a/{}'.format(row)
+                    output.write(self.url_data(url))
+                    journal.record(row, url)
+                    if row + 1 == checkpoint_after:
+                        output.sync()
+                        journal.sync()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        journal = Journal(journal_path, resume=True)
+        journal.load()
+        done = sum(
+            1 for row in range(rows)
+            if journal.is_done(row, 'http://a/{}'.format(row)))
+        db = sqlite3.connect(self.path)
+        checks = db.execute('SELECT COUNT(*) FROM checks').fetchone()[0]
+        db.close()
+        return done, checks
+
+    def test_crash_with_journal(self):
+        self.assertEqual((0, 0), self.crash(50))
+
+    def test_crash_with_journal_after_checkpoint(self):
+        self.assertEqual((50, 50), self.crash(60, checkpoint_after=50))
+
+    def test_stale_input(self):
+        self.run_once(
+            self.url_data('http://a/'), self.url_data('http://b/', 'Fail'))
+        output = OutputSQLite(self.path, self.domains)
+        output.open()
+        input_csv = mock.Mock()
+        input_csv.links.return_value = [
+            {'url': 'http://a/'}, {'url': 'http://b/'}, {'url': 'http://c/'}]
+        links = list(StaleInput(input_csv, output, 30).links())
+        self.assertEqual(
+            ['http://b/', 'http://c/'], [link['url'] for link in links])
+        with mock.patch('nofollow_finder.output_sqlite.time') as p_time:
+            p_time.time.return_value = output.last_checked('http://a/') + (
+                31 * 24 * 60 * 60)
+            links = list(StaleInput(input_csv, output, 30).links())
+        self.assertEqual(3, len(links))
+        output.close()
+
+    def test_stale_input_other_domains(self):
+        self.run_once(self.url_data('http://a/'))
+        input_csv = mock.Mock()
+        input_csv.links.return_value = [{'url': 'http://a/'}]
+        for domains, expected in [
+                (['twitter.com'], 0),
+                (['twitter.com', 'linkedin.com'], 1)]:
+            output = OutputSQLite(self.path, domains)
+            output.open()
+            links = list(StaleInput(input_csv, output, 30).links())
+            output.close()
+            self.assertEqual(expected, len(links))
+
+    def test_stale_input_same_run(self):
+        output = OutputSQLite(self.path, self.domains)
+        output.open()
+        input_csv = mock.Mock()
+        input_csv.links.return_value = [{'url': 'http://a/'}] * 2
+        links = []
+        for link in StaleInput(input_csv, output, 30).links():
+            links.append(link)
+            output.write(self.url_data(link['url']))
+        output.close()
+        self.assertEqual(2, len(links))
@@ -0,0 +1,73 @@
+#  coding=utf-8
+import os
+import time
+import unittest
+
+from nofollow_finder import benchmark, parser
+from nofollow_finder.parse_pool import ParsePool
+from nofollow_finder.processor import UrlData
+from nofollow_finder.stats import stats
+
+
+class DyingParser(parser.FastParser):
+    def find_a_nodes(self, html, charset=None):
+        # like a worker killed for using too much memory
+        os._exit(1)
+
+
+class ParsePoolTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.parser = parser.FastParser(['twitter.com', 'facebook.com'])
+        cls.pool = ParsePool(cls.parser, 2)
+        cls.pool.open()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def setUp(self):
+        stats.reset()
+
+    def test_same_as_parser(self):
+        for page in benchmark.make_corpus(pages=3, links=100):
+            expected = UrlData(self.parser.domains)
+            for _, domain, nofollow in self.parser.find_a_nodes(page):
+                expected.add(domain, nofollow)
+            found = UrlData(self.parser.domains)
+            for domain, count, nofollow in self.pool.parse('u', page):
+                found.add(domain, nofollow, count)
+            self.assertEqual(
+                (expected.statuses, expected.counts),
+                (found.statuses, found.counts))
+
+    def test_aggregates(self):
+        html = (
+            b'<a href="//twitter.com/1" rel="nofollow">1</a>'
+            b'<a href="//facebook.com/">f</a>'
+            b'<a href="//twitter.com/2" rel="nofollow">2</a>'
+        )
+        self.assertEqual(
+            [('twitter.com', 2, True), ('facebook.com', 1, False)],
+            self.pool.parse('u', html, 'utf-8'))
+
+    def test_zero_a_nodes(self):
+        with self.assertRaises(self.parser.ZeroANodes):
+            self.pool.parse('u', b'<html><body>twitter.com</body></html>')
+
+    def test_stats(self):
+        self.assertEqual([], self.pool.parse('u', b'<a href="/">x</a>'))
+        self.assertEqual(1, stats['pages skipped by prefilter'])
+
+
+class DeadWorkerTests(unittest.TestCase):
+    def test_timed_out(self):
+        pool = ParsePool(DyingParser(['twitter.com']), 1, timeout=0.5)
+        pool.open()
+        try:
+            start = time.time()
+            with self.assertRaises(ParsePool.TimedOut):
+                pool.parse('u', b'<a href="//twitter.com/">t</a>')
+            self.assertLess(time.time() - start, 5)
+        finally:
+            pool.close()
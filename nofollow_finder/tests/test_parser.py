@@ -0,0 +1,176 @@
+#  coding=utf-8
+import mmap
+import tempfile
+import unittest
+
+from nofollow_finder import benchmark, parser
+
+
+class FindANodesTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = parser.Parser(['twitter.com', 'facebook.com'])
+
+    def find(self, html, charset=None):
+        return [
+            (a_node.text, domain, nofollow)
+            for a_node, domain, nofollow
+            in self.parser.find_a_nodes(html, charset)
+        ]
+
+    def test_domains(self):
+        html = (
+            b'<html><body>'
+            b'<a href="https://twitter.com/x" rel="nofollow">t</a>'
+            b'<a href="//www.facebook.com/">f</a>'
+            b'<a href="https://example.com/">e</a>'
+            b'<a href="https://a.b.c.twitter.com/">too deep</a>'
+            b'</body></html>'
+        )
+        self.assertEqual([
+            ('t', 'twitter.com', True),
+            ('f', 'facebook.com', False),
+        ], self.find(html))
+
+    def test_zero_a_nodes(self):
+        self.parser.prefilter = False
+        with self.assertRaises(self.parser.ZeroANodes):
+            self.find(b'<html><body>nothing</body></html>')
+
+    def test_prefilter(self):
+        html = b'<html><body><a href="https://example.com/">e</a></body>'
+        self.assertEqual([], self.find(html))
+        self.assertFalse(self.parser.may_link(html))
+
+    def test_prefilter_case(self):
+        html = b'<a href="https://TWITTER.com/">t</a>'
+        self.assertTrue(self.parser.may_link(html))
+        self.assertEqual([('t', 'twitter.com', False)], self.find(html))
+
+    def test_prefilter_regex(self):
+        self.parser.max_substring_searches = 0
+        self.assertTrue(self.parser.may_link(b'<a href="//FaceBook.com">'))
+        self.assertFalse(self.parser.may_link(b'<a href="//example.com">'))
+
+    def test_prefilter_char_refs(self):
+        pages = [
+            b'<a href="//www&#x2e;twitter.com/">t</a>',
+            b'<a href="http://&period;&#46;TWITTER.COM">t</a>',
+            b'<a href="//twi&#116;ter.com/">t</a>',
+            b'<a href="//twitter&#46com/">t</a>',
+            b'<a href="//twitter&#X2E;com/">t</a>',
+        ]
+        for max_substring_searches in (16, 0):
+            self.parser.max_substring_searches = max_substring_searches
+            for html in pages:
+                self.assertEqual(
+                    [('t', 'twitter.com', False)], self.find(html), html)
+            self.assertFalse(
+                self.parser.may_link(b'<a href="//twitter&#x2e;org/">'))
+
+    def test_many_domains(self):
+        domains = ['d{}.com'.format(i) for i in range(1000)]
+        self.parser = self.parser.__class__(domains + ['twitter.com'])
+        html = b'<a href="https://twitter.com/">t</a>'
+        self.assertEqual([('t', 'twitter.com', False)], self.find(html))
+        self.assertFalse(self.parser.may_link(b'<a href="//example.com">'))
+
+    def test_prefilter_wide_charset(self):
+        html = u'<a href="https://twitter.com/">t</a>'.encode('utf-16')
+        self.assertTrue(self.parser.may_link(html))
+        self.assertTrue(self.parser.may_link(html[2:], 'UTF-16LE'))
+        self.assertEqual(
+            [('t', 'twitter.com', False)], self.find(html, 'utf-16'))
+
+    def test_prefilter_mmap(self):
+        fh = tempfile.TemporaryFile()
+        fh.write(b'<a href="https://facebook.com/">f</a>')
+        fh.flush()
+        body = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        fh.close()
+        self.assertTrue(self.parser.may_link(body))
+        self.assertEqual([('f', 'facebook.com', False)], self.find(body))
+        body.close()
+
+    def test_prefilter_mmap_chunks(self):
+        self.parser.prefilter_chunk_size = 16
+        fh = tempfile.TemporaryFile()
+        # the domain is cut by a chunk boundary
+        fh.write(b'<p>xxxxx</p><a href="//FaceBook.com/">f</a>' + b' ' * 40)
+        fh.flush()
+        body = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        fh.close()
+        self.assertTrue(self.parser.may_link(body))
+        body.close()
+        fh = tempfile.TemporaryFile()
+        fh.write(b'<a href="//example.com/">e</a>' * 10)
+        fh.flush()
+        body = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        fh.close()
+        self.assertFalse(self.parser.may_link(body))
+        body.close()
+
+    def test_declared_charset(self):
+        html = u'<a href="https://twitter.com/">ž</a>'.encode('cp1250')
+        self.assertEqual(
+            [(u'ž', 'twitter.com', False)],
+            self.find(html, 'windows-1250'))
+
+    def test_meta_charset(self):
+        html = (
+            u'<html><head><meta charset="utf-8"></head><body>'
+            u'<a href="https://twitter.com/">ž</a></body></html>'
+        ).encode('utf-8')
+        self.assertEqual(
+            [(u'ž', 'twitter.com', False)], self.find(html))
+
+    def test_match_all(self):
+        html = b'<a href="//www.twitter.com/">w</a><a href="//twitter.com">t</a>'
+        domains = ['twitter.com', 'www.twitter.com']
+        self.parser = self.parser.__class__(domains)
+        self.assertEqual(
+            [('w', 'twitter.com', False), ('t', 'twitter.com', False)],
+            self.find(html))
+        self.parser = self.parser.__class__(domains, match_all=True)
+        self.assertEqual([
+            ('w', 'twitter.com www.twitter.com', False),
+            ('t', 'twitter.com', False),
+        ], self.find(html))
+
+    def test_unknown_charset(self):
+        html = b'<a href="https://twitter.com/">t</a>'
+        self.assertEqual(
+            [('t', 'twitter.com', False)], self.find(html, 'no-such-charset'))
+
+
+class FastParserTests(FindANodesTests):
+    """The same cases as for Parser."""
+
+    def setUp(self):
+        self.parser = parser.FastParser(['twitter.com', 'facebook.com'])
+
+    def test_rel_case(self):
+        html = b'<a REL=" NoFollow " href="HTTPS://Twitter.com/">t</a>'
+        self.assertEqual([('t', 'twitter.com', True)], self.find(html))
+
+    def test_same_as_parser(self):
+        html = (
+            b'<a rel="nofollow noopener" href="https://twitter.com/">t</a>'
+            b'<a rel="" href="//facebook.com">f</a>'
+            b'<a href="mailto:x@twitter.com">m</a>'
+        )
+        slow = parser.Parser(self.parser.domains)
+        self.assertEqual(
+            [(a.text, domain, nofollow)
+             for a, domain, nofollow in slow.find_a_nodes(html)],
+            self.find(html))
+
+
+class BenchmarkTests(unittest.TestCase):
+
+    def test_engines_agree(self):
+        corpus = benchmark.make_corpus(pages=5, links=50)
+        self.assertEqual(corpus, benchmark.make_corpus(pages=5, links=50))
+        elapsed, slow = benchmark.run('pyquery', corpus, repeat=1)
+        elapsed, fast = benchmark.run('fast', corpus, repeat=1)
+        self.assertEqual(slow, fast)
+        self.assertTrue(any(slow))
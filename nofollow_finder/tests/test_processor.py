@@ -1,15 +1,19 @@
 #  coding=utf-8
 import unittest
 
+from mock import mock
+
 from nofollow_finder import processor
+from nofollow_finder.mode_web_search.output_csv import WebSearchOutputCSV
+from nofollow_finder.output_csv import OutputCSV
+from nofollow_finder.downloader import Downloader, Response
+from nofollow_finder.dedupe import ResultIndex
+from nofollow_finder.memo import ParseMemo
+from nofollow_finder.parse_pool import ParsePool
+from nofollow_finder.workers import Retry
 
 
-class UrlDataConstructorAndPatternTests(unittest.TestCase):
-    def setUp(self):
-        self.d = processor.UrlData(
-            domains=['twitter.com', 'facebook.com'],
-        )
-
+class UrlDataConstructorTests(unittest.TestCase):
     def test_kwargs(self):
         d = processor.UrlData(
             domains=['twitter.com', 'facebook.com'],
@@ -19,35 +23,34 @@ class UrlDataConstructorAndPatternTests(unittest.TestCase):
         self.assertEqual(['twitter.com', 'facebook.com'], d.domains)
         self.assertEqual('mock_url', d['url'])
         self.assertEqual('bar', d['foo'])
+        self.assertEqual(['not found', 'not found'], d.statuses)
+        self.assertEqual([0, 0], d.counts)
+
+    def test_set_field(self):
+        d = processor.UrlData(domains=['twitter.com'], url='mock_url')
+        d['http_response'] = 200
+        self.assertEqual(200, d['http_response'])
+        self.assertIsNone(d.get('attempts'))
 
-    def test_pattern_domain_1(self):
-        self.d['facebook.com'] = 'FOO'
-        value = self.d['domain_1']
-        expected = 'FOO'
-        self.assertEqual(expected, value)
-
-    def test_pattern_domain_2(self):
-        self.d['twitter.com'] = 'FOO'
-        value = self.d['domain_0']
-        expected = 'FOO'
-        self.assertEqual(expected, value)
-
-    def test_pattern_count_1(self):
-        self.d['twitter.com_count'] = 'FOO'
-        value = self.d['domain_0_count']
-        expected = 'FOO'
-        self.assertEqual(expected, value)
-
-    def test_pattern_count_2(self):
-        self.d['facebook.com_count'] = 'FOO'
-        value = self.d['domain_1_count']
-        expected = 'FOO'
-        self.assertEqual(expected, value)
-
-    def test_pattern_key_error(self):
+    def test_key_error(self):
+        d = processor.UrlData(domains=['twitter.com'])
         with self.assertRaises(KeyError):
             # noinspection PyStatementEffect
-            self.d['domain_2_count']
+            d['domain_0']
+
+    def test_shared_positions(self):
+        domains = ['twitter.com', 'facebook.com']
+        positions = processor.UrlData.make_positions(domains)
+        d = processor.UrlData(domains, positions)
+        d.add('facebook.com', False)
+        self.assertEqual(['not found', 'follow'], d.statuses)
+        self.assertEqual({'twitter.com': [0], 'facebook.com': [1]}, positions)
+
+    def test_duplicate_domain(self):
+        d = processor.UrlData(domains=['twitter.com', 'x.com', 'twitter.com'])
+        d.add('twitter.com', True)
+        self.assertEqual(['nofollow', 'not found', 'nofollow'], d.statuses)
+        self.assertEqual([1, 0, 1], d.counts)
 
 
 class UrlDataUpdateTests(unittest.TestCase):
@@ -56,137 +59,341 @@ class UrlDataUpdateTests(unittest.TestCase):
             domains=['twitter.com', 'facebook.com'],
         )
 
-    def test_empty(self):
-        expected = {
-            'facebook.com': 'not found',
-            'facebook.com_count': 0,
-            'twitter.com': 'not found',
-            'twitter.com_count': 0,
-        }
-        value = self.d.copy()
-        self.assertDictEqual(expected, value)
-
     def test_updated_nofollow(self):
-        expected = {
-            'facebook.com': 'nofollow',
-            'facebook.com_count': 1,
-            'twitter.com': 'not found',
-            'twitter.com_count': 0,
-        }
         self.d.add('facebook.com', True)
-        value = self.d.copy()
-        self.assertDictEqual(expected, value)
+        self.assertEqual(['not found', 'nofollow'], self.d.statuses)
+        self.assertEqual([0, 1], self.d.counts)
 
     def test_updated_nofollow_nofollow(self):
-        expected = {
-            'facebook.com': 'nofollow',
-            'facebook.com_count': 2,
-            'twitter.com': 'not found',
-            'twitter.com_count': 0,
-        }
         self.d.add('facebook.com', True)
         self.d.add('facebook.com', True)
-        value = self.d.copy()
-        self.assertDictEqual(expected, value)
+        self.assertEqual('nofollow', self.d.status('facebook.com'))
+        self.assertEqual(2, self.d.count('facebook.com'))
 
     def test_updated_nofollow_follow(self):
-        expected = {
-            'facebook.com': 'follow',
-            'facebook.com_count': 2,
-            'twitter.com': 'not found',
-            'twitter.com_count': 0,
-        }
         self.d.add('facebook.com', True)
         self.d.add('facebook.com', False)
-        value = self.d.copy()
-        self.assertDictEqual(expected, value)
+        self.assertEqual('follow', self.d.status('facebook.com'))
+        self.assertEqual(2, self.d.count('facebook.com'))
+
+    def test_updated_follow_nofollow(self):
+        self.d.add('facebook.com', False)
+        self.d.add('facebook.com', True)
+        self.assertEqual('follow', self.d.status('facebook.com'))
+        self.assertEqual(2, self.d.count('facebook.com'))
+
+    def test_updated_count(self):
+        self.d.add('facebook.com', True, 3)
+        self.d.add('facebook.com', False, 2)
+        self.assertEqual('follow', self.d.status('facebook.com'))
+        self.assertEqual(5, self.d.count('facebook.com'))
 
     def test_set_failure(self):
-        expected = {
-            'facebook.com': 'Fail',
-            'facebook.com_count': 0,
-            'twitter.com': 'Fail',
-            'twitter.com_count': 0,
-        }
         self.d.set_failure()
-        value = self.d.copy()
-        self.assertDictEqual(expected, value)
+        self.assertEqual(['Fail', 'Fail'], self.d.statuses)
+        self.assertEqual([0, 0], self.d.counts)
+
+    def test_all_followed(self):
+        self.d.add('facebook.com', False)
+        self.assertFalse(self.d.all_followed())
+        self.d.add('twitter.com', False)
+        self.assertTrue(self.d.all_followed())
 
+    def test_results_restore(self):
+        self.d.add('facebook.com', True, 2)
+        results = self.d.results()
+        self.assertEqual({
+            'twitter.com': ['not found', 0],
+            'facebook.com': ['nofollow', 2],
+        }, results)
+        d = processor.UrlData(domains=['twitter.com', 'facebook.com'])
+        d.restore(results)
+        self.assertEqual(['not found', 'nofollow'], d.statuses)
+        self.assertEqual([0, 2], d.counts)
+
+
+class OutputRowTests(unittest.TestCase):
+    def setUp(self):
+        self.output = OutputCSV(None, ['twitter.com', 'facebook.com'])
 
-class UrlDataDataTest(unittest.TestCase):
     def test_empty(self):
         d = processor.UrlData(domains=[], url='foo', http_response='bar')
-        expected = {'url': 'foo', 'http_response': 'bar'}
-        self.assertEqual(expected, d.data)
+        self.assertEqual(['foo', 'bar'], OutputCSV(None, []).row(d))
 
     def test_zeroes(self):
         d = processor.UrlData(url='foo', http_response='bar',
                               domains=['twitter.com', 'facebook.com'])
-        expected = {
-            'domain_0': 'not found',
-            'domain_0_count': 0,
-            'domain_1': 'not found',
-            'domain_1_count': 0,
-            'url': 'foo',
-            'http_response': 'bar'
-        }
-        self.assertEqual(expected, d.data)
+        self.assertEqual(
+            ['foo', 'bar', 'not found', 0, 'not found', 0],
+            self.output.row(d))
 
     def test_failure(self):
         d = processor.UrlData(url='foo', http_response='bar',
                               domains=['twitter.com', 'facebook.com'])
         d.set_failure()
-        expected = {
-            'domain_0': 'Fail',
-            'domain_0_count': 0,
-            'domain_1': 'Fail',
-            'domain_1_count': 0,
-            'url': 'foo',
-            'http_response': 'bar'
-        }
-        self.assertEqual(expected, d.data)
-
-    def test_nofollow_nofollow(self):
-        d = processor.UrlData(url='foo', http_response='bar',
-                              domains=['twitter.com', 'facebook.com'])
-        d.add('facebook.com', True)
-        d.add('facebook.com', True)
-        expected = {
-            'domain_0': 'not found',
-            'domain_0_count': 0,
-            'domain_1': 'nofollow',
-            'domain_1_count': 2,
-            'url': 'foo',
-            'http_response': 'bar'
-        }
-        self.assertEqual(expected, d.data)
+        self.assertEqual(
+            ['foo', 'bar', 'Fail', 0, 'Fail', 0], self.output.row(d))
 
     def test_nofollow_follow(self):
         d = processor.UrlData(url='foo', http_response='bar',
                               domains=['twitter.com', 'facebook.com'])
         d.add('facebook.com', True)
         d.add('facebook.com', False)
-        expected = {
-            'domain_0': 'not found',
-            'domain_0_count': 0,
-            'domain_1': 'follow',
-            'domain_1_count': 2,
-            'url': 'foo',
-            'http_response': 'bar'
-        }
-        self.assertEqual(expected, d.data)
-
-    def test_follow_nofollow(self):
-        d = processor.UrlData(url='foo', http_response='bar',
+        self.assertEqual(
+            ['foo', 'bar', 'not found', 0, 'follow', 2], self.output.row(d))
+
+    def test_attempts(self):
+        self.output.attempts = True
+        d = processor.UrlData(url='foo', http_response=200, attempts=2,
                               domains=['twitter.com', 'facebook.com'])
-        d.add('facebook.com', False)
-        d.add('facebook.com', True)
-        expected = {
-            'domain_0': 'not found',
-            'domain_0_count': 0,
-            'domain_1': 'follow',
-            'domain_1_count': 2,
-            'url': 'foo',
-            'http_response': 'bar'
-        }
-        self.assertEqual(expected, d.data)
+        self.assertEqual(
+            ['foo', 200, 'not found', 0, 'not found', 0, 2],
+            self.output.row(d))
+
+    def test_rows(self):
+        self.output.attempts = True
+        self.output.rows = True
+        d = processor.UrlData(url='foo', http_response=200, attempts=2,
+                              row=41, domains=['twitter.com', 'facebook.com'])
+        self.assertEqual(
+            ['foo', 200, 'not found', 0, 'not found', 0, 2, 41],
+            self.output.row(d))
+        self.assertEqual('input row', self.output.header_row()[-1])
+
+    def test_web_search(self):
+        output = WebSearchOutputCSV(None, ['twitter.com'])
+        d = processor.UrlData(url='foo', query='q', engine='bing',
+                              http_response=200, domains=['twitter.com'])
+        self.assertEqual(
+            ['foo', 'q', 'bing', 200, 'not found', 0], output.row(d))
+
+
+class ProcessLinkTests(unittest.TestCase):
+    def setUp(self):
+        self.downloader = mock.Mock()
+        self.downloader.GetException = Exception
+        self.downloader.TooLarge = type(str('TooLarge'), (Exception,), {})
+        self.downloader.NotHtml = Downloader.NotHtml
+        self.downloader.TransientError = Downloader.TransientError
+        self.downloader.HostDown = Downloader.HostDown
+        self.parser = mock.Mock(domains=['twitter.com', 'facebook.com'])
+        self.parser.find_a_nodes.return_value = [
+            (None, 'twitter.com', True),
+        ]
+        self.cache = mock.Mock()
+        self.processor = processor.Processor(
+            None, self.downloader, self.parser, None, cache=self.cache)
+        self.processor.log_a = mock.Mock()
+
+    def test_not_modified(self):
+        entry = mock.Mock(status_code=200, results={
+            'twitter.com': ['follow', 3],
+            'facebook.com': ['not found', 0],
+        })
+        self.cache.lookup.return_value = entry
+        self.downloader.fetch.return_value = Response(304, '')
+        data = self.processor._process_link({'url': 'http://x.com/'})
+        self.assertEqual('follow', data.statuses[0])
+        self.assertEqual(3, data.counts[0])
+        self.assertEqual(200, data['http_response'])
+        self.downloader.fetch.assert_called_once_with(
+            'http://x.com/', entry.conditional_headers.return_value, None)
+        self.cache.hit.assert_called_once_with(entry)
+        self.parser.find_a_nodes.assert_not_called()
+
+    def test_too_large(self):
+        self.cache.lookup.return_value = None
+        self.downloader.fetch.side_effect = self.downloader.TooLarge()
+        data = self.processor._process_link({'url': 'http://x.com/'})
+        self.assertEqual('Too large', data.statuses[0])
+        self.assertEqual('Too large', data.statuses[1])
+        self.cache.store.assert_not_called()
+
+    def test_not_html(self):
+        self.cache.lookup.return_value = None
+        self.downloader.fetch.side_effect = self.downloader.NotHtml(
+            200, 'application/pdf')
+        data = self.processor._process_link({'url': 'http://x.com/a.pdf'})
+        self.assertEqual('Not HTML', data.statuses[0])
+        self.assertEqual(200, data['http_response'])
+        self.cache.store.assert_not_called()
+
+    def test_retry(self):
+        self.cache.lookup.return_value = None
+        self.processor.max_attempts = 3
+        self.downloader.fetch.side_effect = Downloader.TransientError(
+            'HTTP 503', retry_after=10)
+        link = {'url': 'http://x.com/'}
+        with self.assertRaises(Retry) as cm:
+            self.processor._process_link(link)
+        self.assertEqual(10, cm.exception.delay)
+        with self.assertRaises(Retry) as cm:
+            self.processor._process_link(link)
+        self.assertEqual(10, cm.exception.delay)
+        data = self.processor._process_link(link)
+        self.assertEqual('Fail', data.statuses[0])
+        self.assertEqual(3, data['attempts'])
+
+    def test_host_down(self):
+        self.cache.lookup.return_value = None
+        self.processor.max_attempts = 3
+        self.downloader.fetch.side_effect = Downloader.HostDown()
+        data = self.processor._process_link({'url': 'http://x.com/'})
+        self.assertEqual('Host down', data.statuses[0])
+        self.assertEqual(1, data['attempts'])
+
+    def test_retry_delay(self):
+        self.processor.retry_backoff = 2
+        self.assertEqual(2, self.processor.retry_delay(1))
+        self.assertEqual(8, self.processor.retry_delay(3))
+        self.assertEqual(30, self.processor.retry_delay(1, retry_after=30))
+        self.assertEqual(300, self.processor.retry_delay(1, 3600))
+
+    def test_modified(self):
+        self.cache.lookup.return_value = None
+        response = Response(200, '<html></html>')
+        self.downloader.fetch.return_value = response
+        data = self.processor._process_link({'url': 'http://x.com/'})
+        self.assertEqual('nofollow', data.statuses[0])
+        self.assertEqual(1, data.counts[0])
+        self.downloader.fetch.assert_called_once_with(
+            'http://x.com/', None, None)
+        self.cache.store.assert_called_once_with('http://x.com/', response, {
+            'twitter.com': ['nofollow', 1],
+            'facebook.com': ['not found', 0],
+        })
+
+    def test_stream(self):
+        self.cache.lookup.return_value = None
+        self.processor.stream = True
+        self.downloader.max_body_size = 0
+
+        def fetch(url, headers, sink):
+            sink.start(None)
+            sink.write(b'<a href="//twitter.com/" rel="nofollow">t</a>')
+            return Response(200, sink.getvalue(), size=sink.size)
+
+        self.parser._match_href.side_effect = lambda href: ('twitter.com',)
+        self.parser._is_nofollow.return_value = True
+        self.downloader.fetch.side_effect = fetch
+        data = self.processor._process_link({'url': 'http://x.com/'})
+        self.assertEqual('nofollow', data.statuses[0])
+        self.assertEqual(1, data.counts[0])
+        self.parser.find_a_nodes.assert_not_called()
+
+    def test_parse_pool(self):
+        self.cache.lookup.return_value = None
+        self.processor.parse_pool = mock.Mock()
+        self.processor.parse_pool.parse.return_value = [
+            ('facebook.com', 3, False)]
+        self.downloader.fetch.return_value = Response(200, '<html></html>')
+        data = self.processor._process_link({'url': 'http://x.com/'})
+        self.assertEqual('not found', data.statuses[0])
+        self.assertEqual('follow', data.statuses[1])
+        self.assertEqual(3, data.counts[1])
+        self.parser.find_a_nodes.assert_not_called()
+
+    def test_parse_pool_timed_out(self):
+        self.cache.lookup.return_value = None
+        self.processor.parse_pool = mock.Mock(TimedOut=ParsePool.TimedOut)
+        self.processor.parse_pool.parse.side_effect = ParsePool.TimedOut()
+        self.downloader.fetch.return_value = Response(200, '<html></html>')
+        data = self.processor._process_link({'url': 'http://x.com/'})
+        self.assertEqual(['Fail', 'Fail'], data.statuses)
+        self.cache.store.assert_not_called()
+
+    def test_parse_memo(self):
+        self.cache.lookup.return_value = None
+        self.parser.match_all = False
+        self.processor.parse_memo = ParseMemo(self.parser)
+        self.parser.find_a_nodes.return_value = [
+            (None, 'twitter.com', True),
+            (None, 'facebook.com', True),
+            (None, 'twitter.com', False),
+        ]
+        self.downloader.fetch.return_value = Response(200, '<html></html>')
+        first = self.processor._process_link({'url': 'http://x.com/?a=1'})
+        second = self.processor._process_link({'url': 'http://x.com/?a=2'})
+        self.parser.find_a_nodes.assert_called_once()
+        self.assertEqual(first.statuses, second.statuses)
+        self.assertEqual(first.counts, second.counts)
+        self.assertEqual(['follow', 'nofollow'], second.statuses)
+        self.assertEqual([2, 1], second.counts)
+
+    def test_dedupe(self):
+        self.cache.lookup.return_value = None
+        self.processor.result_index = ResultIndex()
+        self.downloader.fetch.return_value = Response(200, '<html></html>')
+        first = self.processor._process_link({'url': 'http://x.com/'})
+        second = self.processor._process_link(
+            {'url': 'http://X.com?utm_source=y', 'row': 7})
+        self.downloader.fetch.assert_called_once()
+        self.assertEqual('http://X.com?utm_source=y', second['url'])
+        self.assertEqual(7, second['row'])
+        self.assertEqual(first.statuses, second.statuses)
+        self.assertEqual(first.counts, second.counts)
+
+    def test_dedupe_pending(self):
+        self.processor.result_index = ResultIndex()
+        self.processor.result_index.claim('http://x.com/')
+        with self.assertRaises(Retry):
+            self.processor._process_link({'url': 'http://x.com'})
+        self.downloader.fetch.assert_not_called()
+
+    def test_dedupe_retry(self):
+        self.cache.lookup.return_value = None
+        self.processor.result_index = ResultIndex()
+        self.processor.max_attempts = 2
+        self.downloader.fetch.side_effect = Downloader.TransientError('503')
+        with self.assertRaises(Retry):
+            self.processor._process_link({'url': 'http://x.com/'})
+        self.assertIsNone(
+            self.processor.result_index.claim('http://x.com/'))
+
+    def test_parse_threads(self):
+        self.cache.lookup.return_value = None
+        self.processor.concurrency = 3
+        self.processor.parse_threads = 2
+        self.processor.input_csv = mock.Mock()
+        self.processor.input_csv.links.return_value = [
+            {'url': 'http://x.com/{}'.format(i)} for i in range(20)]
+        self.processor.output_csv = mock.Mock()
+        self.downloader.fetch.return_value = Response(200, '<html></html>')
+        with mock.patch.object(self.processor, '_parse',
+                               wraps=self.processor._parse) as p_parse:
+            self.processor.process()
+        self.assertEqual(20, p_parse.call_count)
+        written = [call[0][0] for call in
+                   self.processor.output_csv.write.call_args_list]
+        self.assertEqual(
+            ['http://x.com/{}'.format(i) for i in range(20)],
+            [url_data['url'] for url_data in written])
+        self.assertEqual(['nofollow', 'not found'], written[-1].statuses)
+
+    def test_existence_only(self):
+        self.cache.lookup.return_value = None
+        self.processor.existence_only = True
+
+        def find_a_nodes(html, charset):
+            yield None, 'twitter.com', True
+            yield None, 'twitter.com', False
+            yield None, 'facebook.com', False
+            raise AssertionError('read on after all domains were followed')
+        self.parser.find_a_nodes.side_effect = find_a_nodes
+        self.downloader.fetch.return_value = Response(200, '<html></html>')
+        data = self.processor._process_link({'url': 'http://x.com/'})
+        self.assertEqual('follow', data.statuses[0])
+        self.assertEqual(2, data.counts[0])
+        self.assertEqual('follow', data.statuses[1])
+        self.cache.store.assert_not_called()
+
+    def test_log_a_only_when_logged(self):
+        self.cache.lookup.return_value = None
+        self.downloader.fetch.return_value = Response(200, '<html></html>')
+        with mock.patch.object(processor.log, 'isEnabledFor') as p_enabled:
+            p_enabled.return_value = False
+            self.processor._process_link({'url': 'http://x.com/'})
+            self.processor.log_a.assert_not_called()
+            p_enabled.return_value = True
+            self.processor._process_link({'url': 'http://x.com/'})
+            self.processor.log_a.assert_called_once_with('http://x.com/', None)
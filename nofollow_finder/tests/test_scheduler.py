@@ -0,0 +1,170 @@
+#  coding=utf-8
+import threading
+import time
+import unittest
+
+from mock import mock
+
+from nofollow_finder import scheduler
+from nofollow_finder.workers import WorkerPool
+
+
+def links(*urls):
+    return [{'url': url} for url in urls]
+
+
+class RobotsCacheTests(unittest.TestCase):
+
+    def test_parse_crawl_delay(self):
+        robots_txt = '\n'.join([
+            'User-agent: Googlebot',
+            'Crawl-delay: 1',
+            '',
+            'User-agent: Bingbot',
+            'User-agent: *  # everyone else',
+            'Disallow: /private',
+            'Crawl-delay: 2.5',
+        ])
+        self.assertEqual(
+            2.5, scheduler.RobotsCache.parse_crawl_delay(robots_txt))
+
+    def test_parse_no_crawl_delay(self):
+        robots_txt = 'User-agent: Googlebot\nCrawl-delay: 1\n'
+        self.assertEqual(
+            0, scheduler.RobotsCache.parse_crawl_delay(robots_txt))
+
+    def test_fetched_once_per_host(self):
+        downloader = mock.Mock()
+        downloader.get_any.return_value = (
+            200, 'User-agent: *\nCrawl-delay: 3\n')
+        robots = scheduler.RobotsCache(downloader)
+        self.assertEqual(3, robots.crawl_delay('http://example.com/a'))
+        self.assertEqual(3, robots.crawl_delay('http://example.com/b'))
+        downloader.get_any.assert_called_once_with(
+            'http://example.com/robots.txt')
+
+    def test_missing(self):
+        downloader = mock.Mock()
+        downloader.get_any.return_value = (404, 'Crawl-delay: 3')
+        robots = scheduler.RobotsCache(downloader)
+        self.assertEqual(0, robots.crawl_delay('http://example.com/a'))
+
+
+class HostSchedulerTests(unittest.TestCase):
+
+    def test_interleaves_hosts(self):
+        feed = scheduler.HostScheduler(links(
+            'http://a.com/1', 'http://a.com/2', 'http://a.com/3',
+            'http://b.com/1', 'http://b.com/2',
+        ), window=10, host_concurrency=1)
+        order = [feed.get()[1]['url'] for _ in range(2)]
+        self.assertEqual(['http://a.com/1', 'http://b.com/1'], order)
+
+    def test_host_concurrency(self):
+        lock = threading.Lock()
+        active = {}
+        peak = {}
+
+        def func(link):
+            host = scheduler.host_of(link['url'])
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(0.002)
+            with lock:
+                active[host] -= 1
+            return link['url']
+
+        urls = ['http://{}.com/{}'.format(host, i)
+                for i in range(20) for host in 'abc']
+        feed = scheduler.HostScheduler(
+            links(*urls), window=30, host_concurrency=2)
+        result = list(WorkerPool(func, workers=10).map(feed))
+        self.assertEqual(urls, result)
+        self.assertEqual({'a.com': 2, 'b.com': 2, 'c.com': 2}, peak)
+
+    def test_host_rate(self):
+        feed = scheduler.HostScheduler(links(
+            'http://a.com/1', 'http://a.com/2', 'http://b.com/1',
+        ), window=10, host_rate=20)
+        start = time.time()
+        urls = [link['url'] for link in WorkerPool(
+            lambda link: link, workers=1, ordered=False).map(feed)]
+        self.assertEqual(
+            ['http://a.com/1', 'http://b.com/1', 'http://a.com/2'], urls)
+        self.assertGreaterEqual(time.time() - start, 0.05)
+
+    def test_crawl_delay(self):
+        robots = mock.Mock()
+        robots.crawl_delay.return_value = 0.05
+        feed = scheduler.HostScheduler(links(
+            'http://a.com/1', 'http://a.com/2',
+        ), window=10, robots=robots)
+        start = time.time()
+        list(WorkerPool(lambda link: link, workers=1).map(feed))
+        self.assertGreaterEqual(time.time() - start, 0.05)
+        robots.crawl_delay.assert_called_once_with('http://a.com/1')
+
+    def test_retry(self):
+        feed = scheduler.HostScheduler(links(
+            'http://a.com/1', 'http://b.com/1',
+        ), window=10)
+        index, link = feed.get()
+        feed.done(link)
+        feed.retry(index, link, 0.05)
+        self.assertEqual('http://b.com/1', feed.get()[1]['url'])
+        start = time.time()
+        self.assertEqual((index, link), feed.get())
+        self.assertGreaterEqual(time.time() - start, 0.04)
+        with self.assertRaises(StopIteration):
+            feed.get()
+
+    def test_lookahead_interleaves_clustered_input(self):
+        lock = threading.Lock()
+        active = [0]
+        peak = [0]
+
+        def func(link):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.005)
+            with lock:
+                active[0] -= 1
+            return link['url']
+
+        # sorted by host, as input lists often are
+        urls = ['http://{}.com/{}'.format(host, i)
+                for host in 'abcd' for i in range(100)]
+        feed = scheduler.HostScheduler(
+            links(*urls), window=80, host_concurrency=2, lookahead=2000)
+        result = list(WorkerPool(func, workers=20, ordered=False).map(feed))
+        self.assertEqual(sorted(urls), sorted(result))
+        self.assertEqual(8, peak[0])
+
+    def test_lookahead_window_bounds_handed_out(self):
+        feed = scheduler.HostScheduler(links(
+            'http://a.com/1', 'http://a.com/2', 'http://b.com/1',
+        ), window=1, lookahead=10)
+        index, link = feed.get()
+        feed.done(link)
+        # the other links are read ahead, but wait for a free slot
+        self.assertEqual(2, feed._queued)
+        waiter = threading.Thread(target=feed.get)
+        waiter.start()
+        waiter.join(0.05)
+        self.assertTrue(waiter.is_alive())
+        feed.release()
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+
+    def test_many_hosts(self):
+        urls = ['http://h{}.com/{}'.format(i % 5000, i) for i in range(10000)]
+        feed = scheduler.HostScheduler(
+            links(*urls), window=80, host_concurrency=2, lookahead=5000)
+        start = time.time()
+        result = list(WorkerPool(
+            lambda link: link['url'], workers=1, ordered=False).map(feed))
+        self.assertEqual(urls, result)
+        # picking a host does not go through all of them
+        self.assertLess(time.time() - start, 5)
@@ -0,0 +1,80 @@
+#  coding=utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import mock
+
+from nofollow_finder.shards import ShardInput, merge_shards, shard_of
+
+
+class ShardTests(unittest.TestCase):
+    def test_shard_of(self):
+        self.assertEqual(
+            shard_of('http://x.com/a', 4), shard_of('https://X.COM./b?c', 4))
+        shards = {shard_of('http://{}.com/'.format(i), 4) for i in range(50)}
+        self.assertEqual({0, 1, 2, 3}, shards)
+
+    def test_shard_input(self):
+        input_csv = mock.Mock()
+        input_csv.links.side_effect = lambda: (
+            {'url': 'http://{}.com/'.format(i)} for i in range(20))
+        rows = []
+        for index in range(3):
+            for link in ShardInput(input_csv, index, 3).links():
+                self.assertEqual(index, shard_of(link['url'], 3))
+                rows.append(link['row'])
+        self.assertEqual(range(20), sorted(rows))
+
+
+class MergeShardsTests(unittest.TestCase):
+    header = b'URL,HTTP response code,x.com,x.com count,input row\r\n'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.tmp_dir, 'out.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as fh:
+            fh.write(content)
+        return path
+
+    def read_output(self):
+        with open(self.out_file, 'rb') as fh:
+            return fh.read()
+
+    def test_merge(self):
+        paths = [
+            self.write('1.csv', self.header +
+                       b'http://a/,200,follow,1,0\r\n'
+                       b'http://c/,200,not found,0,2\r\n'),
+            self.write('2.csv', self.header +
+                       b'http://b/,0,Fail,0,1\r\n'
+                       b'http://d/,200,"no,follow",1,3\r\n'),
+            self.write('3.csv', self.header),
+        ]
+        merge_shards(paths, self.out_file)
+        self.assertEqual(
+            b'URL,HTTP response code,x.com,x.com count\r\n'
+            b'http://a/,200,follow,1\r\n'
+            b'http://b/,0,Fail,0\r\n'
+            b'http://c/,200,not found,0\r\n'
+            b'http://d/,200,"no,follow",1\r\n',
+            self.read_output())
+
+    def test_not_in_order(self):
+        path = self.write('1.csv', self.header +
+                          b'http://c/,200,not found,0,2\r\n'
+                          b'http://a/,200,follow,1,0\r\n')
+        with self.assertRaisesRegexp(ValueError, 'line 3'):
+            merge_shards([path], self.out_file)
+
+    def test_not_a_shard(self):
+        path = self.write('1.csv', b'URL,HTTP response code\r\n')
+        with self.assertRaisesRegexp(ValueError, 'no "input row" column'):
+            merge_shards([path], self.out_file)
@@ -0,0 +1,114 @@
+#  coding=utf-8
+import unittest
+
+from nofollow_finder import benchmark, parser
+from nofollow_finder.body import BodyTooLarge
+from nofollow_finder.stream import LinkStream
+
+
+class LinkStreamTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = parser.Parser(['twitter.com', 'facebook.com'])
+
+    def find(self, html, charset=None, chunk_size=7):
+        stream = LinkStream(self.parser)
+        stream.start(charset)
+        for i in range(0, len(html), chunk_size):
+            stream.write(html[i:i + chunk_size])
+        self.assertEqual(b'', stream.getvalue())
+        return [
+            (a_node.text, domain, nofollow)
+            for a_node, domain, nofollow in stream.find_a_nodes()
+        ]
+
+    def test_domains(self):
+        html = (
+            b'<html><body>'
+            b'<a href="https://twitter.com/x" rel="nofollow">t</a>'
+            b'<p><a href="//www.facebook.com/">f</a></p>'
+            b'<a href="https://example.com/">e</a>'
+            b'<a href="https://a.b.c.twitter.com/">too deep</a>'
+            b'</body></html>'
+        )
+        self.assertEqual([
+            ('t', 'twitter.com', True),
+            ('f', 'facebook.com', False),
+        ], self.find(html))
+
+    def test_zero_a_nodes(self):
+        with self.assertRaises(self.parser.ZeroANodes):
+            self.find(b'<html><body>nothing</body></html>')
+
+    def test_empty(self):
+        self.assertEqual([], self.find(b''))
+
+    def test_truncated(self):
+        html = b'<html><body><a href="//twitter.com/">t</a><div><p>'
+        self.assertEqual([('t', 'twitter.com', False)], self.find(html))
+
+    def test_declared_charset(self):
+        html = u'<a href="https://twitter.com/">ž</a>'.encode('cp1250')
+        self.assertEqual(
+            [(u'ž', 'twitter.com', False)],
+            self.find(html, 'windows-1250'))
+
+    def test_meta_charset(self):
+        html = (
+            u'<html><head><meta charset="utf-8"></head><body>'
+            u'<a href="https://twitter.com/">ž</a></body></html>'
+        ).encode('utf-8')
+        self.assertEqual(
+            [(u'ž', 'twitter.com', False)], self.find(html))
+
+    def test_unknown_charset(self):
+        html = b'<a href="https://twitter.com/">t</a>'
+        self.assertEqual(
+            [('t', 'twitter.com', False)], self.find(html, 'no-such-charset'))
+
+    def test_stop_when_followed(self):
+        stream = LinkStream(self.parser, stop_when_followed=True)
+        stream.write(b'<a href="//twitter.com/">t</a>')
+        stream.write(b'<a href="//facebook.com/" rel="nofollow">f</a>')
+        self.assertFalse(stream.complete)
+        with self.assertRaises(StopIteration):
+            stream.write(b'<a href="//facebook.com/">f</a><p>')
+        self.assertTrue(stream.complete)
+        self.assertEqual(3, len(stream.links))
+
+    def test_no_nodes(self):
+        stream = LinkStream(self.parser, keep_nodes=False)
+        stream.write(b'<a href="//twitter.com/" rel="nofollow">t</a>')
+        stream.getvalue()
+        self.assertEqual(
+            [(None, 'twitter.com', True)], list(stream.find_a_nodes()))
+
+    def test_too_large(self):
+        stream = LinkStream(self.parser, max_size=10)
+        stream.write(b'<html>')
+        with self.assertRaises(BodyTooLarge):
+            stream.write(b'<body>')
+
+    def test_tree_is_dropped(self):
+        stream = LinkStream(self.parser)
+        sizes = []
+
+        def a_node(element):
+            body = element.getparent().getparent().getparent()
+            sizes.append(len(body))
+        stream._a_node = a_node
+        stream.write(b'<html><body>')
+        for _ in range(1000):
+            stream.write(b'<div><p>text <a href="/x">x</a></p></div>')
+        self.assertEqual(1000, len(sizes))
+        # earlier DIVs are gone by the time the next A is read
+        self.assertLessEqual(max(sizes), 2)
+
+    def test_same_as_parser(self):
+        corpus = benchmark.make_corpus(pages=3, links=100)
+        for page in corpus:
+            expected = [
+                (a_node.text, domain, nofollow)
+                for a_node, domain, nofollow
+                in self.parser.find_a_nodes(page, 'utf-8')
+            ]
+            self.assertEqual(expected, self.find(page, 'utf-8', 1000))
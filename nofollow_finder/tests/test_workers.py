@@ -0,0 +1,177 @@
+#  coding=utf-8
+import random
+import threading
+import time
+import unittest
+
+from nofollow_finder import workers
+
+
+def slow_square(n):
+    time.sleep(random.random() / 100)
+    return n * n
+
+
+class WorkerPoolTests(unittest.TestCase):
+
+    def test_inline(self):
+        pool = workers.WorkerPool(slow_square, workers=1)
+        result = list(pool.map(workers.Feed(range(10), window=1)))
+        self.assertEqual([n * n for n in range(10)], result)
+
+    def test_threaded_ordered(self):
+        pool = workers.WorkerPool(slow_square, workers=8)
+        result = list(pool.map(workers.Feed(range(100), window=16)))
+        self.assertEqual([n * n for n in range(100)], result)
+
+    def test_threaded_unordered(self):
+        pool = workers.WorkerPool(slow_square, workers=8, ordered=False)
+        result = list(pool.map(workers.Feed(range(100), window=16)))
+        self.assertEqual(sorted(n * n for n in range(100)), sorted(result))
+
+    def test_empty(self):
+        pool = workers.WorkerPool(slow_square, workers=4)
+        self.assertEqual([], list(pool.map(workers.Feed([], window=4))))
+
+    def test_window_bounds_in_flight(self):
+        lock = threading.Lock()
+        state = {'current': 0, 'max': 0}
+
+        def func(n):
+            with lock:
+                state['current'] += 1
+                state['max'] = max(state['max'], state['current'])
+            time.sleep(0.001)
+            return n
+
+        pool = workers.WorkerPool(func, workers=10)
+        for _ in pool.map(workers.Feed(range(50), window=3)):
+            with lock:
+                state['current'] -= 1
+        self.assertLessEqual(state['max'], 3)
+
+    def test_error(self):
+        def func(n):
+            if n == 5:
+                raise ValueError('five')
+            return n
+
+        pool = workers.WorkerPool(func, workers=4)
+        with self.assertRaises(ValueError):
+            list(pool.map(workers.Feed(range(10), window=8)))
+
+    def test_retry(self):
+        attempts = {}
+
+        def func(n):
+            attempts[n] = attempts.get(n, 0) + 1
+            if n % 3 == 0 and attempts[n] < 3:
+                raise workers.Retry(0.01)
+            return n, attempts[n]
+
+        for count in (1, 4):
+            attempts.clear()
+            pool = workers.WorkerPool(func, workers=count)
+            result = list(pool.map(workers.Feed(range(10), window=4)))
+            self.assertEqual(
+                [(n, 3 if n % 3 == 0 else 1) for n in range(10)], result)
+
+    def test_retry_does_not_block_others(self):
+        seen = []
+
+        def func(n):
+            seen.append(n)
+            if n == 0 and seen.count(0) == 1:
+                raise workers.Retry(0.05)
+            return n
+
+        pool = workers.WorkerPool(func, workers=1, ordered=False)
+        result = list(pool.map(workers.Feed(range(3), window=3)))
+        self.assertEqual([1, 2, 0], result)
+        self.assertEqual([0, 1, 2, 0], seen)
+
+    def test_retry_does_not_block_ordered(self):
+        seen = []
+
+        def func(n):
+            seen.append(n)
+            if n == 0 and seen.count(0) == 1:
+                raise workers.Retry(0.2)
+            time.sleep(0.0001)
+            return n
+
+        for count in (1, 8):
+            del seen[:]
+            pool = workers.WorkerPool(func, workers=count)
+            feed = workers.Feed(range(200), window=4, retry_window=1000)
+            self.assertEqual(range(200), list(pool.map(feed)))
+            # all the others were done while the retry waited
+            self.assertEqual(0, seen[-1])
+            self.assertEqual(201, len(seen))
+
+
+class StagedPoolTests(unittest.TestCase):
+
+    def test_ordered(self):
+        pool = workers.StagedPool([(slow_square, 4), (str, 2)])
+        result = list(pool.map(workers.Feed(range(100), window=16)))
+        self.assertEqual([str(n * n) for n in range(100)], result)
+
+    def test_unordered_three_stages(self):
+        pool = workers.StagedPool(
+            [(slow_square, 4), (slow_square, 3), (str, 1)], ordered=False)
+        result = list(pool.map(workers.Feed(range(50), window=16)))
+        self.assertEqual(
+            sorted(str(n ** 4) for n in range(50)), sorted(result))
+
+    def test_empty(self):
+        pool = workers.StagedPool([(slow_square, 4), (str, 2)])
+        self.assertEqual([], list(pool.map(workers.Feed([], window=4))))
+
+    def test_backpressure(self):
+        started = []
+        release = threading.Event()
+
+        def first(n):
+            started.append(n)
+            return n
+
+        def second(n):
+            release.wait()
+            return n
+
+        pool = workers.StagedPool(
+            [(first, 4), (second, 1)], ordered=False, queue_size=2)
+        result = pool.map(workers.Feed(range(100), window=100))
+        thread = threading.Thread(target=list, args=(result,))
+        thread.daemon = True
+        thread.start()
+        time.sleep(0.2)
+        # 1 being parsed, 2 in the queue, 4 waiting to be queued
+        self.assertLessEqual(len(started), 7)
+        release.set()
+        thread.join(5)
+        self.assertEqual(100, len(started))
+
+    def test_error_in_later_stage(self):
+        def func(n):
+            if n == 25:
+                raise ValueError('twenty-five')
+            return n
+
+        pool = workers.StagedPool([(slow_square, 4), (func, 2)])
+        with self.assertRaises(ValueError):
+            list(pool.map(workers.Feed(range(10), window=8)))
+
+    def test_retry(self):
+        attempts = {}
+
+        def func(n):
+            attempts[n] = attempts.get(n, 0) + 1
+            if n % 3 == 0 and attempts[n] < 2:
+                raise workers.Retry(0.01)
+            return n
+
+        pool = workers.StagedPool([(func, 4), (slow_square, 2)])
+        result = list(pool.map(workers.Feed(range(10), window=4)))
+        self.assertEqual([n * n for n in range(10)], result)
@@ -0,0 +1,342 @@
+# coding=utf-8
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+
+import heapq
+import logging
+import sys
+import threading
+import time
+
+if sys.version_info[0] < 3:
+    import Queue as queue
+else:
+    import queue
+
+
+log = logging.getLogger(__name__)
+
+
+class Retry(Exception):
+    """
+    Raised by a WorkerPool function to have its item processed again,
+    no sooner than `delay` seconds from now.
+    """
+
+    def __init__(self, delay=0):
+        super(Retry, self).__init__(delay)
+        self.delay = delay
+
+
+class Feed(object):
+    """
+    Thread-safe source of work items for WorkerPool.
+
+    Items are numbered in the order they are read so that results can be
+    put back in input order. At most `window` items can be taken and not
+    yet released, which bounds both the work in flight and the reorder
+    buffer.
+
+    Items given back with `retry()` are handed out again once their delay
+    is over. Until then, workers go on with the following items, and up
+    to `retry_window` more items can be taken, so that ordered output is
+    not held up by a retry that has to wait.
+    """
+
+    def __init__(self, items, window, retry_window=0):
+        self._items = enumerate(items)
+        self._window = window
+        self._retry_window = retry_window
+        self._taken = 0
+        self._exhausted = False
+        self._retries = []  # heap of (due time, index, item)
+        self._cond = threading.Condition(threading.Lock())
+
+    def get(self):
+        """Next `(index, item)` pair, raises StopIteration when exhausted."""
+        with self._cond:
+            while True:
+                now = time.time()
+                retry = self._pop_retry(now)
+                if retry is not None:
+                    return retry
+                item = self._next_item()
+                if item is not None:
+                    return item
+                if self._exhausted and not self._retries:
+                    raise StopIteration()
+                self._cond.wait(self._wait_time(now))
+
+    def done(self, item):
+        """Called by a worker once it has finished with `item`."""
+
+    def retry(self, index, item, delay):
+        """Put `item` back, to be handed out again after `delay` seconds."""
+        with self._cond:
+            heapq.heappush(self._retries, (time.time() + delay, index, item))
+            self._cond.notify_all()
+
+    def release(self):
+        """Called once a result has been handed over to the consumer."""
+        with self._cond:
+            self._taken -= 1
+            self._cond.notify_all()
+
+    def _next_item(self):
+        # call with self._cond held; None when the window is full or
+        # there are no more items
+        if self._taken >= self._slots():
+            return None
+        item = self._read_item()
+        if item is not None:
+            self._taken += 1
+        return item
+
+    def _slots(self):
+        # items that can be taken and not yet released
+        if self._retries:
+            return self._window + self._retry_window
+        return self._window
+
+    def _read_item(self):
+        # next `(index, item)` pair of the input, whatever the window
+        if self._exhausted:
+            return None
+        try:
+            return next(self._items)
+        except StopIteration:
+            self._exhausted = True
+            return None
+
+    def _pop_retry(self, now):
+        if self._retries and self._retries[0][0] <= now:
+            due, index, item = heapq.heappop(self._retries)
+            return index, item
+        return None
+
+    def _wait_time(self, now):
+        waits = [self._retries[0][0] - now] if self._retries else []
+        # a timeout also keeps Ctrl+C working on Python 2
+        return max(min(waits + [1]), 0)
+
+
+class WorkerPool(object):
+    """
+    Maps `func` over the items of a Feed using `workers` threads.
+
+    With a single worker everything runs in the calling thread. `func`
+    can raise Retry to have its item processed again later.
+    """
+    _DONE = object()
+    _ERROR = object()
+
+    def __init__(self, func, workers=1, ordered=True):
+        self.func = func
+        self.workers = workers
+        self.ordered = ordered
+
+    def map(self, feed):
+        if self.workers < 2:
+            return self._map_inline(feed)
+        return self._map_threaded(feed)
+
+    def _map_inline(self, feed):
+        # results only come out of order when items are retried
+        buffered = {}
+        expected = 0
+        while True:
+            try:
+                index, item = feed.get()
+            except StopIteration:
+                return
+            try:
+                result = self.func(item)
+            except Retry as e:
+                feed.done(item)
+                feed.retry(index, item, e.delay)
+                continue
+            feed.done(item)
+            if not self.ordered:
+                yield result
+                feed.release()
+                continue
+            buffered[index] = result
+            while expected in buffered:
+                yield buffered.pop(expected)
+                expected += 1
+                feed.release()
+
+    def _map_threaded(self, feed):
+        results = queue.Queue()
+        stop = threading.Event()
+        running = self._start_threads(feed, results, stop)
+        buffered = {}
+        expected = 0
+        try:
+            while running:
+                index, result = self._next(results)
+                if index is self._DONE:
+                    running -= 1
+                elif index is self._ERROR:
+                    log.error('worker failed', exc_info=result)
+                    raise result[1]
+                elif not self.ordered:
+                    yield result
+                    feed.release()
+                else:
+                    buffered[index] = result
+                    while expected in buffered:
+                        yield buffered.pop(expected)
+                        expected += 1
+                        feed.release()
+        finally:
+            stop.set()
+
+    def _start_threads(self, feed, results, stop):
+        """Starts the threads, returns how many of them put _DONE."""
+        for _ in range(self.workers):
+            self._start_thread(self._work, feed, results, stop)
+        return self.workers
+
+    @staticmethod
+    def _start_thread(target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def _work(self, feed, results, stop):
+        try:
+            while not stop.is_set():
+                try:
+                    index, item = feed.get()
+                except StopIteration:
+                    break
+                try:
+                    result = self.func(item)
+                except Retry as e:
+                    feed.done(item)
+                    feed.retry(index, item, e.delay)
+                    continue
+                feed.done(item)
+                results.put((index, result))
+        except Exception:
+            results.put((self._ERROR, sys.exc_info()))
+        finally:
+            results.put((self._DONE, None))
+
+    @staticmethod
+    def _next(results):
+        # waiting with a timeout keeps Ctrl+C working on Python 2
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                pass
+
+
+class StagedPool(WorkerPool):
+    """
+    WorkerPool where the work on every item is done in stages, each one
+    by threads of its own: `stages` is a list of `(func, workers)`, and
+    what the func of a stage returns is the item of the next one. Only
+    the first stage can raise Retry.
+
+    Stages are joined by queues of `queue_size` items per worker of the
+    next stage. When a stage is slower than the one before it, the queue
+    fills up and the threads of the earlier stage wait, so items do not
+    pile up between stages. The Feed window still bounds the items taken
+    and not yet consumed.
+    """
+
+    def __init__(self, stages, ordered=True, queue_size=2):
+        super(StagedPool, self).__init__(
+            stages[0][0], stages[0][1], ordered)
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def map(self, feed):
+        return self._map_threaded(feed)
+
+    def _start_threads(self, feed, results, stop):
+        queues = [
+            queue.Queue(self.queue_size * workers)
+            for _, workers in self.stages[1:]
+        ] + [results]
+        # threads still running in every stage but the last one
+        self._running = [workers for _, workers in self.stages[:-1]]
+        self._lock = threading.Lock()
+        for _ in range(self.workers):
+            self._start_thread(
+                self._work_first, feed, queues[0], results, stop)
+        for stage, (func, workers) in enumerate(self.stages[1:], start=1):
+            for _ in range(workers):
+                self._start_thread(
+                    self._work_stage, stage, func, queues[stage - 1],
+                    queues[stage], results, stop)
+        return self.stages[-1][1]
+
+    def _work_first(self, feed, out, results, stop):
+        try:
+            while not stop.is_set():
+                try:
+                    index, item = feed.get()
+                except StopIteration:
+                    break
+                try:
+                    result = self.func(item)
+                except Retry as e:
+                    feed.done(item)
+                    feed.retry(index, item, e.delay)
+                    continue
+                feed.done(item)
+                self._put(out, (index, result), stop)
+        except Exception:
+            results.put((self._ERROR, sys.exc_info()))
+        finally:
+            self._stage_done(0, out, stop)
+
+    def _work_stage(self, stage, func, in_, out, results, stop):
+        try:
+            while not stop.is_set():
+                index, item = self._get(in_, stop)
+                if index is self._DONE:
+                    break
+                self._put(out, (index, func(item)), stop)
+        except Exception:
+            results.put((self._ERROR, sys.exc_info()))
+        finally:
+            if out is results:
+                results.put((self._DONE, None))
+            else:
+                self._stage_done(stage, out, stop)
+
+    def _stage_done(self, stage, out, stop):
+        # the last thread of a stage tells every thread of the next one
+        with self._lock:
+            self._running[stage] -= 1
+            last = not self._running[stage]
+        if last:
+            for _ in range(self.stages[stage + 1][1]):
+                self._put(out, (self._DONE, None), stop)
+
+    @staticmethod
+    def _put(queue_, item, stop):
+        # waiting with a timeout lets the threads stop when the map does
+        while not stop.is_set():
+            try:
+                return queue_.put(item, timeout=1)
+            except queue.Full:
+                pass
+
+    @staticmethod
+    def _get(queue_, stop):
+        while not stop.is_set():
+            try:
+                return queue_.get(timeout=1)
+            except queue.Empty:
+                pass
+        return StagedPool._DONE, None
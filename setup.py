@@ -41,5 +41,8 @@ setup(
         'dev': [
             'mock>=2.0.0,<3',
         ],
+        'brotli': [
+            'brotli>=1.0.7',
+        ],
     },
 )